@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+import multiprocessing
+from datetime import datetime
+
+os.environ.setdefault('TQDM_DISABLE', '1')
+import numpy as np
+import pandas as pd
+from utils.synthetic_data import SyntheticMarket
+from utils.child_strats import SimpleSMAStrategy, StoneWellStrategy
+from utils.tuning_utils import strat_tuner
+
+'''
+Backtest benchmarks on synthetic candles, one fresh process per case so peak RSS is per case.
+  python benchmark_backtests.py                          10k/100k/1M candles, results json named after the commit
+                                                         (run_test steps ~1k candles/s, the 1M cases take a while)
+  python benchmark_backtests.py --sizes 10000 --only sma  quick run of the cases containing "sma"
+  python benchmark_backtests.py --compare old.json        print wall time ratios against an earlier run
+  python benchmark_backtests.py --only startup            cold import times and the fast_start.py skip path
+'''
+
+# strategies log every open/close at info, tuning_utils already configured the root logger on import
+logging.getLogger().setLevel(logging.WARNING)
+
+BENCH_SIZES = [10_000, 100_000, 1_000_000]
+BENCH_EXECUTIONS = 20_000
+BENCH_FOLDER = './data/benchmarks'
+BENCH_SEED = 7
+
+BASE_STRAT_KWARGS = dict(tlt_dollar=1000, commission_pct=0.001, max_open_orders_per_symbol=1, max_open_orders_total=3)
+SMA_PARAMS = dict(profit_threshold=0.03, stoploss_threshold=-0.02, max_high_retrace=0.01, price_sma_window=50)
+STONEWELL_PARAMS = dict(profit_threshold=1, stoploss_threshold=-0.03, max_high_retrace=0.05,
+                        rsi_window=14, rsi_window_2=50, rsi_sma_window=50, price_sma_window=200,
+                        short_sma_window=20, long_sma_window=100, volume_short_sma_window=7,
+                        volume_long_sma_window=28, atr_window=10, kc_sma_window=20, kc_mult=2)
+# cold imports of the cron scripts' dependencies, each in a fresh interpreter
+IMPORT_MODULES = ['pandas', 'binance.client', 'utils.trading_utils', 'utils.pairs_trading', 'utils.strat_utils']
+TUNER_GRID = {'profit_threshold': [0.03], 'stoploss_threshold': [-0.02, -0.04],
+              'max_high_retrace': [0.02], 'price_sma_window': [20, 50]}
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024  # bytes on macos, kB on linux
+
+
+def synthetic_candles(n_bars, interval='5m', seed=BENCH_SEED):
+    market = SyntheticMarket(n_bars, interval, seed=seed)
+    df = market.candles(market.single_close(0), np.random.default_rng(seed))
+    df['symbol'] = 'SYN0000'
+    return df
+
+
+def make_strategy(strat_class, params, trade_df, indi_df):
+    return strat_class(trade_candles_df=trade_df, indicator_candles_df=indi_df, executions_df=pd.DataFrame(),
+                       open_orders_df=pd.DataFrame(), extra_indicator_candles_df=None,
+                       **BASE_STRAT_KWARGS, **params)
+
+
+def case_run_test(strat_class, params, n_bars):
+    candles = synthetic_candles(n_bars)
+    ts = make_strategy(strat_class, params, candles.copy(), candles.copy())
+    start = time.perf_counter()
+    ts.run_test()
+    return time.perf_counter() - start, n_bars, {'executions': len(ts.executions_df)}
+
+
+def case_merge(n_bars):
+    '''hourly trade candles with daily indicators, the date_day merge path of run_test'''
+    hourly = synthetic_candles(n_bars, '1h')
+    daily = hourly.set_index('date').resample('1D').agg(
+        {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum', 'symbol': 'first'}).reset_index()
+    ts = make_strategy(StoneWellStrategy, STONEWELL_PARAMS, hourly, daily)
+    start = time.perf_counter()
+    ts.merge_indicators()
+    return time.perf_counter() - start, n_bars, {'daily_bars': len(daily)}
+
+
+def synthetic_executions(n_executions, seed=BENCH_SEED):
+    '''alternating open/close round trips, a quarter of them short'''
+    rng = np.random.default_rng(seed)
+    n_trips = n_executions // 2
+    open_time = pd.Timestamp('2021-01-01') + pd.to_timedelta(np.arange(n_trips) * 6, unit='h')
+    close_time = open_time + pd.to_timedelta(rng.integers(1, 6, n_trips), unit='h')
+    is_short = rng.random(n_trips) < 0.25
+    open_price = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_trips)))
+    close_price = open_price * np.exp(rng.normal(0, 0.02, n_trips))
+    quantity = 1000 / open_price
+    opens = pd.DataFrame({'execution_time': open_time, 'action': np.where(is_short, 'SHORT_SELL', 'BUY'),
+                          'symbol': 'SYN0000', 'tlt_dollar': 1000.0, 'price': open_price, 'quantity': quantity})
+    closes = pd.DataFrame({'execution_time': close_time, 'action': np.where(is_short, 'SHORT_CLOSE', 'SELL'),
+                           'symbol': 'SYN0000', 'tlt_dollar': close_price * quantity, 'price': close_price,
+                           'quantity': quantity})
+    return pd.concat([opens, closes]).sort_values('execution_time', kind='stable').reset_index(drop=True)
+
+
+def case_trading_summary(n_executions):
+    ts = make_strategy(SimpleSMAStrategy, SMA_PARAMS, None, None)
+    executions = synthetic_executions(n_executions)
+    start = time.perf_counter()
+    ts.trading_summary(executions)
+    return time.perf_counter() - start, n_executions, {}
+
+
+class SyntheticTuner(strat_tuner):
+    '''strat_tuner reading synthetic candles instead of the db'''
+
+    def _get_data(self, symbol, timeframe):
+        interval = {'1hour': '1h', '4hours': '4h', '5mins': '5m'}.get(timeframe, '1d')
+        n_bars = int((self.end_date - self.start_date) / pd.Timedelta(interval)) + 1
+        market = SyntheticMarket(n_bars, interval, start=self.start_date, seed=BENCH_SEED)
+        df = market.candles(market.single_close(0), np.random.default_rng(BENCH_SEED))
+        df['symbol'] = symbol
+        return df
+
+
+def case_tuner_grid():
+    tuner = SyntheticTuner('2021-01-01', '2021-04-01', ['SYN0000'], SimpleSMAStrategy, TUNER_GRID,
+                           trade_df_timeframe='1hour', indi_df_timeframe='1hour')
+    start = time.perf_counter()
+    tuner.multi_symbols_param_tuning()
+    elapsed = time.perf_counter() - start
+    n_combos = int(np.prod([len(values) for values in TUNER_GRID.values()]))
+    return elapsed, n_combos * int((tuner.end_date - tuner.start_date) / pd.Timedelta(hours=1)), {'combos': n_combos}
+
+
+def _timed_python(code, env=None):
+    '''wall time of a fresh interpreter running code and its slowest imports two levels deep (python -X importtime)'''
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    slowest = {}
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package, indented two spaces per nesting level
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit() and not parts[2].startswith('    '):
+            slowest[parts[2].strip()] = int(parts[1]) / 1e6
+    slowest = dict(sorted(slowest.items(), key=lambda item: -item[1])[:5])
+    return elapsed, {'slowest_imports_s': {name: round(value, 4) for name, value in slowest.items()}}
+
+
+def case_import(module):
+    elapsed, extra = _timed_python(f'import {module}')
+    return elapsed, 1, extra
+
+
+def case_fast_start_skip():
+    '''python fast_start.py closer against a positions.db without open positions, the closer's usual tick'''
+    from utils.position_store import PositionStore
+    with tempfile.TemporaryDirectory() as data_folder:
+        PositionStore(os.path.join(data_folder, 'positions.db')).close()
+        env = {**os.environ, 'BOT_DATA_FOLDER': data_folder}
+        elapsed, extra = _timed_python('import sys, runpy; sys.argv = ["fast_start.py", "closer"]; '
+                                       'runpy.run_path("fast_start.py", run_name="__main__")', env=env)
+    return elapsed, 1, extra
+
+
+def bench_cases(sizes, n_executions):
+    cases = {}
+    for n_bars in sizes:
+        cases[f'run_test_sma_{n_bars}'] = (case_run_test, (SimpleSMAStrategy, SMA_PARAMS, n_bars))
+        cases[f'run_test_stonewell_{n_bars}'] = (case_run_test, (StoneWellStrategy, STONEWELL_PARAMS, n_bars))
+        cases[f'merge_1h_trade_1d_indi_{n_bars}'] = (case_merge, (n_bars,))
+    cases[f'trading_summary_{n_executions}'] = (case_trading_summary, (n_executions,))
+    cases['strat_tuner_grid'] = (case_tuner_grid, ())
+    for module in IMPORT_MODULES:
+        cases[f'startup_import_{module}'] = (case_import, (module,))
+    cases['startup_fast_start_closer_skip'] = (case_fast_start_skip, ())
+    return cases
+
+
+def _run_case(func, args, queue):
+    start_rss = peak_rss_mb()
+    elapsed, n_items, extra = func(*args)
+    queue.put({'wall_s': round(elapsed, 4), 'items': n_items, 'items_per_s': round(n_items / elapsed, 1),
+               'start_rss_mb': round(start_rss, 1), 'peak_rss_mb': round(peak_rss_mb(), 1), **extra})
+
+
+def run_case(name, func, args):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_case, args=(func, args, queue))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        return {'name': name, 'error': f'exit code {process.exitcode}'}
+    return {'name': name, **queue.get()}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except Exception:
+        return 'unknown'
+
+
+def compare(results, baseline_file):
+    with open(baseline_file) as file:
+        baseline = {r['name']: r for r in json.load(file)['results']}
+    for result in results:
+        old = baseline.get(result['name'])
+        if old and 'wall_s' in old and 'wall_s' in result:
+            print(f"{result['name']:40s} {old['wall_s']:10.3f}s -> {result['wall_s']:10.3f}s "
+                  f"({result['wall_s'] / old['wall_s']:.2f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='backtest benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=BENCH_SIZES, help='candles per run_test case')
+    parser.add_argument('--executions', type=int, default=BENCH_EXECUTIONS)
+    parser.add_argument('--only', help='only cases whose name contains this')
+    parser.add_argument('--out', help='results json, default ./data/benchmarks/bench_<commit>.json')
+    parser.add_argument('--compare', help='earlier results json to compare against')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = []
+    for name, (func, case_args) in bench_cases(args.sizes, args.executions).items():
+        if args.only and args.only not in name:
+            continue
+        result = run_case(name, func, case_args)
+        print(json.dumps(result))
+        results.append(result)
+
+    out_file = args.out or os.path.join(BENCH_FOLDER, f'bench_{commit}.json')
+    os.makedirs(os.path.dirname(out_file) or '.', exist_ok=True)
+    with open(out_file, 'w') as file:
+        json.dump({'commit': commit, 'timestamp': datetime.now().isoformat(timespec='seconds'),
+                   'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                   'machine': platform.machine(), 'results': results}, file, indent=2)
+    print(f"Saved {len(results)} results to {out_file}")
+
+    if args.compare:
+        compare(results, args.compare)
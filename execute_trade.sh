@@ -10,10 +10,10 @@ current_date=$(date +"%Y-%m-%d")
 # echo -e "--------------------------------------\n---- $(date) ----" >> /home/ec2-user/closer.log 2>&1
 # /home/ec2-user/binance_pair_trader/venv/bin/python3 /home/ec2-user/binance_pair_trader/closer.py >> /home/ec2-user/closer.log 2>&1
 
-# Log and run opener.py
+# Log and run opener.py, fast_start.py skips it when the candidate query returns no pair
 echo -e "--------------------------------------\n---- $(date) ----" >> /home/ec2-user/logs/opener_$current_date.log 2>&1
-/home/ec2-user/binance_pair_trader/venv/bin/python3 /home/ec2-user/binance_pair_trader/opener.py >> /home/ec2-user/logs/opener_$current_date.log 2>&1
+/home/ec2-user/binance_pair_trader/venv/bin/python3 /home/ec2-user/binance_pair_trader/fast_start.py opener >> /home/ec2-user/logs/opener_$current_date.log 2>&1
 
-# Log and run closer.py
+# Log and run closer.py, fast_start.py skips it without open positions
 echo -e "--------------------------------------\n---- $(date) ----" >> /home/ec2-user/logs/closer_$current_date.log 2>&1
-/home/ec2-user/binance_pair_trader/venv/bin/python3 /home/ec2-user/binance_pair_trader/closer.py >> /home/ec2-user/logs/closer_$current_date.log 2>&1
\ No newline at end of file
+/home/ec2-user/binance_pair_trader/venv/bin/python3 /home/ec2-user/binance_pair_trader/fast_start.py closer >> /home/ec2-user/logs/closer_$current_date.log 2>&1
\ No newline at end of file
@@ -0,0 +1,39 @@
+import os
+import logging
+import argparse
+from utils.order_journal import OrderJournal
+from utils.position_store import PositionStore
+from utils.bot_settings import BOT_DATA_FOLDER, position_db_file, order_csv_file, strat_journal_folder
+
+'''
+Csv exports of the production state, which lives in journals and the position store rather than csv.
+  python export_state.py stonewell       stonewell_order_df.csv, _exec_df.csv and _ideal_exec_df.csv in BOT_DATA_FOLDER
+                                         from BOT_DATA_FOLDER/journal/stonewell.*
+  python export_state.py --pairs         order_df.csv of the pairs bot from positions.db
+Fails while a run of the same strategy holds its journal, try again after the tick.
+'''
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='export production state to csv')
+    parser.add_argument('strategies', nargs='*', help='strategy journal names, e.g. stonewell')
+    parser.add_argument('--pairs', action='store_true', help='export the pairs bot positions')
+    parser.add_argument('--journal-folder', default=strat_journal_folder)
+    parser.add_argument('--out', default=BOT_DATA_FOLDER)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    for name in args.strategies:
+        journal = OrderJournal(args.journal_folder, name)
+        try:
+            journal.export_csvs(os.path.join(args.out, f'{name}_order_df.csv'),
+                                os.path.join(args.out, f'{name}_exec_df.csv'),
+                                os.path.join(args.out, f'{name}_ideal_exec_df.csv'))
+        finally:
+            journal.close()
+
+    if args.pairs:
+        positions = PositionStore(position_db_file)
+        out_file = os.path.join(args.out, os.path.basename(order_csv_file))
+        positions.export_orders_csv(out_file)
+        positions.close()
+        logging.info(f"Exported pairs positions to {out_file}")
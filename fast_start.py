@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import runpy
+import sqlite3
+import logging
+import argparse
+from utils.bot_settings import position_db_file, metrics_folder
+from utils.candidate_pairs import CANDIDATES_EXIST_QUERY
+from utils.metrics import BotMetrics
+
+'''
+Cron entry point for opener.py/closer.py that checks for work before importing pandas and python-binance
+and building a Client, which is most of the time a tick with nothing to do spends.
+  python fast_start.py closer   exits unless positions.db has an OPEN position
+  python fast_start.py opener   exits unless the opener's candidate query (coint, r squared, potential win) has a pair
+Otherwise the script runs as with python <script>.py. A skipped run still records an ok tick to data/metrics.
+'''
+
+SCRIPT_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+
+def has_open_positions():
+    '''None when positions.db cannot tell, e.g. before the closer first imported order_df.csv into it'''
+    if not os.path.exists(position_db_file):
+        return None
+    conn = sqlite3.connect(f'file:{position_db_file}?mode=ro', uri=True)
+    try:
+        return conn.execute("SELECT 1 FROM positions WHERE status = 'OPEN' LIMIT 1").fetchone() is not None
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+def has_candidates():
+    '''whether the opener's candidate query returns any pair, None when the db cannot be reached'''
+    from dotenv import load_dotenv
+    import psycopg2
+    load_dotenv()
+    try:
+        conn = psycopg2.connect(host=os.getenv('RDS_ENDPOINT'), database=os.getenv('RDS_DB_NAME'),
+                                user=os.getenv('RDS_USERNAME'), password=os.getenv('RDS_PASSWORD'))
+    except psycopg2.OperationalError as e:
+        logging.warning(f"Could not check coin_signal, running the opener anyway: {e}")
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute(CANDIDATES_EXIST_QUERY)
+        return cursor.fetchone() is not None
+    finally:
+        conn.close()
+
+
+CHECKS = {'opener': has_candidates, 'closer': has_open_positions}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='run opener/closer only when there is work')
+    parser.add_argument('script', choices=list(CHECKS))
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    has_work = CHECKS[args.script]()
+    elapsed = time.perf_counter() - start
+    if has_work is False:
+        # same metrics file and tick name as the script itself
+        metrics = BotMetrics(args.script, out_dir=metrics_folder)
+        with metrics.tick():
+            metrics.observe('stage_seconds', elapsed, stage='fast start check')
+            metrics.inc('fast_start_skips_total')
+        print(f'nothing to do for {args.script} ({elapsed * 1000:.0f}ms check). exit')
+        sys.exit()
+
+    script_path = os.path.join(SCRIPT_FOLDER, f'{args.script}.py')
+    sys.argv = [script_path]
+    runpy.run_path(script_path, run_name='__main__')
@@ -0,0 +1,25 @@
+from dotenv import load_dotenv
+from api_utils import *
+from db_utils import *
+from coint_utils import *
+
+'''nightly coin_signal refresh: rolling ols + engle granger of every pair in coin_historical_price'''
+
+load_dotenv(override=True)
+
+if __name__ == '__main__':
+    db = coin_signal_db_refresher("coin_signal")
+    db.connect_to_db()
+    db.create_table()
+
+    close_df = load_daily_close(db.conn, 'coin_historical_price', COINT_LOOKBACK_DAYS)
+    volume_df = load_daily_volume(db.conn, VOLUME_TABLE, LIQUIDITY_LOOKBACK_DAYS)
+
+    # only pairs surviving the history, liquidity (when there is volume) and correlation prefilter are tested
+    pairs = pair_prefilter(close_df, volume_df).run()
+    calculator = coint_signal_calculator(close_df, pairs)
+    calculator.run()
+    signal_file = calculator.save(COINT_CSV_PATH, SIGNAL_CSV_PATH)
+
+    db.insert_data(signal_file)
+    db.close()
@@ -0,0 +1,301 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from api_utils import COINT_CSV_PATH, SIGNAL_CSV_PATH
+
+# rolling windows, in daily candles
+COINT_LOOKBACK_DAYS = 800
+COINT_WINDOW = 120           # same 120d history the opener builds its bands from
+COINT_STEP = 5               # a window ending every 5 days
+MIN_WINDOW_OBS = 100         # windows with fewer shared candles are not tested
+MOST_RECENT_WINDOWS = 6      # windows ending in the last ~30 days
+RECENT_WINDOWS = 36          # windows ending in the last ~180 days
+# engle granger 5% critical value, 2 variables with constant (MacKinnon asymptotic)
+EG_CRITICAL_VALUE = -3.34
+
+PAIRS_PER_TASK = 2000
+
+SIGNAL_COLUMNS = ['symbol1', 'symbol2', 'ols_coeff', 'ols_constant', 'r_squared',
+                  'most_recent_coint_pct', 'recent_coint_pct', 'hist_coint_pct']
+# NOT NULL in coin_signal, a constant or too short leg leaves them NaN or inf
+REQUIRED_SIGNAL_COLUMNS = ['ols_coeff', 'ols_constant', 'r_squared']
+
+
+# prefilter
+CORR_LOOKBACK_DAYS = 180
+MIN_HISTORY_DAYS = 170       # candles a symbol needs inside the correlation lookback
+LIQUIDITY_LOOKBACK_DAYS = 30
+# coin_historical_price (coin gecko) has no volume, the binance daily candles of the same symbols do
+VOLUME_TABLE = 'binance_coin_historical_price'
+MIN_MEDIAN_QUOTE_VOLUME = 1000000  # median daily close * volume, in USDT
+MIN_RETURN_CORR = 0.5
+TOP_K_PARTNERS = 30
+
+
+def load_daily_close(conn, table_name='coin_historical_price', lookback_days=COINT_LOOKBACK_DAYS, column='close'):
+    '''date x symbol close prices (or another candle column) of the last lookback_days, NaN where a symbol has no candle'''
+    query = f"""
+    select symbol, date, {column}
+    from {table_name}
+    where date >= now() - interval '{int(lookback_days)} days'
+    """
+    df = pd.read_sql(query, conn)
+    df[column] = df[column].astype(float)
+    return df.pivot(index='date', columns='symbol', values=column).sort_index()
+
+
+def load_daily_volume(conn, table_name=VOLUME_TABLE, lookback_days=LIQUIDITY_LOOKBACK_DAYS):
+    '''date x symbol daily volume for the liquidity prefilter, None when the table cannot be read'''
+    try:
+        volume_df = load_daily_close(conn, table_name, lookback_days, column='volume')
+    except Exception as e:
+        conn.rollback()  # the failed query aborted the transaction
+        logging.warning(f"No volume from {table_name}, skipping the liquidity filter: {e}")
+        return None
+    if volume_df.empty:
+        logging.warning(f"{table_name} has no candles in the last {lookback_days} days, skipping the liquidity filter")
+        return None
+    return volume_df
+
+
+def batched_ols(Y, X):
+    '''
+    y = constant + coeff * x for every column of the T x P matrices at once.
+    Rows where either side is NaN are left out of that column's fit.
+    Returns coeff, constant, r_squared, residuals (NaN on skipped rows) and the number of rows used.
+    '''
+    mask = ~(np.isnan(Y) | np.isnan(X))
+    n = mask.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_y = np.where(mask, Y, 0.0).sum(axis=0) / n
+        mean_x = np.where(mask, X, 0.0).sum(axis=0) / n
+        dy = np.where(mask, Y - mean_y, 0.0)
+        dx = np.where(mask, X - mean_x, 0.0)
+        sxx = (dx * dx).sum(axis=0)
+        sxy = (dx * dy).sum(axis=0)
+        syy = (dy * dy).sum(axis=0)
+        coeff = sxy / sxx
+        constant = mean_y - coeff * mean_x
+        r_squared = sxy * sxy / (sxx * syy)
+    residuals = np.where(mask, dy - coeff * dx, np.nan)
+    return coeff, constant, r_squared, residuals, n
+
+
+def engle_granger_tstat(residuals):
+    '''dickey fuller t stat of each column of the ols residuals, diff(e) = gamma * lag(e), no lags'''
+    lagged = residuals[:-1]
+    diff = residuals[1:] - lagged
+    mask = ~np.isnan(diff)
+    lagged = np.where(mask, lagged, 0.0)
+    diff = np.where(mask, diff, 0.0)
+    n = mask.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sll = (lagged * lagged).sum(axis=0)
+        gamma = (lagged * diff).sum(axis=0) / sll
+        resid_var = (((diff - gamma * lagged) ** 2) * mask).sum(axis=0) / (n - 1)
+        return gamma / np.sqrt(resid_var / sll)
+
+
+def window_ends(num_rows, window=COINT_WINDOW, step=COINT_STEP):
+    '''end rows (exclusive) of the rolling windows, oldest first, the last one ending on the latest candle'''
+    return np.arange(num_rows, window - 1, -step)[::-1]
+
+
+def rolling_coint(close, y_idx, x_idx, window=COINT_WINDOW, step=COINT_STEP,
+                  min_obs=MIN_WINDOW_OBS, critical_value=EG_CRITICAL_VALUE):
+    '''
+    Rolling OLS and engle granger test of a batch of pairs, one set of matrix ops per window.
+    close: T x N matrix, y_idx/x_idx: column of each pair's legs.
+    Returns the latest window's fit and the per window cointegration flags (windows x pairs, NaN if untested).
+    '''
+    Y_all = close[:, y_idx]
+    X_all = close[:, x_idx]
+    ends = window_ends(len(close), window, step)
+    coint_flags = np.full((len(ends), len(y_idx)), np.nan)
+    coeff = constant = r_squared = tstat = np.full(len(y_idx), np.nan)
+    for w, end in enumerate(ends):
+        coeff, constant, r_squared, residuals, n = batched_ols(Y_all[end - window:end], X_all[end - window:end])
+        tstat = engle_granger_tstat(residuals)
+        tested = (n >= min_obs) & np.isfinite(tstat)
+        coint_flags[w] = np.where(tested, tstat < critical_value, np.nan)
+    return {'ols_coeff': coeff, 'ols_constant': constant, 'r_squared': r_squared,
+            'eg_tstat': tstat, 'coint_flags': coint_flags}
+
+
+def coint_pct(coint_flags, last_n=None):
+    '''share of tested windows that were cointegrated, over the last_n windows (all if None)'''
+    flags = coint_flags if last_n is None else coint_flags[-last_n:]
+    tested = (~np.isnan(flags)).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.nansum(flags, axis=0) / tested
+
+
+_worker_close = None
+
+
+def _init_worker(close):
+    global _worker_close
+    _worker_close = close
+
+
+def _coint_task(args):
+    y_idx, x_idx, window, step = args
+    result = rolling_coint(_worker_close, y_idx, x_idx, window, step)
+    flags = result.pop('coint_flags')
+    result['most_recent_coint_pct'] = coint_pct(flags, MOST_RECENT_WINDOWS)
+    result['recent_coint_pct'] = coint_pct(flags, RECENT_WINDOWS)
+    result['hist_coint_pct'] = coint_pct(flags)
+    result['num_windows'] = (~np.isnan(flags)).sum(axis=0)
+    return result
+
+
+class coint_signal_calculator:
+    '''
+    coin_signal for every candidate pair from a date x symbol close frame.
+    Pairs are split into batches of PAIRS_PER_TASK, each batch is one set of matrix ops per window
+    and batches run across a process pool. symbol1 is regressed on symbol2.
+    '''
+
+    def __init__(self, close_df, pairs=None, window=COINT_WINDOW, step=COINT_STEP, max_workers=None):
+        self.close_df = close_df
+        self.symbols = list(close_df.columns)
+        self.window = window
+        self.step = step
+        self.max_workers = max_workers or os.cpu_count()
+        if pairs is None:
+            pairs = [(self.symbols[i], self.symbols[j])
+                     for i in range(len(self.symbols)) for j in range(i + 1, len(self.symbols))]
+        self.pairs = list(pairs)
+        self.result_df = None
+
+    def _tasks(self):
+        column = {symbol: i for i, symbol in enumerate(self.symbols)}
+        y_idx = np.array([column[symbol1] for symbol1, _ in self.pairs], dtype=np.int64)
+        x_idx = np.array([column[symbol2] for _, symbol2 in self.pairs], dtype=np.int64)
+        for start in range(0, len(self.pairs), PAIRS_PER_TASK):
+            yield (y_idx[start:start + PAIRS_PER_TASK], x_idx[start:start + PAIRS_PER_TASK],
+                   self.window, self.step)
+
+    def run(self):
+        close = self.close_df.to_numpy(dtype=np.float64)
+        start_time = datetime.now()
+        if self.max_workers > 1 and len(self.pairs) > PAIRS_PER_TASK:
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                     initargs=(close,)) as executor:
+                results = list(executor.map(_coint_task, self._tasks()))
+        else:
+            _init_worker(close)
+            results = [_coint_task(task) for task in self._tasks()]
+
+        result_df = pd.DataFrame(self.pairs, columns=['symbol1', 'symbol2'])
+        if results:
+            for column in results[0]:
+                result_df[column] = np.concatenate([result[column] for result in results])
+        self.result_df = result_df
+        logging.info(f"Rolling cointegration of {len(self.pairs)} pairs over {len(close)} days "
+                     f"took {(datetime.now() - start_time).total_seconds():.1f}s")
+        return result_df
+
+    def get_signal_df(self):
+        '''coin_signal rows, pairs that never had a testable window or without a finite latest fit are dropped'''
+        signal_df = self.result_df.dropna(subset=['hist_coint_pct'])
+        signal_df = signal_df[np.isfinite(signal_df[REQUIRED_SIGNAL_COLUMNS].to_numpy(dtype=np.float64)).all(axis=1)]
+        return signal_df[SIGNAL_COLUMNS].reset_index(drop=True)
+
+    def save(self, coint_csv_path=COINT_CSV_PATH, signal_csv_path=SIGNAL_CSV_PATH):
+        '''full results (t stat, window count) to COINT_CSV_PATH, coin_signal rows to SIGNAL_CSV_PATH'''
+        today = datetime.now().strftime('%Y-%m-%d')
+        os.makedirs(coint_csv_path, exist_ok=True)
+        os.makedirs(signal_csv_path, exist_ok=True)
+        coint_file = f'{coint_csv_path}/rolling_coint_{today}.csv'
+        signal_file = f'{signal_csv_path}/coin_signal_{today}.csv'
+        self.result_df.to_csv(coint_file, index=False)
+        self.get_signal_df().to_csv(signal_file, index=False)
+        logging.info(f"Saved {coint_file} and {signal_file}")
+        return signal_file
+
+
+class pair_prefilter:
+    '''
+    Prune the N^2 pair universe before any cointegration test.
+    Steps: minimum history, minimum median quote volume, then a log return correlation matrix (one matmul)
+    keeping each symbol's top_k most correlated partners above min_corr.
+    report holds the symbol/pair count left after each step.
+    '''
+
+    def __init__(self, close_df, volume_df=None, corr_lookback_days=CORR_LOOKBACK_DAYS,
+                 min_history_days=MIN_HISTORY_DAYS, liquidity_lookback_days=LIQUIDITY_LOOKBACK_DAYS,
+                 min_quote_volume=MIN_MEDIAN_QUOTE_VOLUME, min_corr=MIN_RETURN_CORR, top_k=TOP_K_PARTNERS):
+        self.close_df = close_df
+        self.volume_df = volume_df
+        self.corr_lookback_days = corr_lookback_days
+        self.min_history_days = min_history_days
+        self.liquidity_lookback_days = liquidity_lookback_days
+        self.min_quote_volume = min_quote_volume
+        self.min_corr = min_corr
+        self.top_k = top_k
+        self.report = []
+
+    def _record(self, step, num_symbols, num_pairs):
+        pruned = self.report[-1]['pairs'] - num_pairs if self.report else 0
+        self.report.append({'step': step, 'symbols': num_symbols, 'pairs': num_pairs, 'pruned': pruned})
+        logging.info(f"Prefilter {step}: {num_symbols} symbols, {num_pairs} pairs ({pruned} pruned)")
+
+    def _history_filter(self, symbols):
+        recent = self.close_df[symbols].iloc[-self.corr_lookback_days:]
+        return [s for s in symbols if recent[s].notna().sum() >= min(self.min_history_days, len(recent))]
+
+    def _liquidity_filter(self, symbols):
+        if self.volume_df is None:
+            return symbols
+        window = -self.liquidity_lookback_days
+        volume = self.volume_df.reindex(index=self.close_df.index, columns=symbols).iloc[window:]
+        if volume.isna().all().all():
+            logging.warning("No volume on the close dates of the liquidity window, skipping the liquidity filter")
+            return symbols
+        quote_volume = self.close_df[symbols].iloc[window:] * volume
+        median_volume = quote_volume.median()
+        return [s for s in symbols if median_volume[s] >= self.min_quote_volume]
+
+    def return_corr(self, symbols):
+        '''correlation matrix of daily log returns, missing returns count as 0 after demeaning'''
+        log_close = np.log(self.close_df[symbols].iloc[-(self.corr_lookback_days + 1):].to_numpy(dtype=np.float64))
+        returns = np.diff(log_close, axis=0)
+        returns = returns - np.nanmean(returns, axis=0)
+        returns = np.nan_to_num(returns, nan=0.0)
+        norms = np.sqrt((returns * returns).sum(axis=0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = returns / norms
+        returns = np.nan_to_num(returns, nan=0.0)
+        return returns.T @ returns
+
+    def _top_partners(self, corr):
+        '''i < j index pairs where j is among i's top_k partners or i among j's, above min_corr'''
+        corr = corr.copy()
+        np.fill_diagonal(corr, -np.inf)
+        corr[corr < self.min_corr] = -np.inf
+        k = min(self.top_k, len(corr) - 1)
+        keep = np.zeros(corr.shape, dtype=bool)
+        if k > 0:
+            top = np.argpartition(-corr, k - 1, axis=1)[:, :k]
+            rows = np.repeat(np.arange(len(corr)), k)
+            keep[rows, top.ravel()] = True
+        keep &= np.isfinite(corr)
+        keep |= keep.T
+        return np.argwhere(np.triu(keep, k=1))
+
+    def run(self):
+        '''surviving (symbol1, symbol2) pairs, symbol1 before symbol2 in column order'''
+        self.report = []
+        symbols = list(self.close_df.columns)
+        self._record('universe', len(symbols), len(symbols) * (len(symbols) - 1) // 2)
+        symbols = self._history_filter(symbols)
+        self._record('min history', len(symbols), len(symbols) * (len(symbols) - 1) // 2)
+        symbols = self._liquidity_filter(symbols)
+        self._record('liquidity', len(symbols), len(symbols) * (len(symbols) - 1) // 2)
+        pairs = [(symbols[i], symbols[j]) for i, j in self._top_partners(self.return_corr(symbols))]
+        self._record(f'top {self.top_k} correlated', len({s for pair in pairs for s in pair}), len(pairs))
+        return pairs
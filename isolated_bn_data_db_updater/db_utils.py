@@ -64,7 +64,7 @@ class db_refresher(ABC):
     '''object that 1) connect to db 2) transform and insert json data depends on source.
        template for coin_gecko_db and avan_stock_db'''
     def __init__(self, table_name):
-        self. DB_NAME = os.getenv('RDS_DB_NAME')
+        self.db_name = os.getenv('RDS_DB_NAME')
         self.db_host = os.getenv('RDS_ENDPOINT')
         self.db_username = os.getenv('RDS_USERNAME')
         self.db_password = os.getenv('RDS_PASSWORD')
@@ -501,4 +501,68 @@ class backtest_performances_db_refresher(backtest_trades_db_refresher):
             return outputs
         except Exception as e:
             logging.debug(f"Data transformation failed for {file_path}: {e}")
-            return None
\ No newline at end of file
+            return None
+
+
+class coin_signal_db_refresher(db_refresher):
+    '''replace coin_signal with the latest rolling cointegration results from coint_utils'''
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.table_creation_script = f"""
+        CREATE TABLE IF NOT EXISTS {self.table_name} (
+            symbol1 VARCHAR(20) NOT NULL,
+            symbol2 VARCHAR(20) NOT NULL,
+            ols_coeff NUMERIC NOT NULL,
+            ols_constant NUMERIC NOT NULL,
+            r_squared NUMERIC NOT NULL,
+            most_recent_coint_pct NUMERIC,
+            recent_coint_pct NUMERIC,
+            hist_coint_pct NUMERIC,
+            PRIMARY KEY (symbol1, symbol2)
+        );
+        """
+
+        self.data_insertion_script = f"""
+        INSERT INTO {self.table_name} (
+            symbol1, symbol2, ols_coeff, ols_constant, r_squared,
+            most_recent_coint_pct, recent_coint_pct, hist_coint_pct
+        )
+        VALUES %s
+        ON CONFLICT (symbol1, symbol2) DO UPDATE SET
+            ols_coeff = EXCLUDED.ols_coeff,
+            ols_constant = EXCLUDED.ols_constant,
+            r_squared = EXCLUDED.r_squared,
+            most_recent_coint_pct = EXCLUDED.most_recent_coint_pct,
+            recent_coint_pct = EXCLUDED.recent_coint_pct,
+            hist_coint_pct = EXCLUDED.hist_coint_pct;
+        """
+
+    def _data_transformation(self, file_path):
+        try:
+            # coint_utils.get_signal_df already dropped the pairs without a finite fit (REQUIRED_SIGNAL_COLUMNS)
+            df = pd.read_csv(file_path)
+            df = df.astype(object).where(df.notna(), None)
+            return [[row['symbol1'], row['symbol2'],
+                     row['ols_coeff'], row['ols_constant'], row['r_squared'],
+                     row['most_recent_coint_pct'], row['recent_coint_pct'], row['hist_coint_pct']]
+                    for row in df.to_dict('records')]
+        except Exception as e:
+            logging.error(f"Data transformation failed for {file_path}: {e}")
+            return None
+
+    def insert_data(self, file_path):
+        '''swap the whole table in one transaction so the opener never reads a half written signal'''
+        signal_data = self._data_transformation(file_path)
+        if not signal_data:
+            return
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"DELETE FROM {self.table_name};")
+            execute_values(cursor, self.data_insertion_script, signal_data, page_size=5000)
+            self.conn.commit()
+            logging.info(f"Replaced {self.table_name} with {len(signal_data)} pairs from {file_path}")
+        except Exception as e:
+            logging.error(f"Failed to insert data from {file_path}: {e}")
+            self.conn.rollback()
+        finally:
+            cursor.close()
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import logging
+import argparse
+import contextlib
+from datetime import datetime
+
+# every file the bot writes goes under the load test folder, never the live data folder
+LOAD_TEST_FOLDER = os.path.abspath(os.path.join('./data/load_test', datetime.now().strftime('%Y%m%d_%H%M%S')))
+os.environ['BOT_DATA_FOLDER'] = LOAD_TEST_FOLDER
+import numpy as np
+import pandas as pd
+from utils.trading_utils import candle_cache, metrics_folder, MINUTE_LOOKBACK_DAYS, DAILY_LOOKBACK_DAYS
+from utils.pairs_trading import PairsTradingContext, run_open_scan, run_close_checks
+from utils.exchange_simulator import SimulatedBinanceClient
+from utils.synthetic_data import SyntheticMarket
+from utils.metrics import BotMetrics
+
+'''
+Offline load test of the opener/closer path against a local exchange simulator.
+Synthetic cointegrated pairs stand in for coin_signal, the simulator replays their 2h candles and fills the
+orders, latest_trades inserts are discarded. Each tick runs the open scan and the close checks and then moves
+the simulated clock on by --step seconds.
+  python load_test_bot.py                               50 pairs, 12 ticks
+  python load_test_bot.py --pairs 500 --latency-ms 40   500 pairs with 40ms +- 15ms per request
+Results go to data/load_test/<time>/: load_test.json, metrics/*.prom and the bot's own prints in bot.log.
+'''
+
+LOAD_TEST_SEED = 7
+
+
+class DiscardingConnection:
+    '''stands in for the rds connection, the trade writer's latest_trades inserts are accepted and dropped'''
+    closed = False
+
+    def cursor(self):
+        return self
+
+    def execute(self, *args, **kwargs):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def build_simulator(args):
+    n_bars = (max(MINUTE_LOOKBACK_DAYS, DAILY_LOOKBACK_DAYS) + args.replay_days + 2) * 12
+    market = SyntheticMarket(n_bars, '2h', seed=args.seed)
+    candles = {f'{symbol}USDT': df for symbol, df in market.iter_symbol_frames(0, args.pairs, args.half_life)}
+    # replay starts replay_days before the end of the history, later bars appear as the clock moves
+    replay_start = market.dates()[-1] - pd.Timedelta(days=args.replay_days)
+    client = SimulatedBinanceClient(candles, replay_start=replay_start,
+                                    latency_ms=args.latency_ms, latency_jitter_ms=args.jitter_ms,
+                                    order_latency_ms=args.order_latency_ms, slippage_bps=args.slippage_bps,
+                                    seed=args.seed)
+    pairs = market.pairs_df(args.pairs, args.half_life)
+    candidates_df = pd.DataFrame({'symbol_a': pairs['symbol1'], 'symbol_b': pairs['symbol2'],
+                                  'ols_coeff': pairs['ols_coeff'], 'ols_constant': pairs['ols_constant']})
+    return client, candidates_df
+
+
+def percentiles(values):
+    values = np.asarray(values)
+    return {'mean': float(values.mean()), 'p50': float(np.percentile(values, 50)),
+            'p95': float(np.percentile(values, 95)), 'max': float(values.max())}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='offline load test of the pairs bot')
+    parser.add_argument('--pairs', type=int, default=50)
+    parser.add_argument('--ticks', type=int, default=12)
+    parser.add_argument('--step', type=float, default=7200, help='simulated seconds between ticks')
+    parser.add_argument('--replay-days', type=int, default=30)
+    parser.add_argument('--half-life', type=int, default=48, help='spread half life in 2h bars')
+    parser.add_argument('--latency-ms', type=float, default=30)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--order-latency-ms', type=float, default=20)
+    parser.add_argument('--slippage-bps', type=float, default=2)
+    parser.add_argument('--cron-interval', type=float, default=60, help='tick budget in seconds')
+    parser.add_argument('--seed', type=int, default=LOAD_TEST_SEED)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    os.makedirs(LOAD_TEST_FOLDER, exist_ok=True)
+    started = time.perf_counter()
+    client, candidates_df = build_simulator(args)
+    print(f"Simulating {len(client.bars)} symbols in {time.perf_counter() - started:.1f}s, results in {LOAD_TEST_FOLDER}")
+
+    # ticks are seconds apart in wall time but hours apart in simulated time, so never serve candles from memory
+    candle_cache.max_age_seconds = 0
+    metrics = BotMetrics('load_test', out_dir=metrics_folder, tick_interval=args.cron_interval)
+    ctx = PairsTradingContext(metrics.instrument_client(client), None,
+                              candidate_max_age=float('inf'), metrics=metrics)
+    ctx.conn = DiscardingConnection()
+    ctx.writer.connect = DiscardingConnection
+    ctx.candidates_df = candidates_df
+    ctx.candidates_time = datetime.now()
+
+    ticks = []
+    with open(os.path.join(LOAD_TEST_FOLDER, 'bot.log'), 'a') as log_file:
+        for tick in range(args.ticks):
+            calls_before = sum(client.calls.values())
+            orders_before = len(client.orders)
+            with contextlib.redirect_stdout(log_file):
+                tick_start = time.perf_counter()
+                with metrics.tick('open_scan'):
+                    run_open_scan(ctx)
+                open_s = time.perf_counter() - tick_start
+                with metrics.tick('close_checks'):
+                    run_close_checks(ctx)
+                tick_s = time.perf_counter() - tick_start
+            ticks.append({'tick': tick, 'open_scan_s': open_s, 'close_checks_s': tick_s - open_s, 'tick_s': tick_s,
+                          'api_calls': sum(client.calls.values()) - calls_before,
+                          'orders': len(client.orders) - orders_before,
+                          'open_positions': len(ctx.positions.open_positions())})
+            print(f"tick {tick}: {tick_s:.2f}s (open scan {open_s:.2f}s), {ticks[-1]['api_calls']} api calls, "
+                  f"{ticks[-1]['orders']} orders, {ticks[-1]['open_positions']} open positions")
+            client.advance(args.step)
+    ctx.close()
+
+    # the first tick fills the candle cache, later ticks only fetch the new bars
+    warm = ticks[1:] or ticks
+    results = {'args': vars(args), 'symbols': len(client.bars),
+               'cold_tick_s': ticks[0]['tick_s'],
+               'warm_tick_s': percentiles([t['tick_s'] for t in warm]),
+               'warm_open_scan_s': percentiles([t['open_scan_s'] for t in warm]),
+               'pairs_per_s': args.pairs / float(np.mean([t['open_scan_s'] for t in warm])),
+               'tick_budget_ratio': max(t['tick_s'] for t in warm) / args.cron_interval,
+               'api_calls': dict(client.calls), 'exchange': client.summary(), 'ticks': ticks}
+    with open(os.path.join(LOAD_TEST_FOLDER, 'load_test.json'), 'w') as file:
+        json.dump(results, file, indent=2, default=float)
+    print(f"cold tick {results['cold_tick_s']:.2f}s, warm tick p50 {results['warm_tick_s']['p50']:.2f}s "
+          f"p95 {results['warm_tick_s']['p95']:.2f}s, {results['pairs_per_s']:.0f} pairs/s, "
+          f"{results['exchange']['orders']} orders, worst tick {100 * results['tick_budget_ratio']:.0f}% of the cron interval")
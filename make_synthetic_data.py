@@ -0,0 +1,69 @@
+import os
+import logging
+import argparse
+from utils.synthetic_data import (SyntheticMarket, write_db_csv, copy_db_csv, write_kline_json,
+                                  write_candle_cache)
+
+'''
+Seeded synthetic candles for offline benchmarks and tests, no RDS or binance access needed.
+  python make_synthetic_data.py --bars 100000 --interval 5m --singles 200 --pairs 20
+      csv in the binance_coin_*_historical_price schema plus the true pair hedge ratios
+  python make_synthetic_data.py ... --load binance_coin_5mins_historical_price
+      also COPY it into that table of the db in .env (point it at a local postgres)
+  --kline-json / --candle-cache write the raw binance json the db refreshers read, or CandleCache files
+'''
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s | %(levelname)8s | %(message)s',
+    datefmt='%Y-%m-%d %H:%M'
+)
+
+SYNTH_DATA_FOLDER = '/home/ec2-user/binance_pair_trader/data/synthetic'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='synthetic OHLCV panels')
+    parser.add_argument('--bars', type=int, default=10000)
+    parser.add_argument('--interval', default='1h')
+    parser.add_argument('--start', default='2021-01-01')
+    parser.add_argument('--singles', type=int, default=50)
+    parser.add_argument('--pairs', type=int, default=10)
+    parser.add_argument('--half-life', type=float, default=48, help='pair spread half life in bars')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jumps', type=float, default=0.0, help='jumps per year per symbol')
+    parser.add_argument('--regimes', action='store_true', help='switch between calm and volatile regimes')
+    parser.add_argument('--out', default=SYNTH_DATA_FOLDER)
+    parser.add_argument('--load', metavar='TABLE', help='COPY the csv into this table')
+    parser.add_argument('--kline-json', action='store_true')
+    parser.add_argument('--candle-cache', action='store_true')
+    args = parser.parse_args()
+
+    regime_kwargs = {}
+    if args.regimes:
+        regime_kwargs = dict(regime_vol_mult=(0.6, 2.0), regime_drift=(0.3, -0.6),
+                             regime_switch_prob=1 / (30 * 24))
+    market = SyntheticMarket(args.bars, args.interval, args.start, args.seed,
+                             jump_intensity=args.jumps, **regime_kwargs)
+    os.makedirs(args.out, exist_ok=True)
+    name = f'synthetic_{args.interval}_{args.bars}_seed{args.seed}'
+
+    def symbol_frames():
+        return market.iter_symbol_frames(args.singles, args.pairs, half_life_bars=args.half_life)
+
+    csv_path = os.path.join(args.out, f'{name}.csv')
+    write_db_csv(symbol_frames(), csv_path)
+    market.pairs_df(args.pairs, half_life_bars=args.half_life).to_csv(
+        os.path.join(args.out, f'{name}_pairs.csv'), index=False)
+    if args.kline_json:
+        write_kline_json(symbol_frames(), os.path.join(args.out, 'binance_raw_json', args.interval))
+    if args.candle_cache:
+        write_candle_cache(symbol_frames(), os.path.join(args.out, 'candle_cache'), args.interval)
+
+    if args.load:
+        from isolated_bn_data_db_updater.db_utils import binance_OHLC_db_refresher
+        db = binance_OHLC_db_refresher(args.load)
+        db.connect_to_db()
+        db.create_table()
+        copy_db_csv(db.conn, args.load, csv_path)
+        db.close()
@@ -0,0 +1,75 @@
+import os
+import sys
+import logging
+from dotenv import load_dotenv
+import pandas as pd
+from binance.client import Client
+from utils.trading_utils import *
+from utils.position_store import load_position_store
+from utils.kline_stream import KlineStore, BinanceKlineDaemon, ReplayKlineFeed, KlineStoreServer
+
+'''
+Long running market data daemon.
+Keeps 2h and daily ring buffers for every monitored symbol current from binance websockets
+and serves them to opener/closer over a local socket (see utils.market_data.MarketDataSession).
+  python market_data_daemon.py           live websocket feed
+  python market_data_daemon.py --replay  replay the local candle cache instead, for offline testing
+'''
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s | %(levelname)8s | %(message)s',
+    datefmt='%Y-%m-%d %H:%M'
+)
+
+load_dotenv()
+api_key = os.getenv('BINANCE_API')
+api_secret = os.getenv('BINANCE_SECRET')
+DB_USERNAME = os.getenv('RDS_USERNAME')
+DB_PASSWORD = os.getenv('RDS_PASSWORD')
+DB_HOST = os.getenv('RDS_ENDPOINT')
+DB_NAME = os.getenv('RDS_DB_NAME')
+
+INTERVALS = [Client.KLINE_INTERVAL_2HOUR, Client.KLINE_INTERVAL_1DAY]
+LOOKBACK_DAYS = {Client.KLINE_INTERVAL_2HOUR: MINUTE_LOOKBACK_DAYS,
+                 Client.KLINE_INTERVAL_1DAY: DAILY_LOOKBACK_DAYS}
+
+
+def get_monitored_symbols():
+    '''symbols of every pair that could pass the opener's filters plus every open position'''
+    symbols = set()
+    conn = connect_to_db(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD)
+    if conn is not None:
+        query = f"""
+        select symbol1, symbol2 from coin_signal
+        where most_recent_coint_pct >= {MIN_RECENT_COINT}
+        and r_squared >= {MIN_R_SQUARED};
+        """
+        pairs_df = pd.read_sql(query, conn)
+        conn.close()
+        symbols |= set(pairs_df['symbol1'] + 'USDT') | set(pairs_df['symbol2'] + 'USDT')
+    positions = load_position_store(position_db_file, order_csv_file)
+    for position in positions.open_positions():
+        symbols |= {position['symbol_Y'], position['symbol_X']}
+    positions.close()
+    return sorted(symbols)
+
+
+if __name__ == '__main__':
+    store = KlineStore()
+    symbols = get_monitored_symbols()
+    logging.info(f"Monitoring {len(symbols)} symbols.")
+
+    if '--replay' in sys.argv:
+        feed = ReplayKlineFeed.from_candle_cache(store, candle_cache_folder, symbols, INTERVALS)
+    else:
+        client = Client(api_key, api_secret)
+        feed = BinanceKlineDaemon(store, api_key, api_secret, symbols, INTERVALS)
+        feed.seed_from_cache(client, candle_cache, LOOKBACK_DAYS)
+
+    # the feed runs on its own threads, the main thread serves the store
+    feed.start()
+    try:
+        KlineStoreServer(store).serve_forever()
+    except KeyboardInterrupt:
+        feed.stop()
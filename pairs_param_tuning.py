@@ -0,0 +1,44 @@
+from utils.trading_utils import *
+from utils.pairs_backtest import *
+
+import os
+import logging
+from dotenv import load_dotenv
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s | %(levelname)8s | %(message)s',
+    datefmt='%Y-%m-%d %H:%M'
+)
+
+load_dotenv()
+DB_USERNAME = os.getenv('RDS_USERNAME')
+DB_PASSWORD = os.getenv('RDS_PASSWORD')
+DB_HOST = os.getenv('RDS_ENDPOINT')
+DB_NAME = os.getenv('RDS_DB_NAME')
+
+# PAIRS RULES
+pairs_param_ranges = {
+    'min_recent_coint': [0.6, 0.75, 0.9],
+    'min_r_squared': [0.6, 0.7, 0.8],
+    'signal_std_mult': [1.5, 1.8, 2.0],
+    'stoploss_std_mult': [3.0, 3.5, 4.0],
+}
+
+conn = connect_to_db(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD)
+signal_df = pd.read_sql("select * from coin_signal", conn)
+symbols = sorted(set(signal_df['symbol1']) | set(signal_df['symbol2']))
+minute_dates, minute_close, daily_dates, daily_close, symbols = load_pair_closes(
+    conn, symbols, start_date='2023-01-01', end_date='2024-09-01')
+conn.close()
+
+results_df = tune_pairs_backtest(minute_dates, minute_close, daily_dates, daily_close,
+                                 symbols, signal_df, pairs_param_ranges)
+results_df.sort_values('net_pnl', ascending=False).to_csv('./pairs_tuning_results.csv', index=False)
+
+# trades of the live settings for a closer look
+backtest = PairsBacktest(minute_dates, minute_close, daily_dates, daily_close, symbols,
+                         signal_df[(signal_df['most_recent_coint_pct'] >= MIN_RECENT_COINT) &
+                                   (signal_df['r_squared'] >= MIN_R_SQUARED)])
+backtest.run().to_csv('./pairs_backtest_trades.csv', index=False)
+backtest.pair_summary().to_csv('./pairs_backtest_summary.csv', index=False)
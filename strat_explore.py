@@ -4,6 +4,8 @@ import pandas as pd
 from binance.enums import *
 from utils.strat_utils import *
 from utils.child_strats import *
+from utils.intrabar_fills import IntrabarFillModel
+from utils.streaming_backtest import StreamingBacktest, iter_db_candles
 from utils.avan_utils import *
 from isolated_bn_data_db_updater.db_utils import *
 
@@ -15,7 +17,7 @@ avan_api_key = os.getenv('ALPHA_VANTAGE_PREM_API')
 DB_USERNAME = os.getenv('RDS_USERNAME')
 DB_PASSWORD = os.getenv('RDS_PASSWORD')
 DB_HOST = os.getenv('RDS_ENDPOINT')
- DB_NAME = os.getenv('RDS_DB_NAME')
+DB_NAME = os.getenv('RDS_DB_NAME')
 
 ''' date|open|high|low|close|volume'''
 '''testing pipeline'''
@@ -71,14 +73,20 @@ print(monitored_pairs)
 
 
 all_trade_summaries = {}
+# trade candles of both the in memory and the streamed run, e.g. binance_coin_5mins_historical_price for 5m candles
+TRADE_TABLE = 'binance_coin_hourly_historical_price'
+TRADE_START_DATE = '2020-11-01'
+TRADE_END_DATE = '2024-09-04'
+# set to e.g. 50000 to stream TRADE_TABLE in chunks instead of loading the whole range
+STREAM_CHUNK_ROWS = None
 
 for symbol in monitored_pairs['symbol']:
     min_df_query = f'''
     select *
-    from binance_coin_hourly_historical_price 
+    from {TRADE_TABLE} 
     where symbol = '{symbol}'
     --and date > '2024-01-01'
-    and date between '2020-11-01' and '2024-09-04';
+    and date between '{TRADE_START_DATE}' and '{TRADE_END_DATE}';
     '''
     day_df_query = f'''
     select *
@@ -88,7 +96,7 @@ for symbol in monitored_pairs['symbol']:
     and date between '2022-01-01' and '2024-09-04';
     '''
     
-    min_df_chart = pd.read_sql(min_df_query, conn)
+    min_df_chart = None if STREAM_CHUNK_ROWS else pd.read_sql(min_df_query, conn)
     day_df_chart = pd.read_sql(day_df_query, conn)
     ts = StoneWellStrategy(trade_candles_df=min_df_chart,  
                        indicator_candles_df=min_df_chart,  
@@ -113,10 +121,20 @@ for symbol in monitored_pairs['symbol']:
                        volume_long_sma_window=28,
                        atr_window=10, 
                        kc_sma_window=20, 
-                       kc_mult=2
+                       kc_mult=2,
+                       # fill stop loss/profit target on candle high/low, 'drilldown' replays ambiguous bars on 5m candles
+                       # fill_model=IntrabarFillModel(tie_break='drilldown', conn=conn),
                        )
  
     
+    if STREAM_CHUNK_ROWS:
+        chunks = iter_db_candles(conn, TRADE_TABLE, symbol,
+                                 TRADE_START_DATE, TRADE_END_DATE, chunk_rows=STREAM_CHUNK_ROWS)
+        stream = StreamingBacktest(ts, chunks, executions_file=f'./test_exec_{symbol}.csv',
+                                   orders_file=f'./test_orders_{symbol}.csv')
+        all_trade_summaries[symbol] = stream.run()
+        continue
+    
     # Run test for this symbol
     ts.run_test()
     ts.generate_trading_chart()
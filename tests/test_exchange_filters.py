@@ -0,0 +1,116 @@
+import os
+import json
+import time
+from decimal import Decimal
+import pytest
+from utils.exchange_filters import parse_symbol_filters, SymbolFilterCache
+
+FIXTURE_FILE = os.path.join(os.path.dirname(__file__), 'fixtures', 'exchange_info.json')
+
+
+@pytest.fixture
+def exchange_info():
+    with open(FIXTURE_FILE) as file:
+        return json.load(file)
+
+
+@pytest.fixture
+def filters(exchange_info, tmp_path):
+    cache = SymbolFilterCache(str(tmp_path / 'exchange_info.json'))
+    cache.filters = parse_symbol_filters(exchange_info)
+    cache.fetched_at = time.time()
+    return cache
+
+
+class FakeClient:
+    def __init__(self, exchange_info):
+        self.exchange_info = exchange_info
+        self.calls = 0
+
+    def get_exchange_info(self):
+        self.calls += 1
+        return self.exchange_info
+
+
+def test_parse_symbol_filters(exchange_info):
+    parsed = parse_symbol_filters(exchange_info)
+    assert set(parsed) == {'BTCUSDT', 'DOGEUSDT', 'ETHUSDT', 'LUNAUSDT'}
+    assert parsed['BTCUSDT'] == {'status': 'TRADING', 'step_size': Decimal('0.00001'), 'min_qty': 0.00001,
+                                 'tick_size': Decimal('0.01'), 'min_notional': 5.0}
+    assert parsed['DOGEUSDT']['step_size'] == Decimal('1')
+    assert parsed['LUNAUSDT']['status'] == 'BREAK'
+
+
+def test_parse_market_lot_size_and_legacy_min_notional(exchange_info):
+    eth = parse_symbol_filters(exchange_info)['ETHUSDT']
+    # MARKET_LOT_SIZE step is coarser than LOT_SIZE's, market orders must use it
+    assert eth['step_size'] == Decimal('0.001')
+    # older snapshots carry MIN_NOTIONAL instead of NOTIONAL
+    assert eth['min_notional'] == 10.0
+
+
+@pytest.mark.parametrize('symbol, qty, expected', [
+    ('BTCUSDT', 0.123456789, 0.12345),
+    ('BTCUSDT', 0.00001, 0.00001),
+    ('BTCUSDT', 0.000009, 0.0),
+    ('DOGEUSDT', 1234.99, 1234.0),
+    ('ETHUSDT', 1.23456, 1.234),
+    ('ETHUSDT', 0.3, 0.3),  # no float drift below the step
+])
+def test_round_qty_rounds_down_to_step(filters, symbol, qty, expected):
+    assert filters.round_qty(symbol, qty) == expected
+
+
+@pytest.mark.parametrize('symbol, price, expected', [
+    ('BTCUSDT', 67123.456, 67123.45),
+    ('BTCUSDT', 67123.459999, 67123.45),
+    ('DOGEUSDT', 0.1234567, 0.12345),
+    ('LUNAUSDT', 0.00019, 0.0001),
+])
+def test_round_price_rounds_down_to_tick(filters, symbol, price, expected):
+    assert filters.round_price(symbol, price) == expected
+
+
+def test_rounded_values_keep_the_step_precision(filters):
+    qty = filters.round_qty('BTCUSDT', 0.1 + 0.2)
+    price = filters.round_price('DOGEUSDT', 0.1 + 0.2)
+    assert repr(qty) == '0.3'
+    assert repr(price) == '0.3'
+
+
+def test_is_tradable_min_qty_and_notional(filters):
+    assert filters.is_tradable('BTCUSDT', 0.0001, 60000)        # $6
+    assert not filters.is_tradable('BTCUSDT', 0.00005, 60000)   # $3 below NOTIONAL
+    assert not filters.is_tradable('DOGEUSDT', 0.5, 100)        # below LOT_SIZE min qty
+    assert not filters.is_tradable('ETHUSDT', 0.002, 3000)      # $6 below MIN_NOTIONAL 10
+    assert filters.is_tradable('ETHUSDT', 0.004, 3000)
+
+
+def test_is_tradable_needs_trading_status(filters):
+    assert not filters.is_tradable('LUNAUSDT', 100000, 1)
+
+
+def test_cache_refreshes_once_and_reloads_from_disk(exchange_info, tmp_path):
+    cache_file = str(tmp_path / 'exchange_info.json')
+    client = FakeClient(exchange_info)
+    cache = SymbolFilterCache(cache_file)
+    cache.ensure_fresh(client)
+    cache.ensure_fresh(client)
+    assert client.calls == 1
+
+    reloaded = SymbolFilterCache(cache_file)
+    reloaded.ensure_fresh()
+    assert reloaded.round_qty('BTCUSDT', 0.123456) == 0.12345
+
+
+def test_cache_refetches_after_ttl(exchange_info, tmp_path):
+    client = FakeClient(exchange_info)
+    cache = SymbolFilterCache(str(tmp_path / 'exchange_info.json'), ttl_seconds=0)
+    cache.ensure_fresh(client)
+    cache.ensure_fresh(client)
+    assert client.calls == 2
+
+
+def test_cache_without_snapshot_or_client_raises(tmp_path):
+    with pytest.raises(ValueError):
+        SymbolFilterCache(str(tmp_path / 'missing.json')).ensure_fresh()
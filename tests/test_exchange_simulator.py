@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+from utils.exchange_simulator import SimulatedBinanceClient
+
+
+@pytest.fixture
+def client():
+    # 1h base bars, the last one rises from 100 to 110 with a 120 high
+    dates = pd.date_range('2024-01-01', periods=4, freq='1h')
+    candles = pd.DataFrame({'date': dates, 'open': [100.0, 100.0, 100.0, 100.0], 'high': [101.0, 101.0, 101.0, 120.0],
+                            'low': [99.0, 99.0, 99.0, 95.0], 'close': [100.0, 100.0, 100.0, 110.0],
+                            'volume': [10.0, 10.0, 10.0, 10.0]})
+    client = SimulatedBinanceClient({'BTCUSDT': candles}, replay_start=dates[-1], speed=0)
+    client.advance(30 * 60)  # half way through the last bar
+    return client
+
+
+def last_kline(client, interval):
+    return [float(value) for value in client.get_klines(symbol='BTCUSDT', interval=interval, limit=1)[0][1:6]]
+
+
+def test_forming_base_bar_is_cut_at_now(client):
+    price, _ = client._price('BTCUSDT')
+    assert last_kline(client, '1h') == pytest.approx([100.0, price, 100.0, price, 5.0])
+    assert price == pytest.approx(105.0)
+
+
+def test_forming_aggregated_bar_is_cut_at_now(client):
+    # the 2h bar holds one closed base bar and the forming one
+    assert last_kline(client, '2h') == pytest.approx([100.0, 105.0, 99.0, 105.0, 15.0])
+
+
+def test_closed_bar_is_whole(client):
+    client.advance(30 * 60)
+    assert last_kline(client, '1h') == pytest.approx([100.0, 120.0, 95.0, 110.0, 10.0])
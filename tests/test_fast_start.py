@@ -0,0 +1,16 @@
+import sys
+import subprocess
+from utils.candidate_pairs import CANDIDATE_PAIRS_QUERY, CANDIDATES_EXIST_QUERY
+from utils.pairs_trading import CANDIDATE_PAIRS_QUERY as OPENER_QUERY
+
+
+def test_opener_check_runs_the_opener_query():
+    assert CANDIDATE_PAIRS_QUERY is OPENER_QUERY
+    assert CANDIDATE_PAIRS_QUERY.strip().rstrip(';') in CANDIDATES_EXIST_QUERY
+    assert 'potential_win/nullif(investment, 0) >=' in CANDIDATES_EXIST_QUERY
+
+
+def test_fast_start_imports_no_pandas_or_binance():
+    code = "import sys, fast_start; print(sorted({'pandas', 'binance', 'numpy'} & set(sys.modules)))"
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == '[]'
@@ -0,0 +1,79 @@
+import pandas as pd
+from utils.strat_utils import BinanceProductionStrategy
+
+SYMBOL = 'BTCUSDT'
+START = pd.Timestamp('2024-01-01')
+BAR = pd.Timedelta(hours=2)
+
+
+class RecordingStrategy(BinanceProductionStrategy):
+    '''records the (date, close) of every candle the open and close logic see'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened = []
+        self.closed = []
+
+    def get_indicators(self, df):
+        return df
+
+    def get_extra_indicators(self, df):
+        return df
+
+    def stepwise_logic_open(self, candle_df_slices):
+        candle = candle_df_slices.iloc[-1]
+        self.opened.append((candle['date'], candle['close']))
+
+    def stepwise_logic_close(self, candle_df_slices, order_index):
+        candle = candle_df_slices.iloc[-1]
+        self.closed.append((candle['date'], candle['close']))
+
+
+def make_candles(n_bars, last_close):
+    '''n_bars 2h candles, the last one forming at last_close'''
+    closes = [100.0] * (n_bars - 1) + [last_close]
+    return pd.DataFrame({'date': [START + i * BAR for i in range(n_bars)],
+                         'open': 100.0, 'high': [max(100.0, c) for c in closes],
+                         'low': [min(100.0, c) for c in closes], 'close': closes,
+                         'volume': 1.0, 'symbol': SYMBOL})
+
+
+def run_tick(candles, last_date):
+    open_orders_df = pd.DataFrame([{'symbol': SYMBOL, 'status': 'OPEN', 'price': 100.0}])
+    strategy = RecordingStrategy(candles.copy(), candles.copy(), pd.DataFrame(), open_orders_df, 100, 0, None,
+                                 0.1, 0.1, 0.1, 1, 1, ideal_executions_df=pd.DataFrame())
+    return strategy, strategy.run_incremental(last_date)
+
+
+def test_forming_candle_is_not_marked():
+    strategy, mark = run_tick(make_candles(30, 101.0), None)
+    forming = START + 29 * BAR
+    assert strategy.opened == [(forming, 101.0)]
+    assert mark == forming - BAR
+
+
+def test_two_ticks_inside_one_bar_rerun_the_forming_candle():
+    _, mark = run_tick(make_candles(30, 101.0), None)
+    # same bar later in its 2h: the close moved, the candle is evaluated again on the new price
+    strategy, second_mark = run_tick(make_candles(30, 90.0), mark)
+    forming = START + 29 * BAR
+    assert strategy.opened == [(forming, 90.0)]
+    assert strategy.closed == [(forming, 90.0)]
+    assert second_mark == mark
+
+
+def test_closed_candle_runs_close_only_and_advances_the_mark():
+    _, mark = run_tick(make_candles(30, 101.0), None)
+    candles = make_candles(31, 102.0)
+    candles.loc[29, ['high', 'low', 'close']] = [105.0, 95.0, 97.0]
+    strategy, next_mark = run_tick(candles, mark)
+    assert strategy.opened == [(START + 30 * BAR, 102.0)]
+    assert strategy.closed == [(START + 29 * BAR, 97.0), (START + 30 * BAR, 102.0)]
+    assert next_mark == START + 29 * BAR
+
+
+def test_no_new_candles_keeps_the_mark():
+    candles = make_candles(30, 101.0)
+    strategy, mark = run_tick(candles, candles['date'].iloc[-1])
+    assert mark == candles['date'].iloc[-1]
+    assert strategy.opened == [] and strategy.closed == []
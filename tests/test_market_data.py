@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+from utils.kline_stream import KlineStore, ReplayKlineFeed
+from utils.market_data import MarketDataSession
+
+
+class RecordingClient:
+    '''fails every call, the session should not need the exchange'''
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append(name)
+            raise ConnectionError(f'no network in tests: {name}')
+        return call
+
+
+def recorded_candles(freq, periods):
+    dates = pd.date_range('2024-01-01', periods=periods, freq=freq)
+    return pd.DataFrame({'date': dates, 'open': 100.0, 'high': 101.0, 'low': 99.0, 'close': 100.5, 'volume': 10.0})
+
+
+@pytest.fixture
+def recorded():
+    return {(symbol, interval): recorded_candles(freq, periods)
+            for symbol in ('BTCUSDT', 'ETHUSDT')
+            for interval, freq, periods in (('2h', '2h', 48), ('1d', '1D', 10))}
+
+
+def test_replay_session_makes_no_client_calls(recorded):
+    store = KlineStore()
+    ReplayKlineFeed(store, recorded).run()
+    client = RecordingClient()
+    session = MarketDataSession(client, bar_source=store)
+    Y_minute_data, Y_daily_data, X_minute_data, X_daily_data = session.get_pair('BTCUSDT', 'ETHUSDT')
+    assert client.calls == []
+    assert len(Y_minute_data) == len(X_minute_data) == 48
+    assert len(Y_daily_data) == len(X_daily_data) == 10
+
+
+def test_live_store_behind_falls_back_to_rest(recorded):
+    store = KlineStore()
+    for (symbol, interval), df in recorded.items():
+        store.seed(symbol, interval, df)
+    client = RecordingClient()
+    session = MarketDataSession(client, bar_source=store)
+    with pytest.raises(ConnectionError):
+        session.get('BTCUSDT')
+    assert client.calls
@@ -0,0 +1,123 @@
+import os
+import pandas as pd
+import pytest
+from utils.order_journal import OrderJournal, load_order_journal
+
+
+class FakeStrategy:
+    '''the frames OrderJournal.record reads off a strategy'''
+
+    def __init__(self, open_orders_df=None):
+        self.open_orders_df = pd.DataFrame() if open_orders_df is None else open_orders_df
+        self.executions_df = pd.DataFrame()
+        self.ideal_executions_df = pd.DataFrame()
+
+    def open(self, symbol, price):
+        order = {'status': 'OPEN', 'symbol': symbol, 'price': price, 'quantity': 1.0, 'close_reason': None}
+        self.open_orders_df = pd.concat([self.open_orders_df, pd.DataFrame([order])], ignore_index=True)
+        self.execute('BUY', symbol, price)
+
+    def close(self, index, reason):
+        self.open_orders_df.at[index, 'status'] = 'CLOSED'
+        self.open_orders_df.at[index, 'close_reason'] = reason
+        self.execute('SELL', self.open_orders_df.at[index, 'symbol'], self.open_orders_df.at[index, 'price'])
+
+    def execute(self, action, symbol, price):
+        row = {'execution_time': '2024-01-01 00:00:00', 'action': action, 'symbol': symbol, 'price': price}
+        self.executions_df = pd.concat([self.executions_df, pd.DataFrame([row])], ignore_index=True)
+        self.ideal_executions_df = pd.concat([self.ideal_executions_df, pd.DataFrame([row])], ignore_index=True)
+
+
+def reopen(journal, folder, **kwargs):
+    journal.close()
+    return OrderJournal(folder, 'strat', **kwargs)
+
+
+def test_record_opens_updates_and_marks(tmp_path):
+    journal = OrderJournal(str(tmp_path), 'strat')
+    strategy = FakeStrategy()
+    strategy.open('BTCUSDT', 100.0)
+    strategy.open('ETHUSDT', 10.0)
+    assert journal.record(strategy, marks={'BTCUSDT': '2024-01-01 00:00:00'}) == 1 + 2 + 2 + 2
+    assert strategy.open_orders_df['order_id'].tolist() == [0, 1]
+    assert journal.record(strategy, marks={'BTCUSDT': '2024-01-01 00:00:00'}) == 0
+
+    strategy.close(0, 'Stop loss hit')
+    assert journal.record(strategy) == 1 + 1 + 1
+    assert list(journal.open_orders) == [1]
+
+    journal = reopen(journal, str(tmp_path))
+    assert list(journal.open_orders) == [1]
+    assert journal.marks == {'BTCUSDT': '2024-01-01 00:00:00'}
+    assert journal.next_order_id == 2
+    df = journal.open_orders_df()
+    assert df['symbol'].tolist() == ['ETHUSDT'] and 'close_reason' not in df
+    journal.close()
+
+
+def test_snapshot_plus_tail_load(tmp_path):
+    journal = OrderJournal(str(tmp_path), 'strat', compact_events=4)
+    strategy = FakeStrategy()
+    strategy.open('BTCUSDT', 100.0)
+    strategy.open('ETHUSDT', 10.0)
+    journal.record(strategy, marks={'BTCUSDT': 'a'})  # 7 events, compacted
+    assert journal.tail_events == 0 and os.path.getsize(journal.journal_file) == 0
+    strategy.close(1, 'Profit target met')
+    journal.record(strategy, marks={'BTCUSDT': 'b'})  # 4 events in the tail
+    assert journal.tail_events == 0
+    strategy.open('SOLUSDT', 1.0)
+    journal.record(strategy)  # 3 events, below compact_events
+
+    journal = reopen(journal, str(tmp_path), compact_events=4)
+    assert journal.tail_events == 3
+    assert sorted(row['symbol'] for row in journal.open_orders.values()) == ['BTCUSDT', 'SOLUSDT']
+    assert journal.marks == {'BTCUSDT': 'b'}
+    assert journal.next_order_id == 3
+    orders_df, executions_df, ideal_df = journal.export_dfs()
+    assert orders_df.set_index('order_id')['status'].to_dict() == {0: 'OPEN', 1: 'CLOSED', 2: 'OPEN'}
+    assert len(executions_df) == len(ideal_df) == 4
+    journal.close()
+
+
+def test_history_drops_seqs_copied_twice(tmp_path, monkeypatch):
+    journal = OrderJournal(str(tmp_path), 'strat')
+    strategy = FakeStrategy()
+    strategy.open('BTCUSDT', 100.0)
+    journal.record(strategy)
+
+    # die between the history append and the snapshot/truncate
+    def crash(*args):
+        raise OSError('killed')
+    with monkeypatch.context() as patch:
+        patch.setattr(os, 'replace', crash)
+        with pytest.raises(OSError):
+            journal.compact()
+
+    journal = reopen(journal, str(tmp_path))
+    assert journal.tail_events == 3
+    journal.compact()
+    assert [event['seq'] for event in journal.history()] == [1, 2, 3]
+    orders_df, executions_df, ideal_df = journal.export_dfs()
+    assert len(orders_df) == 1 and len(executions_df) == 1 and len(ideal_df) == 1
+    journal.close()
+
+
+def test_legacy_csv_import(tmp_path):
+    order_csv = str(tmp_path / 'strat_order_df.csv')
+    exec_csv = str(tmp_path / 'strat_exec_df.csv')
+    ideal_csv = str(tmp_path / 'strat_ideal_exec_df.csv')
+    pd.DataFrame({'status': ['CLOSED', 'OPEN'], 'symbol': ['BTCUSDT', 'ETHUSDT'], 'price': [100.0, 10.0]}).to_csv(order_csv, index=False)
+    pd.DataFrame({'action': ['BUY', 'SELL', 'BUY'], 'symbol': ['BTCUSDT', 'BTCUSDT', 'ETHUSDT']}).to_csv(exec_csv, index=False)
+
+    journal = load_order_journal(str(tmp_path / 'journal'), 'strat', order_csv, exec_csv, ideal_csv)
+    assert [row['symbol'] for row in journal.open_orders.values()] == ['ETHUSDT']
+    assert journal.tail_events == 0  # imported straight into a snapshot
+    journal.close()
+
+    # a second load does not import again
+    journal = load_order_journal(str(tmp_path / 'journal'), 'strat', order_csv, exec_csv, ideal_csv)
+    orders_df, executions_df, ideal_df = journal.export_dfs()
+    assert orders_df['status'].tolist() == ['CLOSED', 'OPEN']
+    assert executions_df['action'].tolist() == ['BUY', 'SELL', 'BUY']
+    assert ideal_df.empty
+    journal.close()
@@ -0,0 +1,99 @@
+import pytest
+from utils.metrics import NULL_METRICS
+from utils.pair_execution import PairOrderExecutor, PairExecutionError
+from utils.position_store import PositionStore
+from utils.pairs_trading import record_partial_fill, PARTIAL
+
+
+def filled_order(symbol, side, quantity, price, order_id):
+    return {'symbol': symbol, 'side': side, 'transactTime': 1_700_000_000_000, 'executedQty': str(quantity),
+            'cummulativeQuoteQty': str(quantity * price), 'status': 'FILLED', 'orderId': order_id,
+            'clientOrderId': f'client-{order_id}', 'type': 'MARKET'}
+
+
+class FakeMarginClient:
+    '''fills spot and margin market orders, fail_on names the methods that raise'''
+
+    def __init__(self, fail_on=()):
+        self.fail_on = set(fail_on)
+        self.calls = []
+
+    def _call(self, name, response):
+        self.calls.append(name)
+        if name in self.fail_on:
+            raise RuntimeError(f'{name} rejected')
+        return response
+
+    def order_market_buy(self, symbol, quantity):
+        return self._call('order_market_buy', filled_order(symbol, 'BUY', quantity, 10.0, 1))
+
+    def order_market_sell(self, symbol, quantity):
+        return self._call('order_market_sell', filled_order(symbol, 'SELL', quantity, 10.0, 2))
+
+    def create_margin_loan(self, asset, amount):
+        return self._call('create_margin_loan', {'tranId': 101})
+
+    def repay_margin_loan(self, asset, amount):
+        return self._call('repay_margin_loan', {'tranId': 102})
+
+    def create_margin_order(self, symbol, side, type, quantity):
+        return self._call('create_margin_order', filled_order(symbol, side, quantity, 20.0, 3))
+
+
+class FakeWriter:
+    def __init__(self):
+        self.fills = []
+
+    def record_fills(self, orders):
+        self.fills.extend(orders)
+
+
+class FakeContext:
+    def __init__(self, positions):
+        self.metrics = NULL_METRICS
+        self.writer = FakeWriter()
+        self.positions = positions
+
+
+@pytest.fixture
+def ctx(tmp_path):
+    positions = PositionStore(str(tmp_path / 'positions.db'))
+    yield FakeContext(positions)
+    positions.close()
+
+
+def test_failed_margin_sell_keeps_the_loan(ctx):
+    executor = PairOrderExecutor(FakeMarginClient(fail_on={'create_margin_order'}))
+    with pytest.raises(PairExecutionError) as raised:
+        executor.execute(*executor.prepare_open('AAAUSDT', 5, 'BBBUSDT', 2))
+    result = raised.value.result
+    assert result['long']['order']['symbol'] == 'AAAUSDT'
+    assert result['short'] == {'loan': {'tranId': 101, 'asset': 'BBB', 'amount': '2'}}
+
+    record_partial_fill(ctx, raised.value, 'AAAUSDT', 'BBBUSDT', 'AAAUSDT', 'BBBUSDT')
+    assert [order['symbol'] for order in ctx.writer.fills] == ['AAAUSDT']
+    assert ctx.positions.is_active('AAAUSDT', 'BBBUSDT') == PARTIAL
+    row = ctx.positions.to_orders_df().iloc[0]
+    assert row['short_loanId'] == '101'
+    assert row['long_orderId'] == '1'
+
+
+def test_failed_repay_keeps_the_buy_back(ctx):
+    position_id = ctx.positions.open_position({'symbol_Y': 'AAAUSDT', 'symbol_X': 'BBBUSDT'})
+    executor = PairOrderExecutor(FakeMarginClient(fail_on={'repay_margin_loan'}))
+    with pytest.raises(PairExecutionError) as raised:
+        executor.execute(*executor.prepare_close('AAAUSDT', 5, 'BBBUSDT', 2))
+    assert set(raised.value.result['short']) == {'order'}
+
+    record_partial_fill(ctx, raised.value, 'AAAUSDT', 'BBBUSDT', 'AAAUSDT', 'BBBUSDT', position_id)
+    assert [(order['symbol'], order['side']) for order in ctx.writer.fills] == [('AAAUSDT', 'SELL'), ('BBBUSDT', 'BUY')]
+    assert ctx.positions.is_active('AAAUSDT', 'BBBUSDT') == PARTIAL
+
+
+def test_nothing_filled_records_nothing(ctx):
+    executor = PairOrderExecutor(FakeMarginClient(fail_on={'order_market_buy', 'create_margin_loan'}))
+    with pytest.raises(PairExecutionError) as raised:
+        executor.execute(*executor.prepare_open('AAAUSDT', 5, 'BBBUSDT', 2))
+    record_partial_fill(ctx, raised.value, 'AAAUSDT', 'BBBUSDT', 'AAAUSDT', 'BBBUSDT')
+    assert ctx.writer.fills == []
+    assert ctx.positions.is_active('AAAUSDT', 'BBBUSDT') is None
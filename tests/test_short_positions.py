@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+from utils.child_strats import SimpleSMAStrategy
+from utils.margin_costs import margin_interest
+
+
+def make_strategy(side, low_since_open=100.0, high_since_open=100.0):
+    open_orders_df = pd.DataFrame([{'last_update_time': pd.Timestamp('2024-01-01'), 'status': 'OPEN',
+                                    'symbol': 'BTCUSDT', 'side': side, 'tlt_dollar': 1000.0, 'price': 100.0,
+                                    'quantity': 10.0, 'high_since_open': high_since_open,
+                                    'low_since_open': low_since_open}])
+    return SimpleSMAStrategy(pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), open_orders_df, 1000, 0, None,
+                             0.1, -0.05, 0.03, 1, 1, price_sma_window=2)
+
+
+def candles(open_price, price_sma):
+    dates = [pd.Timestamp('2024-01-02'), pd.Timestamp('2024-01-03')]
+    return pd.DataFrame({'date': dates, 'symbol': 'BTCUSDT', 'open': [100.0, open_price], 'price_SMA': price_sma})
+
+
+def test_short_stop_loss_on_a_rise():
+    strategy = make_strategy('SHORT')
+    strategy.stepwise_logic_close(candles(106.0, 200.0), 0)
+    order = strategy.open_orders_df.iloc[0]
+    assert order['status'] == 'CLOSED'
+    assert order['close_reason'].startswith('Stop loss hit')
+    assert order['profit_percentage'] == '-6.00%'
+    assert strategy.executions_df['action'].tolist() == ['SHORT_CLOSE']
+
+
+def test_short_profit_target_on_a_drop():
+    strategy = make_strategy('SHORT')
+    strategy.stepwise_logic_close(candles(89.0, 200.0), 0)
+    order = strategy.open_orders_df.iloc[0]
+    assert order['close_reason'].startswith('Profit target met')
+    assert order['profit_percentage'] == '11.00%'
+
+
+def test_short_retrace_from_low_since_open():
+    strategy = make_strategy('SHORT', low_since_open=90.0)
+    strategy.stepwise_logic_close(candles(93.0, 200.0), 0)
+    assert strategy.open_orders_df.iloc[0]['close_reason'] == 'Price retraced but profitable'
+    assert strategy.executions_df['action'].tolist() == ['SHORT_CLOSE']
+
+
+def test_short_stays_open_below_sma():
+    strategy = make_strategy('SHORT')
+    strategy.stepwise_logic_close(candles(98.0, 99.0), 0)
+    assert strategy.open_orders_df.iloc[0]['status'] == 'OPEN'
+    assert strategy.open_orders_df.iloc[0]['low_since_open'] == 98.0
+
+
+def test_long_is_sold():
+    strategy = make_strategy('LONG')
+    strategy.stepwise_logic_close(candles(94.0, 90.0), 0)
+    assert strategy.open_orders_df.iloc[0]['profit_percentage'] == '-6.00%'
+    assert strategy.executions_df['action'].tolist() == ['SELL']
+
+
+@pytest.mark.parametrize('hours, hours_charged', [(0.5, 1), (1, 2), (2.5, 3), (3, 4)])
+def test_margin_interest_hours_charged(hours, hours_charged):
+    open_time = pd.Timestamp('2024-01-01')
+    interest = margin_interest(1000.0, open_time, open_time + pd.Timedelta(hours=hours), hourly_rate=0.001)
+    assert interest == pytest.approx(1000.0 * 0.001 * hours_charged)
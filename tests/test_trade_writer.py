@@ -0,0 +1,135 @@
+import os
+import json
+import pandas as pd
+import pytest
+from utils.trade_writer import TradeWriter
+
+
+def filled_order(symbol, order_id):
+    return {'symbol': symbol, 'side': 'BUY', 'transactTime': 1_700_000_000_000 + order_id,
+            'executedQty': '2', 'cummulativeQuoteQty': '20', 'orderId': order_id}
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, query, values):
+        if self.db.down:
+            raise ConnectionError('db is down')
+        self.db.inserted.append(values)
+
+    def close(self):
+        pass
+
+
+class FakeDb:
+    '''a connect() for TradeWriter, inserted holds the flattened values of every insert'''
+
+    def __init__(self, down=False):
+        self.down = down
+        self.inserted = []
+        self.closed = False
+
+    def __call__(self):
+        return self
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def crash(writer):
+    '''stop the writer the way a killed process would: no final flush, the journal lock released'''
+    writer.stopping = True
+    writer.wakeup.set()
+    writer.thread.join()
+    writer.journal.close()
+
+
+def decisions_df(tag):
+    return pd.DataFrame({'pair': [f'{tag}-a', f'{tag}-b'], 'signal': ['stand_by', 'long Y short X']})
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'trade_journal.jsonl'), str(tmp_path / 'strat_df.csv')
+
+
+def test_flush_writes_fills_and_decisions(paths):
+    journal_file, csv_file = paths
+    db = FakeDb()
+    writer = TradeWriter(db, journal_file, flush_seconds=60)
+    writer.record_fills([filled_order('BTCUSDT', 1), filled_order('ETHUSDT', 2)])
+    writer.record_decisions(decisions_df('scan1'), csv_file)
+    assert writer.flush() == 3
+    writer.close()
+    assert len(db.inserted) == 1 and db.inserted[0][1::6] == ['BTCUSDT', 'ETHUSDT']
+    assert pd.read_csv(csv_file)['pair'].tolist() == ['scan1-a', 'scan1-b']
+    assert os.path.getsize(journal_file) == 0
+
+
+def test_recovery_after_a_crash_writes_decisions_once(paths):
+    journal_file, csv_file = paths
+    down = FakeDb(down=True)
+    writer = TradeWriter(down, journal_file, flush_seconds=60)
+    writer.record_fills([filled_order('BTCUSDT', 1)])
+    writer.record_decisions(decisions_df('scan1'), csv_file)
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    crash(writer)
+    # the decisions made it to the csv before the db failed, the fill did not make it anywhere
+    assert pd.read_csv(csv_file)['pair'].tolist() == ['scan1-a', 'scan1-b']
+
+    db = FakeDb()
+    writer = TradeWriter(db, journal_file, flush_seconds=60)
+    writer.close()
+    assert len(db.inserted) == 1 and db.inserted[0][1] == 'BTCUSDT'
+    assert pd.read_csv(csv_file)['pair'].tolist() == ['scan1-a', 'scan1-b']
+
+
+def test_unacknowledged_torn_line_is_skipped(paths):
+    journal_file, csv_file = paths
+    writer = TradeWriter(FakeDb(down=True), journal_file, flush_seconds=60)
+    writer.record_fills([filled_order('BTCUSDT', 1)])
+    crash(writer)
+    with open(journal_file, 'a') as file:
+        file.write('{"kind": "fill", "row"')
+    db = FakeDb()
+    writer = TradeWriter(db, journal_file, flush_seconds=60)
+    writer.close()
+    assert len(db.inserted) == 1
+
+
+def test_journal_of_a_dead_process_is_taken_over(paths, tmp_path):
+    journal_file, csv_file = paths
+    orphan = str(tmp_path / 'trade_journal.4242.jsonl')
+    with open(orphan, 'w') as file:
+        file.write(json.dumps({'kind': 'fill', 'row': ['2024-01-01 00:00:00', 'BTCUSDT', 'BUY', 20.0, 10.0, 2.0],
+                               'seq': 1}) + '\n')
+        file.write(json.dumps({'kind': 'decisions', 'file': csv_file, 'columns': ['pair'], 'rows': [['orphan']],
+                               'seq': 2}) + '\n')
+    db = FakeDb()
+    writer = TradeWriter(db, journal_file, flush_seconds=60)
+    writer.close()
+    assert not os.path.exists(orphan)
+    assert db.inserted[0][1] == 'BTCUSDT'
+    assert pd.read_csv(csv_file)['pair'].tolist() == ['orphan']
+
+
+def test_second_process_gets_its_own_journal(paths):
+    journal_file, csv_file = paths
+    first = TradeWriter(FakeDb(), journal_file, flush_seconds=60)
+    second = TradeWriter(FakeDb(), journal_file, flush_seconds=60)
+    assert second.journal_file != first.journal_file
+    second.close()
+    first.close()
+    assert not os.path.exists(second.journal_file)
@@ -0,0 +1,105 @@
+import os
+import time
+import asyncio
+import logging
+import argparse
+import warnings
+from dotenv import load_dotenv
+from binance.client import Client
+from utils.trading_utils import *
+from utils.pairs_trading import PairsTradingContext, run_open_scan, run_close_checks
+from utils.kline_stream import KlineStore, BinanceKlineDaemon
+from utils.metrics import BotMetrics
+from market_data_daemon import get_monitored_symbols, INTERVALS, LOOKBACK_DAYS
+
+'''
+Resident pairs trading service.
+Runs the open scan and the close checks as tasks on one event loop, sharing the binance client,
+the db connection, the position book and an in-process websocket kline store.
+  python trading_service.py                     run until stopped
+  python trading_service.py --once              one open scan and one close check, then exit (cron)
+  python trading_service.py --metrics-port 9108  also serve the tick metrics at http://127.0.0.1:9108/metrics
+'''
+
+warnings.filterwarnings(
+    "ignore",
+    message="pandas only supports SQLAlchemy connectable")
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s | %(levelname)8s | %(message)s',
+    datefmt='%Y-%m-%d %H:%M'
+)
+
+load_dotenv()
+api_key = os.getenv('BINANCE_API')
+api_secret = os.getenv('BINANCE_SECRET')
+DB_USERNAME = os.getenv('RDS_USERNAME')
+DB_PASSWORD = os.getenv('RDS_PASSWORD')
+DB_HOST = os.getenv('RDS_ENDPOINT')
+DB_NAME = os.getenv('RDS_DB_NAME')
+
+OPEN_SCAN_INTERVAL = 5  # seconds
+CLOSE_CHECK_INTERVAL = 1  # seconds
+
+
+async def run_periodically(name, task, ctx, interval, lock, metrics):
+    '''run a blocking task every interval seconds on a worker thread, one task at a time across the service'''
+    loop = asyncio.get_running_loop()
+    while True:
+        started = time.monotonic()
+        async with lock:
+            try:
+                with metrics.tick(name.replace(' ', '_'), interval):
+                    await loop.run_in_executor(None, task, ctx)
+            except Exception as e:
+                logging.exception(f"{name} failed: {e}")
+        elapsed = time.monotonic() - started
+        logging.debug(f"{name} took {elapsed:.3f}s")
+        await asyncio.sleep(max(0, interval - elapsed))
+
+
+async def serve(ctx, open_interval, close_interval):
+    # both tasks mutate the shared order book, so they never overlap
+    lock = asyncio.Lock()
+    await asyncio.gather(
+        run_periodically('open scan', run_open_scan, ctx, open_interval, lock, ctx.metrics),
+        run_periodically('close checks', run_close_checks, ctx, close_interval, lock, ctx.metrics))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='pairs trading service')
+    parser.add_argument('--once', action='store_true', help='run one open scan and one close check then exit')
+    parser.add_argument('--open-interval', type=float, default=OPEN_SCAN_INTERVAL)
+    parser.add_argument('--close-interval', type=float, default=CLOSE_CHECK_INTERVAL)
+    parser.add_argument('--metrics-port', type=int, help='serve prometheus metrics on this port')
+    args = parser.parse_args()
+
+    metrics = BotMetrics('trading_service', out_dir=metrics_folder)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    client = metrics.instrument_client(Client(api_key, api_secret))
+    db_params = (DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD)
+
+    if args.once:
+        ctx = PairsTradingContext(client, db_params, metrics=metrics)
+        with metrics.tick('open_scan'):
+            run_open_scan(ctx)
+        with metrics.tick('close_checks'):
+            run_close_checks(ctx)
+        ctx.close()
+    else:
+        # market data streams into memory, so a tick only reads ring buffers
+        store = KlineStore()
+        daemon = BinanceKlineDaemon(store, api_key, api_secret, get_monitored_symbols(), INTERVALS)
+        daemon.seed_from_cache(client, candle_cache, LOOKBACK_DAYS)
+        daemon.start()
+
+        ctx = PairsTradingContext(client, db_params, bar_source=store, metrics=metrics)
+        try:
+            asyncio.run(serve(ctx, args.open_interval, args.close_interval))
+        except KeyboardInterrupt:
+            logging.info('Stopping trading service.')
+        finally:
+            daemon.stop()
+            ctx.close()
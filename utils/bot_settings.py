@@ -0,0 +1,41 @@
+import os
+from datetime import datetime
+
+'''settings and data paths of the pairs bot, stdlib only so fast_start.py can read them without pandas or binance'''
+
+# pairs selection from sql criteria
+MIN_RECENT_COINT = 0.75
+MIN_R_SQUARED = 0.7
+MIN_POTENTIAL_WIN_PCT = 0.01
+
+# trade params
+TOTAL_USDT_PER_TRADE = 50
+BB_BAND_WINDOW = 20 
+BB_SIGNAL_STD_MULT = 1.8
+BB_STOPLOSS_STD_MULT = 3.5
+# None trades on the coin_signal hedge ratios, 'rls' or 'kalman' updates them online per 2h bar
+ONLINE_HEDGE_RATIO = None
+
+# market data lookbacks
+MINUTE_LOOKBACK_DAYS = 720
+DAILY_LOOKBACK_DAYS = 800
+
+# BOT_DATA_FOLDER points the bot at another data folder, e.g. for offline load tests
+BOT_DATA_FOLDER = os.getenv('BOT_DATA_FOLDER', '/home/ec2-user/binance_pair_trader/data')
+
+def get_strat_csv_file():
+    # dated per call so long running processes roll over to a new file each day
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    return f'{BOT_DATA_FOLDER}/strat_df_{current_date}.csv'
+
+current_date = datetime.now().strftime("%Y-%m-%d")
+strat_csv_file = get_strat_csv_file()
+order_csv_file = f'{BOT_DATA_FOLDER}/order_df.csv'
+position_db_file = f'{BOT_DATA_FOLDER}/positions.db'
+candle_cache_folder = f'{BOT_DATA_FOLDER}/candle_cache'
+exchange_info_file = f'{BOT_DATA_FOLDER}/exchange_info.json'
+hedge_ratio_db_file = f'{BOT_DATA_FOLDER}/hedge_ratios.db'
+metrics_folder = f'{BOT_DATA_FOLDER}/metrics'
+trade_journal_file = f'{BOT_DATA_FOLDER}/trade_journal.jsonl'
+# order journals of the prod_pipeline.py strategies, their legacy csvs sit in BOT_DATA_FOLDER itself
+strat_journal_folder = f'{BOT_DATA_FOLDER}/journal'
@@ -0,0 +1,95 @@
+import os
+import time
+import threading
+import logging
+import pandas as pd
+from datetime import datetime, timedelta, timezone
+
+CANDLE_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume']
+
+
+class CandleCache:
+    '''
+    Rolling candle store per (symbol, interval).
+    Candles are kept in memory for the life of the process and mirrored to one csv per key on disk,
+    so a new process only downloads the bars after the last cached one.
+    '''
+
+    def __init__(self, cache_folder, transform, max_age_seconds=30):
+        self.cache_folder = cache_folder
+        self.transform = transform  # raw binance klines -> candle df
+        self.max_age_seconds = max_age_seconds
+        self.memory = {}
+        self.last_refresh = {}
+        self.locks = {}
+        self.locks_guard = threading.Lock()
+
+    def _key_lock(self, key):
+        with self.locks_guard:
+            if key not in self.locks:
+                self.locks[key] = threading.Lock()
+            return self.locks[key]
+
+    def _file_path(self, symbol, interval):
+        return os.path.join(self.cache_folder, f'{symbol}_{interval}.csv')
+
+    def _load(self, symbol, interval):
+        key = (symbol, interval)
+        if key in self.memory:
+            return self.memory[key]
+
+        file_path = self._file_path(symbol, interval)
+        if os.path.exists(file_path):
+            try:
+                df = pd.read_csv(file_path, parse_dates=['date'])
+                return df[CANDLE_COLUMNS]
+            except Exception as e:
+                logging.warning(f"Unreadable candle cache {file_path}, refetching: {e}")
+        return pd.DataFrame(columns=CANDLE_COLUMNS)
+
+    def _save(self, symbol, interval, df):
+        os.makedirs(self.cache_folder, exist_ok=True)
+        file_path = self._file_path(symbol, interval)
+        tmp_path = file_path + '.tmp'
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, file_path)
+
+    def get_candles(self, client, symbol, interval, lookback_days):
+        '''
+        Return the last lookback_days of candles for symbol, same columns as candle_transformation.
+        Only the last cached bar onwards is requested from binance - that bar is refetched since it may
+        still have been forming when it was cached. Calls within max_age_seconds are served from memory.
+        '''
+        key = (symbol, interval)
+        with self._key_lock(key):
+            cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=lookback_days)
+
+            if key in self.memory and time.time() - self.last_refresh[key] < self.max_age_seconds:
+                cached = self.memory[key]
+                return cached[cached['date'] >= cutoff].reset_index(drop=True)
+
+            cached = self._load(symbol, interval)
+            if cached.empty:
+                new_candles = client.get_historical_klines(symbol, interval, f"{lookback_days} day ago UTC")
+                logging.debug(f"Candle cache miss {symbol} {interval}: downloaded {len(new_candles)} bars")
+            else:
+                last_open_ms = int(cached['date'].iloc[-1].replace(tzinfo=timezone.utc).timestamp() * 1000)
+                new_candles = client.get_historical_klines(symbol, interval, last_open_ms)
+                logging.debug(f"Candle cache hit {symbol} {interval}: downloaded {len(new_candles)} new bars")
+
+            if new_candles:
+                new_df = self.transform(new_candles)
+                df = new_df if cached.empty else pd.concat([cached, new_df], ignore_index=True)
+                df = df.drop_duplicates(subset='date', keep='last')
+            else:
+                df = cached
+            df = df[df['date'] >= cutoff].sort_values('date').reset_index(drop=True)
+
+            self._save(symbol, interval, df)
+            self.memory[key] = df
+            self.last_refresh[key] = time.time()
+            return df.copy()
+
+    def clear_memory(self):
+        self.memory = {}
+        self.last_refresh = {}
@@ -19,7 +19,9 @@ class SimpleSMAStrategy(TestStrategy):
 
     def get_indicators(self, df):
         # Calculate SMA20 of stock
+        laps = self.profiler.laps()
         df['price_SMA'] = df['close'].rolling(window=self.price_sma_window).mean()
+        laps.lap('price SMA')
         return df
     
     def get_extra_indicators(self, df):
@@ -64,23 +66,23 @@ class SimpleSMAStrategy(TestStrategy):
             
     def stepwise_logic_close(self, trade_candle_df_slices, order_index):
         order = self.open_orders_df.iloc[order_index]
-        open_price = order['price'] 
+        is_short = order.get('side') == 'SHORT'
         curr_candle = trade_candle_df_slices.iloc[-1]
         prev_candle = trade_candle_df_slices.iloc[-2]
         current_price = curr_candle['open'] 
-        profit_percentage = (current_price - open_price) / open_price  
+        profit_percentage = self.profit_percentage(order, current_price)
         
-        # Update high_since_open using current price
-        self.open_orders_df.at[order_index, 'high_since_open'] = max(current_price, order['high_since_open'])
-        high_since_open = self.open_orders_df.at[order_index, 'high_since_open']
+        # Update high/low since open using current price
+        self._update_since_open(order_index, current_price)
         
         """LOGIC"""
         close_reason = ""
         close_conditions = [
             (profit_percentage <= self.stoploss_threshold, f"Stop loss hit (P%: {profit_percentage:.1%})"),
             (profit_percentage >= self.profit_threshold, f"Profit target met (P%: {profit_percentage:.1%})"),
-            (current_price <= high_since_open * (1 - self.max_high_retrace) and profit_percentage > 0, f"Price retraced but profitable"),
-            (curr_candle['open'] < curr_candle['price_SMA'], f"Price < SMA"),
+            (self.is_retraced(order_index, current_price) and profit_percentage > 0, f"Price retraced but profitable"),
+            (curr_candle['open'] > curr_candle['price_SMA'] if is_short else curr_candle['open'] < curr_candle['price_SMA'],
+             f"Price > SMA" if is_short else f"Price < SMA"),
         ]
         """LOGIC ENDS"""
         
@@ -91,11 +93,7 @@ class SimpleSMAStrategy(TestStrategy):
             
         if close_reason:
             execution_time = curr_candle['date']
-            symbol = order['symbol']
-            price = curr_candle['open']
-            quantity = order['quantity']
-            tlt_dollar = price * quantity
-            self.sell(quantity, execution_time, symbol, tlt_dollar*(1-self.commission_pct), current_price)
+            self.close_position(order, execution_time, current_price)
             self.open_orders_df.at[order_index, 'status'] = 'CLOSED'
             self.open_orders_df.at[order_index, 'close_reason'] = close_reason
             self.open_orders_df.at[order_index, 'profit_percentage'] = f"{profit_percentage:.2%}"
@@ -131,34 +129,41 @@ class StoneWellStrategy(TestStrategy):
         self.kc_mult = kc_mult
         
     def get_indicators(self, df):
+        laps = self.profiler.laps()
         # Calculate RSI
         delta = df['close'].diff()
         gain = (delta.where(delta > 0, 0)).rolling(window=self.rsi_window).mean()
         loss = (-delta.where(delta < 0, 0)).rolling(window=self.rsi_window).mean()
         rs = gain / loss
         df['RSI'] = 100 - (100 / (1 + rs))
+        laps.lap('RSI')
 
         # Calculate SMA20 of RSI14
         df['RSI_SMA'] = df['RSI'].rolling(window=self.rsi_sma_window).mean()
+        laps.lap('RSI SMA')
         
         # Calculate RSI 2 
         gain_2 = (delta.where(delta > 0, 0)).rolling(window=self.rsi_window_2).mean()
         loss_2 = (-delta.where(delta < 0, 0)).rolling(window=self.rsi_window_2).mean()
         rs_2 = gain_2 / loss_2
         df['RSI_2'] = 100 - (100 / (1 + rs_2))
+        laps.lap('RSI 2')
 
         # Calculate SMA20 of stock
         df['close_SMA'] = df['close'].rolling(window=self.price_sma_window).mean()
         df['close_short_SMA'] = df['close'].rolling(window=self.short_sma_window).mean()
         df['close_long_SMA'] = df['close'].rolling(window=self.long_sma_window).mean()
+        laps.lap('price SMAs')
 
         # Calculate SMA10 and SMA20 of volume
         df['volume_short_SMA'] = df['volume'].rolling(window=self.volume_short_sma_window).mean()
         df['volume_long_SMA'] = df['volume'].rolling(window=self.volume_long_sma_window).mean()
+        laps.lap('volume SMAs')
 
         # Calculate EMA 12 and 26
         df['EMA_12'] = df['close'].ewm(span=12, adjust=False).mean()
         df['EMA_26'] = df['close'].ewm(span=26, adjust=False).mean()
+        laps.lap('EMA')
 
          # Calculate Average True Range (ATR)
         df['high_low'] = df['high'] - df['low']
@@ -166,6 +171,7 @@ class StoneWellStrategy(TestStrategy):
         df['low_close'] = abs(df['low'] - df['close'].shift())
         df['true_range'] = pd.concat([df['high_low'], df['high_close'], df['low_close']], axis=1).max(axis=1)
         df['ATR'] = df['true_range'].rolling(window=self.atr_window).mean()
+        laps.lap('ATR')
 
         # Calculate Keltner Channels
         df['KC_middle'] = df['close'].rolling(window=self.kc_sma_window).mean()
@@ -173,6 +179,7 @@ class StoneWellStrategy(TestStrategy):
         df['KC_lower'] = df['KC_middle'] - (df['ATR'] * self.kc_mult)
         # Calculate KC_position
         df['KC_position'] = (df['close'] - df['KC_lower']).clip(lower=0) / (df['KC_upper'] - df['KC_lower'])
+        laps.lap('Keltner Channels')
         return df
     
     def get_extra_indicators(self, df):
@@ -218,15 +225,13 @@ class StoneWellStrategy(TestStrategy):
             
     def stepwise_logic_close(self, trade_candle_df_slices, order_index):
         order = self.open_orders_df.iloc[order_index]
-        open_price = order['price'] 
         curr_candle = trade_candle_df_slices.iloc[-1]
         prev_candle = trade_candle_df_slices.iloc[-2]
         current_price = curr_candle['open'] 
-        profit_percentage = (current_price - open_price) / open_price  
+        profit_percentage = self.profit_percentage(order, current_price)
         
-        # Update high_since_open using current price
-        self.open_orders_df.at[order_index, 'high_since_open'] = max(current_price, order['high_since_open'])
-        high_since_open = self.open_orders_df.at[order_index, 'high_since_open']
+        # Update high/low since open using current price
+        self._update_since_open(order_index, current_price)
         
         close_reason = ""
         if profit_percentage <= self.stoploss_threshold:
@@ -241,7 +246,7 @@ class StoneWellStrategy(TestStrategy):
         #     close_reason = f"MACD crossed below"
         # elif curr_candle['KC_position'] > 1.3:
         #     close_reason = f"KC position > 1.3"
-        elif current_price <= high_since_open * (1 - self.max_high_retrace) and profit_percentage > 0:
+        elif self.is_retraced(order_index, current_price) and profit_percentage > 0:
             close_reason = f"Price retraced but profitable"
         # elif curr_candle['volume'] < curr_candle['volume_long_SMA']:
         #     close_reason = f"Volume < Long SMA"
@@ -257,11 +262,7 @@ class StoneWellStrategy(TestStrategy):
         #     close_reason = f"Vol Short SMA < Long SMA"
         if close_reason:
             execution_time = curr_candle['date']
-            symbol = order['symbol']
-            price = curr_candle['open']
-            quantity = order['quantity']
-            tlt_dollar = price * quantity
-            self.sell(quantity, execution_time, symbol, tlt_dollar*(1-self.commission_pct), current_price)
+            self.close_position(order, execution_time, current_price)
             self.open_orders_df.at[order_index, 'status'] = 'CLOSED'
             self.open_orders_df.at[order_index, 'close_reason'] = close_reason
             self.open_orders_df.at[order_index, 'profit_percentage'] = f"{profit_percentage:.2%}"
@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import logging
+from decimal import Decimal, ROUND_DOWN
+
+
+def _floor_to_step(value, step):
+    if not step:
+        return float(value)
+    return float((Decimal(str(value)) / step).to_integral_value(rounding=ROUND_DOWN) * step)
+
+
+def parse_symbol_filters(exchange_info):
+    '''symbol -> status, step_size, min_qty, tick_size, min_notional from one exchangeInfo response'''
+    filters = {}
+    for symbol_info in exchange_info['symbols']:
+        symbol_filters = {f['filterType']: f for f in symbol_info['filters']}
+        lot_size = symbol_filters.get('LOT_SIZE', {})
+        market_lot_size = symbol_filters.get('MARKET_LOT_SIZE', {})
+        price_filter = symbol_filters.get('PRICE_FILTER', {})
+        notional = symbol_filters.get('NOTIONAL') or symbol_filters.get('MIN_NOTIONAL') or {}
+
+        # market orders use MARKET_LOT_SIZE when binance sets one, zero means fall back to LOT_SIZE
+        step_size = Decimal(lot_size.get('stepSize', '0'))
+        if Decimal(market_lot_size.get('stepSize', '0')) > 0:
+            step_size = max(step_size, Decimal(market_lot_size['stepSize']))
+
+        filters[symbol_info['symbol']] = {
+            'status': symbol_info.get('status', 'TRADING'),
+            'step_size': step_size.normalize(),
+            'min_qty': float(lot_size.get('minQty', 0)),
+            'tick_size': Decimal(price_filter.get('tickSize', '0')).normalize(),
+            'min_notional': float(notional.get('minNotional', 0)),
+        }
+    return filters
+
+
+class SymbolFilterCache:
+    '''
+    LOT_SIZE, PRICE_FILTER and NOTIONAL filters of every symbol from a single exchangeInfo snapshot.
+    The snapshot is kept on disk and only refetched once it is older than ttl_seconds.
+    '''
+
+    def __init__(self, cache_file, ttl_seconds=6 * 60 * 60):
+        self.cache_file = cache_file
+        self.ttl_seconds = ttl_seconds
+        self.filters = {}
+        self.fetched_at = 0
+
+    def _load_file(self):
+        if not os.path.exists(self.cache_file):
+            return False
+        try:
+            with open(self.cache_file, 'r') as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Unreadable exchange info cache {self.cache_file}: {e}")
+            return False
+        self.filters = parse_symbol_filters(snapshot['exchange_info'])
+        self.fetched_at = snapshot['fetched_at']
+        return True
+
+    def refresh(self, client):
+        exchange_info = client.get_exchange_info()
+        self.filters = parse_symbol_filters(exchange_info)
+        self.fetched_at = time.time()
+        os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'w') as file:
+            json.dump({'fetched_at': self.fetched_at, 'exchange_info': exchange_info}, file)
+        os.replace(tmp_file, self.cache_file)
+        logging.info(f"Refreshed exchange filters for {len(self.filters)} symbols.")
+
+    def ensure_fresh(self, client=None):
+        '''load the local snapshot, refetching with client when it is missing or past the ttl'''
+        if not self.filters:
+            self._load_file()
+        if time.time() - self.fetched_at >= self.ttl_seconds:
+            if client is not None:
+                self.refresh(client)
+            elif self.filters:
+                logging.warning(f"Exchange filters are {time.time() - self.fetched_at:.0f}s old, no client to refresh.")
+        if not self.filters:
+            raise ValueError(f"No exchange filters loaded from {self.cache_file}")
+
+    def round_qty(self, symbol, qty):
+        return _floor_to_step(qty, self.filters[symbol]['step_size'])
+
+    def round_price(self, symbol, price):
+        return _floor_to_step(price, self.filters[symbol]['tick_size'])
+
+    def is_tradable(self, symbol, qty, price):
+        '''the symbol is TRADING (not e.g. BREAK or delisted) and qty (already rounded) passes LOT_SIZE min qty
+        and NOTIONAL min notional'''
+        symbol_filters = self.filters[symbol]
+        return (symbol_filters['status'] == 'TRADING' and qty >= symbol_filters['min_qty']
+                and qty * price >= symbol_filters['min_notional'])
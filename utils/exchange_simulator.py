@@ -0,0 +1,447 @@
+import os
+import time
+import math
+import logging
+import threading
+from decimal import Decimal
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+import numpy as np
+import pandas as pd
+from binance.enums import *
+from utils.exchange_filters import parse_symbol_filters
+
+'''
+Local stand-in for the binance REST endpoints the bot uses, for load tests without real orders.
+SimulatedBinanceClient replays stored candles, fills market orders with a latency and slippage model and
+enforces the request weight and order count limits. It has the method names of binance.client.Client,
+so it can be passed anywhere a Client is (PairsTradingContext, PairOrderExecutor, get_bn_data, BinanceProductionStrategy).
+'''
+
+API_URL = 'https://api.binance.com'
+# path -> (limit header, weight), weights as listed in the binance api docs
+ENDPOINT_WEIGHTS = {
+    '/api/v3/klines': ('x-mbx-used-weight-1m', 2),
+    '/api/v3/exchangeInfo': ('x-mbx-used-weight-1m', 20),
+    '/api/v3/ticker/price': ('x-mbx-used-weight-1m', 4),
+    '/api/v3/account': ('x-mbx-used-weight-1m', 20),
+    '/api/v3/order': ('x-mbx-used-weight-1m', 1),
+    '/sapi/v1/margin/order': ('x-sapi-used-uid-weight-1m', 6),
+    '/sapi/v1/margin/loan': ('x-sapi-used-uid-weight-1m', 3000),
+    '/sapi/v1/margin/repay': ('x-sapi-used-uid-weight-1m', 3000),
+    '/sapi/v1/margin/loan/details': ('x-sapi-used-ip-weight-1m', 10),
+}
+# limit header -> (limit, window seconds)
+RATE_LIMITS = {
+    'x-mbx-used-weight-1m': (6000, 60),
+    'x-mbx-order-count-10s': (50, 10),
+    'x-sapi-used-ip-weight-1m': (12000, 60),
+    'x-sapi-used-uid-weight-1m': (180000, 60),
+}
+ORDER_PATHS = ('/api/v3/order', '/sapi/v1/margin/order')
+KLINES_LIMIT = 1000
+MIN_NOTIONAL = 5
+TAKER_COMMISSION = 0.001
+SIM_QUOTE_ASSET = 'USDT'
+
+
+class SimulatedAPIError(Exception):
+    '''raised like binance.exceptions.BinanceAPIException, with status_code, code and message'''
+
+    def __init__(self, status_code, code, message):
+        super().__init__(f'APIError(code={code}): {message}')
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+
+
+class SimulatedResponse:
+    '''what client.response holds after a call, only status and headers are filled in'''
+
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+def _interval_ms(interval):
+    unit = {'m': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}[interval[-1]]
+    return int(interval[:-1]) * unit * 1000
+
+
+def _parse_time_ms(value, now_ms):
+    '''ms, a date string or "<n> day(s)/hour(s) ago UTC" as get_historical_klines accepts them'''
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    words = str(value).lower().split()
+    if len(words) >= 3 and words[2] == 'ago':
+        unit_ms = {'minute': 60_000, 'hour': 3_600_000, 'day': 86_400_000, 'week': 7 * 86_400_000}
+        return now_ms - int(float(words[0]) * unit_ms[words[1].rstrip('s')])
+    return int(pd.Timestamp(value).value // 10 ** 6)
+
+
+def _step_str(value):
+    return format(Decimal(repr(value)).normalize(), 'f')
+
+
+class SimulatedBinanceClient:
+    '''
+    candles: {symbol: df with date, open, high, low, close, volume} at one base interval, e.g. from
+    SyntheticMarket.iter_symbol_frames or CandleCache files. Coarser klines are aggregated from it.
+    The clock starts at replay_start (default the last candle) shifted to today, so the candle cache
+    lookbacks work as live. It runs at speed times the wall clock and advance() jumps it forward, e.g. a
+    cron interval per load test tick.
+    Requests sleep latency_ms +- latency_jitter_ms (orders another order_latency_ms), market orders fill
+    at the price of the current bar plus slippage_bps and a square root impact on the bar's quote volume.
+    '''
+
+    API_URL = API_URL
+
+    def __init__(self, candles, replay_start=None, speed=1.0, balances=None, margin_balances=None,
+                 latency_ms=0.0, latency_jitter_ms=0.0, order_latency_ms=0.0,
+                 slippage_bps=2.0, impact=0.1, commission=TAKER_COMMISSION,
+                 rate_limits=RATE_LIMITS, seed=0):
+        self.lock = threading.RLock()
+        self.rng = np.random.default_rng(seed)
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.order_latency_ms = order_latency_ms
+        self.slippage_bps = slippage_bps
+        self.impact = impact
+        self.commission = commission
+        self.rate_limits = rate_limits
+        self.used = {}  # limit header -> (window start, used)
+        self.calls = {}  # path -> requests
+        self.response = None
+
+        last_date = max(df['date'].iloc[-1] for df in candles.values())
+        replay_start = pd.Timestamp(replay_start) if replay_start is not None else last_date
+        # whole days so daily bars stay on midnight
+        today = pd.Timestamp(datetime.now(timezone.utc).replace(tzinfo=None)).floor('1D')
+        self.shift_ms = int((today - replay_start.floor('1D')).value // 10 ** 6)
+        self.clock_ms = int(replay_start.value // 10 ** 6) + self.shift_ms
+        self.speed = speed
+        self.wall_start = time.monotonic()
+
+        self.bars = {}
+        for symbol, df in candles.items():
+            open_ms = df['date'].to_numpy().astype('datetime64[ms]').astype(np.int64) + self.shift_ms
+            self.bars[symbol] = {'open_ms': open_ms,
+                                 **{col: df[col].to_numpy(dtype=np.float64)
+                                    for col in ('open', 'high', 'low', 'close', 'volume')}}
+        first = next(iter(self.bars.values()))['open_ms']
+        self.base_ms = int(np.median(np.diff(first[:1000]))) if len(first) > 1 else 60_000
+        self.aggregated = {}
+
+        self.exchange_info = self._build_exchange_info()
+        self.filters = parse_symbol_filters(self.exchange_info)
+        self.balances = {SIM_QUOTE_ASSET: 100_000.0} if balances is None else dict(balances)
+        self.margin_balances = {SIM_QUOTE_ASSET: 100_000.0} if margin_balances is None else dict(margin_balances)
+        self.borrowed = {}
+        self.loans = {}
+        self.orders = []
+        self.next_id = 1
+
+    @classmethod
+    def from_candle_folder(cls, folder, interval, **kwargs):
+        '''CandleCache style files <symbol>_<interval>.csv, e.g. written by make_synthetic_data.py --candle-cache'''
+        suffix = f'_{interval}.csv'
+        candles = {file_name[:-len(suffix)]: pd.read_csv(os.path.join(folder, file_name), parse_dates=['date'])
+                   for file_name in sorted(os.listdir(folder)) if file_name.endswith(suffix)}
+        return cls(candles, **kwargs)
+
+    # clock
+    def now_ms(self):
+        return self.clock_ms + int((time.monotonic() - self.wall_start) * self.speed * 1000)
+
+    def now(self):
+        return pd.Timestamp(self.now_ms(), unit='ms')
+
+    def advance(self, seconds):
+        '''jump the clock forward'''
+        with self.lock:
+            self.clock_ms += int(seconds * 1000)
+
+    # market data
+    def _aggregate(self, symbol, interval_ms):
+        key = (symbol, interval_ms)
+        if key not in self.aggregated:
+            bars = self.bars[symbol]
+            if interval_ms <= self.base_ms:
+                self.aggregated[key] = bars
+            else:
+                bucket = bars['open_ms'] // interval_ms * interval_ms
+                starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+                self.aggregated[key] = {
+                    'open_ms': bucket[starts],
+                    'open': bars['open'][starts],
+                    'high': np.maximum.reduceat(bars['high'], starts),
+                    'low': np.minimum.reduceat(bars['low'], starts),
+                    'close': bars['close'][np.r_[starts[1:] - 1, len(bucket) - 1]],
+                    'volume': np.add.reduceat(bars['volume'], starts),
+                    'first_row': starts,
+                }
+        return self.aggregated[key]
+
+    def _klines(self, symbol, interval, start_ms=None, end_ms=None, limit=500):
+        if symbol not in self.bars:
+            raise SimulatedAPIError(400, -1121, 'Invalid symbol.')
+        interval_ms = _interval_ms(interval)
+        now_ms = self.now_ms()
+        agg = self._aggregate(symbol, interval_ms)
+        end_ms = now_ms if end_ms is None else min(end_ms, now_ms)
+        hi = np.searchsorted(agg['open_ms'], end_ms, side='right')
+        lo = max(hi - limit, 0) if start_ms is None else np.searchsorted(agg['open_ms'], start_ms, side='left')
+        hi = min(hi, lo + limit)
+        base = self.bars[symbol]
+        klines = []
+        for i in range(lo, hi):
+            open_ms = int(agg['open_ms'][i])
+            o, h, l, c, v = (agg[col][i] for col in ('open', 'high', 'low', 'close', 'volume'))
+            if open_ms + interval_ms > now_ms:
+                # still forming: the base bars closed so far plus the current one cut at now, as _price sees it
+                last = np.searchsorted(base['open_ms'], now_ms, side='right') - 1
+                first = agg['first_row'][i] if 'first_row' in agg else last
+                _, h, l, c, v = self._forming_bar(symbol, last, now_ms)
+                if last > first:
+                    h = max(h, base['high'][first:last].max())
+                    l = min(l, base['low'][first:last].min())
+                    v += base['volume'][first:last].sum()
+            klines.append([open_ms, f'{o:.8f}', f'{h:.8f}', f'{l:.8f}', f'{c:.8f}', f'{v:.8f}',
+                           open_ms + interval_ms - 1, f'{v * c:.8f}', 0, '0', '0', '0'])
+        return klines
+
+    def _forming_bar(self, symbol, i, now_ms):
+        '''base bar i cut at now_ms: open, high, low, close, volume with the interpolated price as its close'''
+        bars = self.bars[symbol]
+        frac = min((now_ms - bars['open_ms'][i]) / self.base_ms, 1.0)
+        o = bars['open'][i]
+        c = o + (bars['close'][i] - o) * frac
+        if frac >= 1.0:
+            return o, bars['high'][i], bars['low'][i], bars['close'][i], bars['volume'][i]
+        return o, max(o, c), min(o, c), c, bars['volume'][i] * frac
+
+    def _price(self, symbol):
+        '''price now, interpolated between open and close of the current base bar; and the bar's quote volume'''
+        bars = self.bars[symbol]
+        now_ms = self.now_ms()
+        i = np.searchsorted(bars['open_ms'], now_ms, side='right') - 1
+        if i < 0:
+            raise SimulatedAPIError(400, -1121, f'No trading in {symbol} yet.')
+        price = self._forming_bar(symbol, i, now_ms)[3]
+        return float(price), float(bars['volume'][i] * bars['close'][i])
+
+    def _build_exchange_info(self):
+        symbols = []
+        for symbol, bars in self.bars.items():
+            price = bars['close'][np.searchsorted(bars['open_ms'], self.clock_ms, side='right') - 1]
+            # about $0.5 per lot step and 5 significant digits of price
+            step = 10.0 ** max(math.floor(math.log10(0.5 / price)), -8)
+            tick = 10.0 ** max(math.floor(math.log10(price)) - 4, -8)
+            symbols.append({
+                'symbol': symbol, 'status': 'TRADING', 'baseAsset': symbol[:-len(SIM_QUOTE_ASSET)],
+                'quoteAsset': SIM_QUOTE_ASSET, 'isMarginTradingAllowed': True,
+                'filters': [
+                    {'filterType': 'PRICE_FILTER', 'minPrice': _step_str(tick), 'maxPrice': '1000000',
+                     'tickSize': _step_str(tick)},
+                    {'filterType': 'LOT_SIZE', 'minQty': _step_str(step), 'maxQty': '90000000000',
+                     'stepSize': _step_str(step)},
+                    {'filterType': 'MARKET_LOT_SIZE', 'minQty': '0', 'maxQty': '90000000000', 'stepSize': '0'},
+                    {'filterType': 'NOTIONAL', 'minNotional': str(MIN_NOTIONAL), 'applyMinToMarket': True},
+                ]})
+        rate_limits = [{'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1,
+                        'limit': RATE_LIMITS['x-mbx-used-weight-1m'][0]},
+                       {'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 10,
+                        'limit': RATE_LIMITS['x-mbx-order-count-10s'][0]}]
+        return {'timezone': 'UTC', 'serverTime': self.clock_ms, 'rateLimits': rate_limits, 'symbols': symbols}
+
+    # request path
+    def _use_weight(self, header, weight):
+        limit, window = self.rate_limits[header]
+        window_start = int(time.time() // window * window)
+        started, used = self.used.get(header, (window_start, 0))
+        used = used if started == window_start else 0
+        if used + weight > limit:
+            raise SimulatedAPIError(429, -1003, f'Too many requests; {header} {used}/{limit}.')
+        self.used[header] = (window_start, used + weight)
+        return used + weight
+
+    def _request(self, method, uri, signed, force_params=False, **kwargs):
+        '''same signature as Client._request, so BotMetrics.instrument_client counts simulated calls too'''
+        path = urlparse(uri).path
+        params = kwargs.get('params') or kwargs.get('data') or {}
+        header, weight = ENDPOINT_WEIGHTS[path]
+        is_order = path in ORDER_PATHS and method == 'post'
+        with self.lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+            latency = self.latency_ms + self.latency_jitter_ms * self.rng.uniform(-1, 1)
+            if is_order:
+                latency += self.order_latency_ms
+            try:
+                headers = {header: str(self._use_weight(header, weight))}
+                if is_order:
+                    headers['x-mbx-order-count-10s'] = str(self._use_weight('x-mbx-order-count-10s', 1))
+            except SimulatedAPIError as e:
+                self.response = SimulatedResponse(e.status_code, {})
+                raise
+        if latency > 0:
+            time.sleep(latency / 1000)
+        with self.lock:
+            result = self._handle(method, path, params)
+            self.response = SimulatedResponse(200, headers)
+            return result
+
+    def _handle(self, method, path, params):
+        if path == '/api/v3/klines':
+            return self._klines(params['symbol'], params['interval'], params.get('startTime'),
+                                params.get('endTime'), params.get('limit', 500))
+        if path == '/api/v3/exchangeInfo':
+            return self.exchange_info
+        if path == '/api/v3/ticker/price':
+            return [{'symbol': symbol, 'price': f'{self._price(symbol)[0]:.8f}'} for symbol in self.bars]
+        if path == '/api/v3/account':
+            return {'balances': [{'asset': asset, 'free': f'{free:.8f}', 'locked': '0.00000000'}
+                                 for asset, free in self.balances.items()]}
+        if path == '/api/v3/order':
+            return self._fill(params['symbol'], params['side'], params['quantity'], self.balances)
+        if path == '/sapi/v1/margin/order':
+            return self._fill(params['symbol'], params['side'], params['quantity'], self.margin_balances)
+        if path == '/sapi/v1/margin/loan' and method == 'post':
+            return self._borrow(params['asset'], float(params['amount']))
+        if path == '/sapi/v1/margin/repay':
+            return self._repay(params['asset'], float(params['amount']))
+        if path == '/sapi/v1/margin/loan/details':
+            loan = self.loans.get(int(params['txId']))
+            rows = [loan] if loan is not None and loan['asset'] == params['asset'] else []
+            return {'rows': rows, 'total': len(rows)}
+        raise SimulatedAPIError(404, -1, f'{method.upper()} {path} is not simulated.')
+
+    # orders and loans
+    def _check_filters(self, symbol, quantity, price):
+        symbol_filters = self.filters[symbol]
+        if Decimal(str(quantity)) % symbol_filters['step_size'] != 0 or quantity < symbol_filters['min_qty']:
+            raise SimulatedAPIError(400, -1013, 'Filter failure: LOT_SIZE')
+        if quantity * price < symbol_filters['min_notional']:
+            raise SimulatedAPIError(400, -1013, 'Filter failure: NOTIONAL')
+
+    def _fill(self, symbol, side, quantity, balances):
+        quantity = float(quantity)
+        price, bar_quote_volume = self._price(symbol)
+        self._check_filters(symbol, quantity, price)
+        notional = quantity * price
+        slippage = self.slippage_bps / 1e4 + self.impact * math.sqrt(notional / max(bar_quote_volume, 1e-9))
+        fill_price = price * (1 + slippage) if side == SIDE_BUY else price * (1 - slippage)
+        quote_qty = quantity * fill_price
+        commission = quote_qty * self.commission  # charged in the quote asset to keep balances simple
+        base_asset = symbol[:-len(SIM_QUOTE_ASSET)]
+        if side == SIDE_BUY:
+            if balances.get(SIM_QUOTE_ASSET, 0) < quote_qty + commission:
+                raise SimulatedAPIError(400, -2010, 'Account has insufficient balance for requested action.')
+            balances[SIM_QUOTE_ASSET] -= quote_qty + commission
+            balances[base_asset] = balances.get(base_asset, 0) + quantity
+        else:
+            if balances.get(base_asset, 0) < quantity - 1e-12:
+                raise SimulatedAPIError(400, -2010, 'Account has insufficient balance for requested action.')
+            balances[base_asset] -= quantity
+            balances[SIM_QUOTE_ASSET] = balances.get(SIM_QUOTE_ASSET, 0) + quote_qty - commission
+
+        order_id = self.next_id
+        self.next_id += 1
+        order = {'symbol': symbol, 'orderId': order_id, 'clientOrderId': f'sim{order_id}',
+                 'transactTime': self.now_ms(), 'price': '0.00000000', 'origQty': f'{quantity:.8f}',
+                 'executedQty': f'{quantity:.8f}', 'cummulativeQuoteQty': f'{quote_qty:.8f}',
+                 'status': ORDER_STATUS_FILLED, 'timeInForce': 'GTC', 'type': ORDER_TYPE_MARKET, 'side': side,
+                 'fills': [{'price': f'{fill_price:.8f}', 'qty': f'{quantity:.8f}',
+                            'commission': f'{commission:.8f}', 'commissionAsset': SIM_QUOTE_ASSET}]}
+        self.orders.append(order)
+        return order
+
+    def _borrow(self, asset, amount):
+        tran_id = self.next_id
+        self.next_id += 1
+        self.loans[tran_id] = {'asset': asset, 'principal': f'{amount:.8f}', 'timestamp': self.now_ms(),
+                               'status': 'CONFIRMED', 'txId': tran_id}
+        self.borrowed[asset] = self.borrowed.get(asset, 0) + amount
+        self.margin_balances[asset] = self.margin_balances.get(asset, 0) + amount
+        return {'tranId': tran_id}
+
+    def _repay(self, asset, amount):
+        if self.margin_balances.get(asset, 0) < amount - 1e-12:
+            raise SimulatedAPIError(400, -3041, 'Balance is not enough')
+        self.margin_balances[asset] -= amount
+        self.borrowed[asset] = max(self.borrowed.get(asset, 0) - amount, 0)
+        tran_id = self.next_id
+        self.next_id += 1
+        return {'tranId': tran_id}
+
+    # binance.client.Client methods the bot calls
+    def get_klines(self, **params):
+        return self._request('get', f'{API_URL}/api/v3/klines', False, params=params)
+
+    def get_historical_klines(self, symbol, interval, start_str=None, end_str=None, limit=KLINES_LIMIT):
+        '''pages of at most KLINES_LIMIT bars, each page one klines request as in python-binance'''
+        now_ms = self.now_ms()
+        start_ms = _parse_time_ms(start_str, now_ms)
+        end_ms = _parse_time_ms(end_str, now_ms)
+        klines = []
+        while True:
+            params = {'symbol': symbol, 'interval': interval, 'limit': limit}
+            if start_ms is not None:
+                params['startTime'] = start_ms
+            if end_ms is not None:
+                params['endTime'] = end_ms
+            page = self.get_klines(**params)
+            klines.extend(page)
+            if len(page) < limit:
+                return klines
+            start_ms = page[-1][0] + 1
+
+    def get_exchange_info(self):
+        return self._request('get', f'{API_URL}/api/v3/exchangeInfo', False)
+
+    def get_all_tickers(self):
+        return self._request('get', f'{API_URL}/api/v3/ticker/price', False)
+
+    def get_account(self):
+        return self._request('get', f'{API_URL}/api/v3/account', True)
+
+    def get_asset_balance(self, asset):
+        for balance in self.get_account()['balances']:
+            if balance['asset'] == asset.upper():
+                return balance
+        return None
+
+    def create_order(self, **params):
+        if params.get('type', ORDER_TYPE_MARKET) != ORDER_TYPE_MARKET:
+            raise SimulatedAPIError(400, -1116, 'Only market orders are simulated.')
+        return self._request('post', f'{API_URL}/api/v3/order', True, data=params)
+
+    def order_market_buy(self, **params):
+        return self.create_order(side=SIDE_BUY, type=ORDER_TYPE_MARKET, **params)
+
+    def order_market_sell(self, **params):
+        return self.create_order(side=SIDE_SELL, type=ORDER_TYPE_MARKET, **params)
+
+    def create_margin_order(self, **params):
+        if params.get('type', ORDER_TYPE_MARKET) != ORDER_TYPE_MARKET:
+            raise SimulatedAPIError(400, -1116, 'Only market orders are simulated.')
+        return self._request('post', f'{API_URL}/sapi/v1/margin/order', True, data=params)
+
+    def create_margin_loan(self, **params):
+        return self._request('post', f'{API_URL}/sapi/v1/margin/loan', True, data=params)
+
+    def repay_margin_loan(self, **params):
+        return self._request('post', f'{API_URL}/sapi/v1/margin/repay', True, data=params)
+
+    def get_margin_loan_details(self, **params):
+        return self._request('get', f'{API_URL}/sapi/v1/margin/loan/details', True, params=params)
+
+    def close_connection(self):
+        pass
+
+    def summary(self):
+        '''orders filled and balances, for the end of a load test'''
+        with self.lock:
+            return {'orders': len(self.orders), 'balances': dict(self.balances),
+                    'margin_balances': dict(self.margin_balances), 'borrowed': dict(self.borrowed)}
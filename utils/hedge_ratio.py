@@ -0,0 +1,161 @@
+import json
+import sqlite3
+import logging
+import threading
+import numpy as np
+from utils.kline_stream import to_epoch_ms
+
+# rls: weight of a bar halves after ~700 bars (about two months of 2h bars)
+RLS_FORGETTING = 0.999
+RLS_INIT_VAR = 1.0
+# kalman: how fast the ratio may drift per bar vs measurement noise of the spread
+KALMAN_DELTA = 1e-5
+KALMAN_OBS_VAR = 1e-3
+# bars replayed the first time a pair is seen, starting from its coin_signal ratio
+HEDGE_WARMUP_BARS = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hedge_ratios (
+    pair TEXT NOT NULL,
+    method TEXT NOT NULL,
+    last_bar_ms INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (pair, method)
+);
+"""
+
+
+class RLSHedgeRatio:
+    '''
+    Recursive least squares of y = constant + coeff * x with a forgetting factor.
+    Works on a batch of pairs at once: theta is P x 2 (constant, coeff), cov is P x 2 x 2.
+    Each new bar is one O(1) update per pair.
+    '''
+    name = 'rls'
+
+    def __init__(self, forgetting=RLS_FORGETTING, init_var=RLS_INIT_VAR):
+        self.forgetting = forgetting
+        self.init_var = init_var
+
+    def init_state(self, constant, coeff):
+        theta = np.column_stack([constant, coeff]).astype(np.float64)
+        cov = np.tile(np.eye(2) * self.init_var, (len(theta), 1, 1))
+        return theta, cov
+
+    def _gain(self, cov, x):
+        '''P h and h' P h for h = (1, x)'''
+        cov_h = cov[:, :, 0] + cov[:, :, 1] * x[:, None]
+        return cov_h, cov_h[:, 0] + cov_h[:, 1] * x
+
+    def update(self, theta, cov, y, x):
+        cov_h, h_cov_h = self._gain(cov, x)
+        gain = cov_h / (self.forgetting + h_cov_h)[:, None]
+        error = y - theta[:, 0] - theta[:, 1] * x
+        theta = theta + gain * error[:, None]
+        cov = (cov - gain[:, :, None] * cov_h[:, None, :]) / self.forgetting
+        return theta, cov
+
+
+class KalmanHedgeRatio(RLSHedgeRatio):
+    '''
+    Kalman filter with (constant, coeff) as a random walk state and y as the observation.
+    Same batch layout as RLSHedgeRatio.
+    '''
+    name = 'kalman'
+
+    def __init__(self, delta=KALMAN_DELTA, obs_var=KALMAN_OBS_VAR, init_var=RLS_INIT_VAR):
+        self.state_var = delta / (1 - delta)
+        self.obs_var = obs_var
+        self.init_var = init_var
+
+    def update(self, theta, cov, y, x):
+        cov = cov + np.eye(2) * self.state_var
+        cov_h, h_cov_h = self._gain(cov, x)
+        gain = cov_h / (h_cov_h + self.obs_var)[:, None]
+        error = y - theta[:, 0] - theta[:, 1] * x
+        theta = theta + gain * error[:, None]
+        cov = cov - gain[:, :, None] * cov_h[:, None, :]
+        return theta, cov
+
+
+HEDGE_RATIO_ESTIMATORS = {'rls': RLSHedgeRatio, 'kalman': KalmanHedgeRatio}
+
+
+class HedgeRatioStore:
+    '''estimator state per (Y|X pair, method) in sqlite, with the open time of the last bar applied'''
+
+    def __init__(self, db_path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def load(self, pairs, method):
+        '''pair -> (last_bar_ms, theta, cov) for the pairs that have a state'''
+        states = {}
+        with self.lock:
+            for start in range(0, len(pairs), 500):
+                chunk = pairs[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT pair, last_bar_ms, state FROM hedge_ratios WHERE method = ? "
+                    f"AND pair IN ({','.join('?' * len(chunk))})", [method] + list(chunk)).fetchall()
+                for pair, last_bar_ms, state in rows:
+                    state = json.loads(state)
+                    states[pair] = (last_bar_ms, np.array(state['theta']), np.array(state['cov']))
+        return states
+
+    def save(self, pairs, method, last_bar_ms, theta, cov):
+        rows = [(pair, method, int(last_ms), json.dumps({'theta': t.tolist(), 'cov': c.tolist()}))
+                for pair, last_ms, t, c in zip(pairs, last_bar_ms, theta, cov)]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO hedge_ratios (pair, method, last_bar_ms, state) VALUES (?, ?, ?, ?)", rows)
+
+    def close(self):
+        self.conn.close()
+
+
+class OnlineHedgeRatios:
+    '''
+    Current hedge ratios for a batch of pairs from their persisted estimator state.
+    Only bars newer than each pair's last applied bar are fed in, so a scan costs one update per pair per new bar.
+    Pairs seen for the first time start from their coin_signal ratio and replay the last warmup_bars bars.
+    '''
+
+    def __init__(self, store, estimator, warmup_bars=HEDGE_WARMUP_BARS):
+        self.store = store
+        self.estimator = estimator
+        self.warmup_bars = warmup_bars
+
+    def update(self, symbols_Y, symbols_X, ols_coeff, ols_constant, dates, close, y_idx, x_idx):
+        '''
+        dates/close: the scan's T x N 2h close matrix, y_idx/x_idx the columns of each pair.
+        Returns the current (coeff, constant) arrays and saves the new states.
+        '''
+        pairs = [f'{symbol_Y}|{symbol_X}' for symbol_Y, symbol_X in zip(symbols_Y, symbols_X)]
+        theta, cov = self.estimator.init_state(ols_constant, ols_coeff)
+        bar_ms = to_epoch_ms(dates)
+        start_row = max(len(bar_ms) - 1 - self.warmup_bars, 0)
+        last_bar_ms = np.full(len(pairs), bar_ms[start_row] - 1, dtype=np.int64)
+        position = {pair: i for i, pair in enumerate(pairs)}
+        for pair, (pair_last_ms, pair_theta, pair_cov) in self.store.load(pairs, self.estimator.name).items():
+            i = position[pair]
+            last_bar_ms[i], theta[i], cov[i] = pair_last_ms, pair_theta, pair_cov
+
+        # every closed bar newer than some pair's last bar, each pair only takes its own new bars.
+        # the last row is the bar still forming, it is applied once it has closed
+        first_row = int(np.searchsorted(bar_ms, last_bar_ms.min(), side='right'))
+        for row in range(max(first_row, start_row), len(bar_ms) - 1):
+            y = close[row, y_idx]
+            x = close[row, x_idx]
+            is_new = (bar_ms[row] > last_bar_ms) & np.isfinite(y) & np.isfinite(x)
+            if not is_new.any():
+                continue
+            new_theta, new_cov = self.estimator.update(theta, cov, np.nan_to_num(y), np.nan_to_num(x))
+            theta = np.where(is_new[:, None], new_theta, theta)
+            cov = np.where(is_new[:, None, None], new_cov, cov)
+            last_bar_ms = np.where(is_new, bar_ms[row], last_bar_ms)
+
+        self.store.save(pairs, self.estimator.name, last_bar_ms, theta, cov)
+        logging.info(f"Updated {self.estimator.name} hedge ratios of {len(pairs)} pairs.")
+        return theta[:, 1], theta[:, 0]
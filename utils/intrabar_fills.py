@@ -0,0 +1,118 @@
+import logging
+import numpy as np
+import pandas as pd
+
+FIVE_MIN_TABLE = 'binance_coin_5mins_historical_price'
+
+NO_EXIT = 0
+STOP_EXIT = 1
+TARGET_EXIT = 2
+
+# which level fills when a bar's range covers both the stop and the target
+# stop: assume the worst, target: assume the best, nearest: the level closer to the bar open went first,
+# drilldown: replay the bar's 5m candles, falling back to stop when those are missing or still ambiguous
+TIE_BREAKS = ('stop', 'target', 'nearest', 'drilldown')
+
+
+def intrabar_exits(open_, high, low, stop_price, target_price, is_long, tie_break='stop'):
+    '''
+    Stop/target fills of a batch of positions against one candle each, all arrays of the same length.
+    A bar that gaps through a level fills at the open, otherwise a touched level fills at the level.
+    Returns (exit_kind, fill_price, ambiguous) where ambiguous marks bars that touched both levels.
+    '''
+    open_, high, low, stop_price, target_price = (np.asarray(a, dtype=np.float64)
+                                                  for a in (open_, high, low, stop_price, target_price))
+    is_long = np.asarray(is_long, dtype=bool)
+    # flip shorts so both sides read "stop below, target above"
+    sign = np.where(is_long, 1.0, -1.0)
+    open_s, stop_s, target_s = open_ * sign, stop_price * sign, target_price * sign
+    low_s = np.where(is_long, low, -high)
+    high_s = np.where(is_long, high, -low)
+
+    stop_gap = open_s <= stop_s
+    target_gap = open_s >= target_s
+    stop_hit = low_s <= stop_s
+    target_hit = high_s >= target_s
+    ambiguous = stop_hit & target_hit & ~stop_gap & ~target_gap
+
+    if tie_break == 'target':
+        stop_first = np.zeros(len(open_), dtype=bool)
+    elif tie_break == 'nearest':
+        stop_first = (open_s - stop_s) <= (target_s - open_s)
+    else:
+        stop_first = np.ones(len(open_), dtype=bool)
+
+    exit_kind = np.full(len(open_), NO_EXIT)
+    exit_kind[target_hit] = TARGET_EXIT
+    exit_kind[stop_hit & (~target_hit | (ambiguous & stop_first))] = STOP_EXIT
+    exit_kind[stop_gap] = STOP_EXIT
+    exit_kind[target_gap] = TARGET_EXIT
+
+    fill_price = np.full(len(open_), np.nan)
+    fill_price[exit_kind == STOP_EXIT] = stop_price[exit_kind == STOP_EXIT]
+    fill_price[exit_kind == TARGET_EXIT] = target_price[exit_kind == TARGET_EXIT]
+    gapped = stop_gap | target_gap
+    fill_price[gapped] = open_[gapped]
+    return exit_kind, fill_price, ambiguous
+
+
+class IntrabarFillModel:
+    '''
+    Fills stop loss and profit target exits at the candle high/low instead of the next open.
+    With tie_break='drilldown' the bars that touched both levels are replayed on the 5m table through conn.
+    '''
+
+    def __init__(self, tie_break='stop', conn=None, fine_table=FIVE_MIN_TABLE):
+        if tie_break not in TIE_BREAKS:
+            raise ValueError(f"tie_break must be one of {TIE_BREAKS}, got {tie_break}")
+        if tie_break == 'drilldown' and conn is None:
+            raise ValueError("drilldown tie break needs a db connection for the 5m candles")
+        self.tie_break = tie_break
+        self.conn = conn
+        self.fine_table = fine_table
+        self.drilldowns = 0
+
+    def _fine_candles(self, symbol, bar_start, bar_end):
+        query = f"""
+        SELECT date, open, high, low FROM {self.fine_table}
+        WHERE symbol = '{symbol}' AND date >= '{bar_start}' AND date < '{bar_end}'
+        ORDER BY date
+        """
+        return pd.read_sql(query, self.conn)
+
+    def _drilldown(self, symbol, bar_start, bar_end, stop_price, target_price, is_long):
+        '''first exit within the bar from its 5m candles, None when they cannot tell'''
+        fine = self._fine_candles(symbol, bar_start, bar_end)
+        self.drilldowns += 1
+        if fine.empty:
+            return None
+        n = len(fine)
+        exit_kind, fill_price, ambiguous = intrabar_exits(
+            fine['open'], fine['high'], fine['low'], np.full(n, stop_price), np.full(n, target_price),
+            np.full(n, is_long), tie_break='stop')
+        hit_rows = np.flatnonzero(exit_kind != NO_EXIT)
+        if len(hit_rows) == 0:
+            return None
+        first = hit_rows[0]
+        if ambiguous[first]:
+            logging.debug(f"{symbol} {bar_start}: both levels inside one 5m candle, filling the stop")
+        return exit_kind[first], fill_price[first], fine['date'].iloc[first]
+
+    def fills(self, symbols, bar_start, bar_end, open_, high, low, stop_price, target_price, is_long):
+        '''
+        Exits of a batch of positions, one candle each from bar_start to bar_end.
+        Returns a df with exit_kind, fill_price and fill_time per position.
+        '''
+        stop_price, target_price, is_long = np.asarray(stop_price), np.asarray(target_price), np.asarray(is_long)
+        exit_kind, fill_price, ambiguous = intrabar_exits(
+            open_, high, low, stop_price, target_price, is_long, tie_break=self.tie_break)
+        fill_time = pd.Series(pd.to_datetime(np.asarray(bar_start)))
+
+        if self.tie_break == 'drilldown':
+            for i in np.flatnonzero(ambiguous):
+                resolved = self._drilldown(symbols[i], bar_start[i], bar_end[i],
+                                           stop_price[i], target_price[i], is_long[i])
+                if resolved is not None:
+                    exit_kind[i], fill_price[i], fill_time.iloc[i] = resolved
+
+        return pd.DataFrame({'exit_kind': exit_kind, 'fill_price': fill_price, 'fill_time': fill_time})
@@ -0,0 +1,390 @@
+import os
+import time
+import threading
+import logging
+import numpy as np
+import pandas as pd
+from multiprocessing.connection import Listener, Client as ConnectionClient
+
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+# ring buffer size per interval, enough for the lookbacks used by get_bn_data
+RING_CAPACITY = {
+    '5m': 12 * 24 * 30,
+    '1h': 24 * 400,
+    '2h': 12 * 730,
+    '4h': 6 * 800,
+    '1d': 1000,
+}
+DEFAULT_RING_CAPACITY = 5000
+KLINE_DAEMON_ADDRESS = ('localhost', 6010)
+KLINE_DAEMON_AUTHKEY = os.getenv('KLINE_DAEMON_AUTHKEY', 'kline-daemon').encode()
+STREAMS_PER_SOCKET = 200
+# how often the daemon looks for buffers that fell behind or have holes and refills them over REST
+BACKFILL_INTERVAL_SECONDS = 60
+# a new bar's first message can lag its open time by a few seconds, it is not behind until after this
+STALE_GRACE_MS = 15_000
+# binance weekly bars open on monday, the epoch was a thursday
+WEEK_OFFSET_MS = 4 * 86_400_000
+
+
+def to_epoch_ms(dates):
+    return pd.to_datetime(dates).to_numpy().astype('datetime64[ms]').astype(np.int64)
+
+
+def interval_ms(interval):
+    unit = {'m': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}[interval[-1]]
+    return int(interval[:-1]) * unit * 1000
+
+
+def current_open_time(interval, now_ms=None):
+    '''open time in ms of the bar of interval forming at now_ms (default: now)'''
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    step = interval_ms(interval)
+    offset = WEEK_OFFSET_MS if interval.endswith('w') else 0
+    return (now_ms - offset) // step * step + offset
+
+
+def is_current(df, interval, now_ms=None):
+    '''whether a candle df ends with the bar forming now, i.e. whoever filled it has not fallen behind'''
+    if df.empty:
+        return False
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    return to_epoch_ms(df['date'].iloc[-1:])[0] >= current_open_time(interval, now_ms - STALE_GRACE_MS)
+
+
+class KlineRingBuffer:
+    '''fixed size numpy ring of candles. the last row is the still forming candle until the next one arrives'''
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.open_time = np.zeros(capacity, dtype=np.int64)
+        self.ohlcv = np.zeros((capacity, 5), dtype=np.float64)
+        self.size = 0
+        self.head = 0  # next slot to write
+
+    def last_open_time(self):
+        return self.open_time[(self.head - 1) % self.capacity] if self.size else None
+
+    def update(self, open_time, open_price, high, low, close, volume):
+        last = (self.head - 1) % self.capacity
+        if self.size and open_time < self.open_time[last]:
+            return  # stale message
+        if not self.size or open_time > self.open_time[last]:
+            last = self.head
+            self.head = (self.head + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+        self.open_time[last] = open_time
+        self.ohlcv[last] = (open_price, high, low, close, volume)
+
+    def latest(self, n=None):
+        '''open times and ohlcv rows of the last n candles, oldest first'''
+        n = self.size if n is None else min(n, self.size)
+        idx = (self.head - n + np.arange(n)) % self.capacity
+        return self.open_time[idx], self.ohlcv[idx]
+
+    def to_frame(self, n=None):
+        open_time, ohlcv = self.latest(n)
+        df = pd.DataFrame(ohlcv, columns=OHLCV_COLUMNS)
+        df.insert(0, 'date', pd.to_datetime(open_time, unit='ms'))
+        return df
+
+
+class KlineStore:
+    '''
+    ring buffers per (symbol, interval) plus the latest book ticker per symbol.
+    A kline that skips bars (the stream dropped messages, e.g. around a reconnect) or a websocket error
+    flags its buffers in needs_backfill, see BinanceKlineDaemon.backfill.
+    replay: filled by a ReplayKlineFeed, its bars are historical so readers skip the is_current check.
+    '''
+
+    def __init__(self, replay=False):
+        self.replay = replay
+        self.buffers = {}
+        self.book_tickers = {}
+        self.needs_backfill = set()
+        self.lock = threading.Lock()
+
+    def _buffer(self, symbol, interval):
+        key = (symbol, interval)
+        if key not in self.buffers:
+            self.buffers[key] = KlineRingBuffer(RING_CAPACITY.get(interval, DEFAULT_RING_CAPACITY))
+        return self.buffers[key]
+
+    def seed(self, symbol, interval, df):
+        '''
+        fill a buffer from a candle df (candle_transformation format). Bars the buffer already has are replaced
+        by the df's, which fills holes, except from the df's last (still forming) bar on, where the stream's
+        bars are newer.
+        '''
+        if df.empty:
+            return
+        df = df[['date'] + OHLCV_COLUMNS]
+        with self.lock:
+            key = (symbol, interval)
+            if key in self.buffers and self.buffers[key].size:
+                streamed = self.buffers[key].to_frame()
+                streamed = streamed[streamed['date'] >= df['date'].iloc[-1]]
+                df = pd.concat([df[~df['date'].isin(streamed['date'])], streamed], ignore_index=True)
+            buffer = KlineRingBuffer(RING_CAPACITY.get(interval, DEFAULT_RING_CAPACITY))
+            for open_time, row in zip(to_epoch_ms(df['date']), df[OHLCV_COLUMNS].to_numpy(dtype=np.float64)):
+                buffer.update(open_time, *row)
+            self.buffers[key] = buffer
+            self.needs_backfill.discard(key)
+
+    def handle_kline_message(self, msg):
+        k = msg['k']
+        key = (k['s'], k['i'])
+        open_time = int(k['t'])
+        with self.lock:
+            buffer = self._buffer(*key)
+            last_open_time = buffer.last_open_time()
+            if last_open_time is not None and open_time > last_open_time + interval_ms(k['i']):
+                self.needs_backfill.add(key)
+            buffer.update(open_time, float(k['o']), float(k['h']), float(k['l']), float(k['c']), float(k['v']))
+
+    def stale_keys(self, now_ms=None):
+        '''(symbol, interval) of the buffers flagged for backfill or whose last bar is not the current one'''
+        with self.lock:
+            keys = set(self.needs_backfill)
+            for (symbol, interval), buffer in self.buffers.items():
+                last_open_time = buffer.last_open_time()
+                # holes binance itself has (e.g. maintenance) stay in the REST bars too, only lag is checked here
+                if last_open_time is None or \
+                        last_open_time < current_open_time(interval, (now_ms or int(time.time() * 1000)) - STALE_GRACE_MS):
+                    keys.add((symbol, interval))
+        return keys
+
+    def handle_book_ticker_message(self, msg):
+        with self.lock:
+            self.book_tickers[msg['s']] = {
+                'bid': float(msg['b']), 'bid_qty': float(msg['B']),
+                'ask': float(msg['a']), 'ask_qty': float(msg['A'])}
+
+    def handle_message(self, msg):
+        data = msg.get('data', msg)  # multiplex sockets wrap the payload
+        if data.get('e') == 'kline':
+            self.handle_kline_message(data)
+        elif 'b' in data and 'a' in data and 's' in data:
+            self.handle_book_ticker_message(data)
+        elif data.get('e') == 'error':
+            # the socket reconnects on its own, whatever it missed meanwhile is refilled over REST
+            logging.error(f"Websocket error: {data}")
+            with self.lock:
+                self.needs_backfill |= set(self.buffers)
+
+    def get_bars(self, symbol, interval, n=None):
+        with self.lock:
+            buffer = self.buffers.get((symbol, interval))
+            if buffer is None or buffer.size == 0:
+                return pd.DataFrame(columns=['date'] + OHLCV_COLUMNS)
+            return buffer.to_frame(n)
+
+    def get_book_ticker(self, symbol):
+        with self.lock:
+            return self.book_tickers.get(symbol)
+
+
+class BinanceKlineDaemon:
+    '''
+    keep a KlineStore current from binance kline and bookTicker websocket streams.
+    Once seeded, a background thread backfills over REST whatever the stream missed: the bars that closed
+    between seeding and subscribing, and holes or lag after a disconnect (KlineStore.stale_keys).
+    '''
+
+    def __init__(self, store, api_key, api_secret, symbols, intervals, backfill_interval=BACKFILL_INTERVAL_SECONDS):
+        self.store = store
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.symbols = sorted(set(symbols))
+        self.intervals = intervals
+        self.backfill_interval = backfill_interval
+        self.rest_source = None  # (client, candle_cache, lookback_days) once seeded
+        self.stop_event = threading.Event()
+        self.twm = None
+
+    def _seed(self, keys):
+        client, candle_cache, lookback_days = self.rest_source
+        for symbol, interval in keys:
+            try:
+                df = candle_cache.get_candles(client, symbol, interval, lookback_days[interval])
+                self.store.seed(symbol, interval, df)
+            except Exception as e:
+                logging.error(f"Could not seed {symbol} {interval}: {e}")
+
+    def seed_from_cache(self, client, candle_cache, lookback_days):
+        '''lookback_days: interval -> days of history to load before streaming'''
+        self.rest_source = (client, candle_cache, lookback_days)
+        self._seed([(symbol, interval) for symbol in self.symbols for interval in self.intervals])
+        logging.info(f"Seeded {len(self.store.buffers)} ring buffers.")
+
+    def backfill(self, now_ms=None):
+        '''refill the buffers that have holes or fell behind from REST, returns how many'''
+        keys = sorted(self.store.stale_keys(now_ms))
+        if keys:
+            logging.warning(f"Backfilling {len(keys)} kline buffers over REST, e.g. {keys[0]}")
+            self._seed(keys)
+        return len(keys)
+
+    def _backfill_loop(self):
+        while not self.stop_event.wait(self.backfill_interval):
+            try:
+                self.backfill()
+            except Exception as e:
+                logging.error(f"Kline backfill failed: {e}")
+
+    def _streams(self):
+        streams = []
+        for symbol in self.symbols:
+            streams += [f'{symbol.lower()}@kline_{interval}' for interval in self.intervals]
+            streams.append(f'{symbol.lower()}@bookTicker')
+        return streams
+
+    def start(self):
+        from binance import ThreadedWebsocketManager
+        self.twm = ThreadedWebsocketManager(api_key=self.api_key, api_secret=self.api_secret)
+        self.twm.start()
+        streams = self._streams()
+        for i in range(0, len(streams), STREAMS_PER_SOCKET):
+            self.twm.start_multiplex_socket(callback=self.store.handle_message,
+                                            streams=streams[i:i + STREAMS_PER_SOCKET])
+        logging.info(f"Subscribed to {len(streams)} streams for {len(self.symbols)} symbols.")
+        if self.rest_source is not None:
+            # bars that closed while seeding ran are caught on the first pass
+            threading.Thread(target=self._backfill_loop, daemon=True).start()
+
+    def join(self):
+        self.twm.join()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.twm:
+            self.twm.stop()
+
+
+class ReplayKlineFeed:
+    '''
+    Offline stand-in for BinanceKlineDaemon.
+    Pushes recorded candles through the same KlineStore message handler, oldest first across all keys.
+    '''
+
+    def __init__(self, store, recorded, delay=0):
+        self.store = store
+        self.store.replay = True
+        self.recorded = recorded  # (symbol, interval) -> candle df
+        self.delay = delay
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    @classmethod
+    def from_candle_cache(cls, store, cache_folder, symbols, intervals, delay=0):
+        recorded = {}
+        for symbol in symbols:
+            for interval in intervals:
+                file_path = os.path.join(cache_folder, f'{symbol}_{interval}.csv')
+                if os.path.exists(file_path):
+                    recorded[(symbol, interval)] = pd.read_csv(file_path, parse_dates=['date'])
+        return cls(store, recorded, delay)
+
+    def _messages(self):
+        frames = []
+        for (symbol, interval), df in self.recorded.items():
+            df = df.copy()
+            df['open_time'] = to_epoch_ms(df['date'])
+            df['symbol'] = symbol
+            df['interval'] = interval
+            frames.append(df)
+        if not frames:
+            return
+        all_candles = pd.concat(frames, ignore_index=True).sort_values('open_time', kind='stable')
+        for row in all_candles.itertuples(index=False):
+            yield {'e': 'kline', 's': row.symbol,
+                   'k': {'t': row.open_time, 's': row.symbol, 'i': row.interval,
+                         'o': row.open, 'h': row.high, 'l': row.low, 'c': row.close, 'v': row.volume, 'x': True}}
+
+    def run(self):
+        for msg in self._messages():
+            if self.stop_event.is_set():
+                break
+            self.store.handle_message(msg)
+            if self.delay:
+                time.sleep(self.delay)
+        logging.info('Replay finished.')
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def join(self):
+        if self.thread:
+            self.thread.join()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class KlineStoreServer:
+    '''serve a KlineStore to other processes over a local socket'''
+
+    def __init__(self, store, address=KLINE_DAEMON_ADDRESS, authkey=KLINE_DAEMON_AUTHKEY):
+        self.store = store
+        self.address = address
+        self.authkey = authkey
+
+    def _serve_connection(self, conn):
+        try:
+            while True:
+                request = conn.recv()
+                if request[0] == 'bars':
+                    conn.send(self.store.get_bars(*request[1:]))
+                elif request[0] == 'book_ticker':
+                    conn.send(self.store.get_book_ticker(request[1]))
+                elif request[0] == 'replay':
+                    conn.send(self.store.replay)
+                else:
+                    conn.send(None)
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def serve_forever(self):
+        with Listener(self.address, authkey=self.authkey) as listener:
+            logging.info(f"Kline store listening on {self.address}")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class KlineStoreClient:
+    '''same read interface as KlineStore, backed by a KlineStoreServer in another process'''
+
+    def __init__(self, address=KLINE_DAEMON_ADDRESS, authkey=KLINE_DAEMON_AUTHKEY):
+        self.conn = ConnectionClient(address, authkey=authkey)
+        self.lock = threading.Lock()
+        self.conn.send(('replay',))
+        self.replay = self.conn.recv()
+
+    def get_bars(self, symbol, interval, n=None):
+        with self.lock:
+            self.conn.send(('bars', symbol, interval, n))
+            return self.conn.recv()
+
+    def get_book_ticker(self, symbol):
+        with self.lock:
+            self.conn.send(('book_ticker', symbol))
+            return self.conn.recv()
+
+    def close(self):
+        self.conn.close()
+
+
+def connect_kline_daemon(address=KLINE_DAEMON_ADDRESS, authkey=KLINE_DAEMON_AUTHKEY):
+    '''KlineStoreClient if a daemon is running, otherwise None so callers fall back to REST'''
+    try:
+        return KlineStoreClient(address, authkey)
+    except (ConnectionRefusedError, OSError):
+        return None
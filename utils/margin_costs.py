@@ -0,0 +1,17 @@
+import numpy as np
+import pandas as pd
+
+# binance cross margin interest on borrowed assets, ~0.02% a day on alts
+MARGIN_HOURLY_INTEREST = 0.0002 / 24
+
+
+def margin_interest(borrowed_dollar, open_time, close_time, hourly_rate=MARGIN_HOURLY_INTEREST):
+    '''
+    Interest on borrowed_dollar held from open_time to close_time, scalars or arrays.
+    Binance charges once when the loan is taken and again at every full hour after, so a loan
+    repaid within the first hour still pays one hour, and one held exactly n hours pays n + 1.
+    '''
+    held = pd.to_datetime(np.asarray(close_time).ravel()) - pd.to_datetime(np.asarray(open_time).ravel())
+    hours_charged = np.floor(np.asarray(held / pd.Timedelta(hours=1), dtype=np.float64)) + 1
+    interest = np.asarray(borrowed_dollar, dtype=np.float64).ravel() * hourly_rate * hours_charged
+    return interest if np.ndim(borrowed_dollar) else float(interest[0])
@@ -0,0 +1,79 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from binance.client import Client
+from utils.trading_utils import get_bn_data, MINUTE_LOOKBACK_DAYS, DAILY_LOOKBACK_DAYS
+from utils.kline_stream import is_current
+
+
+def align_on_date(df1, df2):
+    '''keep only the candles both frames have, so pair legs line up row by row'''
+    common_dates = set(df1['date']).intersection(df2['date'])
+    df1 = df1[df1['date'].isin(common_dates)].reset_index(drop=True)
+    df2 = df2[df2['date'].isin(common_dates)].reset_index(drop=True)
+    return df1, df2
+
+
+class MarketDataSession:
+    '''
+    Market data for one run of the opener/closer.
+    Collect every symbol the run needs, fetch each one once (concurrently), then hand out aligned pair frames.
+    bar_source is optional, anything with get_bars(symbol, interval, n) such as a KlineStore or KlineStoreClient.
+    Symbols it has no bars for, or whose last bar is not the current one (the stream fell behind),
+    fall back to REST through get_bn_data. A bar_source with replay set (a store filled by ReplayKlineFeed)
+    serves historical bars, they are used as they are.
+    '''
+
+    def __init__(self, client, max_workers=8, bar_source=None):
+        self.client = client
+        self.max_workers = max_workers
+        self.bar_source = bar_source
+        self.data = {}    # symbol -> (minute_data, daily_data)
+        self.errors = {}  # symbol -> exception raised while fetching
+
+    def _from_bar_source(self, symbol):
+        minute_data = self.bar_source.get_bars(symbol, Client.KLINE_INTERVAL_2HOUR, MINUTE_LOOKBACK_DAYS * 12)
+        daily_data = self.bar_source.get_bars(symbol, Client.KLINE_INTERVAL_1DAY, DAILY_LOOKBACK_DAYS)
+        if minute_data.empty or daily_data.empty:
+            return None
+        if getattr(self.bar_source, 'replay', False):
+            return minute_data, daily_data
+        if not (is_current(minute_data, Client.KLINE_INTERVAL_2HOUR) and is_current(daily_data, Client.KLINE_INTERVAL_1DAY)):
+            logging.warning(f"Bar source is behind for {symbol} (last 2h bar {minute_data['date'].iloc[-1]}), using REST")
+            return None
+        return minute_data, daily_data
+
+    def _fetch(self, symbol):
+        try:
+            data = self._from_bar_source(symbol) if self.bar_source is not None else None
+            if data is None:
+                data = get_bn_data(self.client, symbol)
+            return symbol, data, None
+        except Exception as e:
+            return symbol, None, e
+
+    def prefetch(self, symbols):
+        symbols = sorted(set(symbols) - set(self.data) - set(self.errors))
+        if not symbols:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(symbols))) as executor:
+            for symbol, data, error in executor.map(self._fetch, symbols):
+                if error is None:
+                    self.data[symbol] = data
+                else:
+                    self.errors[symbol] = error
+        logging.info(f"Fetched market data for {len(symbols)} symbols, {len(self.errors)} failed.")
+
+    def get(self, symbol):
+        if symbol not in self.data and symbol not in self.errors:
+            self.prefetch([symbol])
+        if symbol in self.errors:
+            raise self.errors[symbol]
+        return self.data[symbol]
+
+    def get_pair(self, symbol_Y, symbol_X):
+        '''returns Y_minute_data, Y_daily_data, X_minute_data, X_daily_data aligned on date'''
+        Y_minute_data, Y_daily_data = self.get(symbol_Y)
+        X_minute_data, X_daily_data = self.get(symbol_X)
+        Y_minute_data, X_minute_data = align_on_date(Y_minute_data, X_minute_data)
+        Y_daily_data, X_daily_data = align_on_date(Y_daily_data, X_daily_data)
+        return Y_minute_data, Y_daily_data, X_minute_data, X_daily_data
@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+METRICS_DIR_ENV = 'BOT_METRICS_DIR'
+# seconds between cron ticks, the budget a tick is measured against
+TICK_INTERVAL_ENV = 'BOT_TICK_INTERVAL'
+DEFAULT_TICK_INTERVAL = 60
+METRIC_PREFIX = 'pairs_bot_'
+
+# seconds, ticks and their stages
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# seconds, one exchange request or one order leg from submit to its last response
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# milliseconds between the transactTime of the two legs of a pair
+SKEW_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'ticks_total': ('counter', 'Finished ticks by status.', None),
+    'tick_overlaps_total': ('counter', 'Ticks started while the previous tick of the same name was still running.', None),
+    'fast_start_skips_total': ('counter', 'Ticks fast_start.py ended before loading the script, nothing to do.', None),
+    'tick_seconds': ('histogram', 'Wall time of a whole tick.', STAGE_BUCKETS),
+    'last_tick_seconds': ('gauge', 'Wall time of the last tick.', None),
+    'last_tick_timestamp_seconds': ('gauge', 'Unix time the last tick finished.', None),
+    'tick_interval_seconds': ('gauge', 'Seconds between ticks (cron interval).', None),
+    'tick_budget_ratio': ('gauge', 'Last tick wall time over the tick interval, alert as it nears 1.', None),
+    'stage_seconds': ('histogram', 'Wall time of a stage of a tick.', STAGE_BUCKETS),
+    'api_calls_total': ('counter', 'Binance REST calls by endpoint.', None),
+    'api_errors_total': ('counter', 'Binance REST calls that raised, by endpoint.', None),
+    'api_request_seconds': ('histogram', 'Binance REST call latency by endpoint.', LATENCY_BUCKETS),
+    'api_used_weight': ('gauge', 'Highest used weight/order count header Binance returned in the last tick.', None),
+    'pair_orders_total': ('counter', 'Pair executions by result.', None),
+    'order_roundtrip_seconds': ('histogram', 'One leg of a pair trade from submit to its last exchange response.', LATENCY_BUCKETS),
+    'leg_skew_ms': ('histogram', 'Milliseconds between the fills of the two legs of a pair.', SKEW_BUCKETS),
+}
+
+
+def _label_key(labels):
+    return ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for name, value in sorted(labels.items()))
+
+
+def render_metrics(series):
+    '''prometheus text exposition format of {name: {label_key: value}}'''
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        values = series.get(name)
+        if not values:
+            continue
+        full_name = METRIC_PREFIX + name
+        lines.append(f'# HELP {full_name} {help_text}')
+        lines.append(f'# TYPE {full_name} {kind}')
+        for key, value in sorted(values.items()):
+            if kind != 'histogram':
+                lines.append(f'{full_name}{{{key}}} {value}')
+                continue
+            sep = ',' if key else ''
+            # stored cumulative: one count per bucket, then +Inf count and sum
+            for bound, count in zip(buckets, value):
+                lines.append(f'{full_name}_bucket{{{key}{sep}le="{bound}"}} {count}')
+            lines.append(f'{full_name}_bucket{{{key}{sep}le="+Inf"}} {value[-2]}')
+            lines.append(f'{full_name}_sum{{{key}}} {value[-1]}')
+            lines.append(f'{full_name}_count{{{key}}} {value[-2]}')
+    return '\n'.join(lines) + '\n'
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe('stage_seconds', time.perf_counter() - self.start, stage=self.name)
+        return False
+
+
+class _Tick:
+    '''one run of a job, the lock file tells if the previous run of the same name is still going'''
+
+    def __init__(self, metrics, name, interval):
+        self.metrics = metrics
+        self.name = name
+        self.interval = interval
+        self.lock_file = None
+        self.start = None
+
+    def __enter__(self):
+        metrics = self.metrics
+        metrics.tick_name = self.name
+        os.makedirs(metrics.out_dir, exist_ok=True)
+        self.lock_file = open(os.path.join(metrics.out_dir, f'{self.name}.tick.lock'), 'a')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logging.warning(f"{self.name} tick started while the previous one is still running.")
+            metrics.inc('tick_overlaps_total')
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        metrics = self.metrics
+        elapsed = time.perf_counter() - self.start
+        metrics.observe('tick_seconds', elapsed)
+        metrics.set('last_tick_seconds', elapsed)
+        metrics.set('last_tick_timestamp_seconds', time.time())
+        metrics.set('tick_interval_seconds', self.interval)
+        metrics.set('tick_budget_ratio', elapsed / self.interval)
+        # sys.exit() with nothing to do (e.g. closer without open positions) is a normal tick
+        is_ok = exc_type is None or (issubclass(exc_type, SystemExit) and exc.code in (None, 0))
+        metrics.inc('ticks_total', status='ok' if is_ok else 'error')
+        try:
+            metrics.flush()
+        except Exception as e:
+            logging.error(f"Could not write {self.name} metrics: {e}")
+        finally:
+            self.lock_file.close()  # releases the flock
+            metrics.tick_name = metrics.script
+        return False
+
+
+class BotMetrics:
+    '''
+    Stage durations, Binance API calls and order latencies of the live bot, in the prometheus text format.
+    A cron tick is a short lived process, so flush() adds what this process recorded to the totals kept in
+    <script>.state.json and rewrites <script>.prom for the node_exporter textfile collector.
+    serve() exposes the same totals over http for a resident process such as trading_service.py.
+    Every series carries script and tick labels.
+    '''
+
+    def __init__(self, script, out_dir=None, tick_interval=None):
+        self.script = script
+        self.tick_name = script
+        self.out_dir = out_dir or os.getenv(METRICS_DIR_ENV) or './data/metrics'
+        self.tick_interval = float(tick_interval or os.getenv(TICK_INTERVAL_ENV) or DEFAULT_TICK_INTERVAL)
+        self.prom_file = os.path.join(self.out_dir, f'{script}.prom')
+        self.state_file = os.path.join(self.out_dir, f'{script}.state.json')
+        self.lock = threading.Lock()
+        self.pending = {}  # recorded since the last flush
+        self.totals = {}   # what the last flush wrote
+        self.server = None
+
+    def _series(self, name, labels):
+        labels = {'script': self.script, 'tick': self.tick_name, **labels}
+        return self.pending.setdefault(name, {}), _label_key(labels)
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            values, key = self._series(name, labels)
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            values, key = self._series(name, labels)
+            values[key] = value
+
+    def set_max(self, name, value, **labels):
+        with self.lock:
+            values, key = self._series(name, labels)
+            values[key] = max(values.get(key, value), value)
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        with self.lock:
+            values, key = self._series(name, labels)
+            counts = values.get(key)
+            if counts is None:
+                counts = values[key] = [0] * (len(buckets) + 1) + [0.0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def tick(self, name=None, interval=None):
+        '''times a whole run and flushes at the end: with metrics.tick(): ...'''
+        return _Tick(self, name or self.script, interval or self.tick_interval)
+
+    def instrument_client(self, client):
+        '''
+        Count every REST call of a python-binance Client and keep the highest used weight it reports.
+        client.response is shared by the threads of a MarketDataSession, so the weight header read after
+        a call can be another thread's; it is a gauge of recent usage, not a per call weight.
+        '''
+        request = client._request
+
+        def counted(method, uri, signed, *args, **kwargs):
+            endpoint = urlparse(uri).path
+            start = time.perf_counter()
+            try:
+                return request(method, uri, signed, *args, **kwargs)
+            except Exception:
+                self.inc('api_errors_total', endpoint=endpoint)
+                raise
+            finally:
+                self.inc('api_calls_total', endpoint=endpoint, method=method.upper())
+                self.observe('api_request_seconds', time.perf_counter() - start, endpoint=endpoint)
+                headers = getattr(getattr(client, 'response', None), 'headers', None) or {}
+                for header, value in headers.items():
+                    header = header.lower()
+                    if header.startswith(('x-mbx-used-weight-', 'x-mbx-order-count-', 'x-sapi-used-')):
+                        self.set_max('api_used_weight', float(value), header=header)
+
+        client._request = counted
+        return client
+
+    def _merge(self, totals, pending):
+        for name, values in pending.items():
+            kind = METRICS[name][0]
+            merged = totals.setdefault(name, {})
+            for key, value in values.items():
+                if kind == 'gauge' or key not in merged:
+                    merged[key] = value
+                elif kind == 'counter':
+                    merged[key] += value
+                else:
+                    merged[key] = [a + b for a, b in zip(merged[key], value)]
+        return totals
+
+    def flush(self):
+        '''add what was recorded since the last flush to the totals on disk and rewrite the .prom file'''
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        os.makedirs(self.out_dir, exist_ok=True)
+        with open(self.state_file + '.lock', 'a') as lock_file:
+            # opener and closer ticks can overlap, only one of them merges at a time
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            totals = {}
+            if os.path.exists(self.state_file):
+                with open(self.state_file) as file:
+                    totals = json.load(file)
+            totals = self._merge(totals, pending)
+            for path, content in ((self.state_file, json.dumps(totals)), (self.prom_file, render_metrics(totals))):
+                # the collector may read at any time, so never leave a half written file
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                with open(tmp_path, 'w') as file:
+                    file.write(content)
+                os.replace(tmp_path, path)
+        self.totals = totals
+        return totals
+
+    def serve(self, port, host='127.0.0.1'):
+        '''GET /metrics on a background thread, serving the totals of the last flush'''
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = render_metrics(metrics.totals).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logging.info(f"Serving {self.script} metrics on http://{host}:{port}/metrics")
+        return self.server
+
+
+class _NullMetrics:
+    '''what code gets when no metrics were asked for, every call does nothing'''
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def set(self, name, value, **labels):
+        pass
+
+    def set_max(self, name, value, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def stage(self, name):
+        return NULL_STAGE
+
+
+NULL_METRICS = _NullMetrics()
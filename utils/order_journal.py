@@ -0,0 +1,262 @@
+import os
+import json
+import fcntl
+import logging
+import pandas as pd
+
+# journal events after which the next record() folds the journal into a new snapshot
+COMPACT_EVENTS = 500
+
+OPEN = 'open'          # new row of open_orders_df
+UPDATE = 'update'      # changed fields of an open order
+EXECUTION = 'exec'     # new row of executions_df
+IDEAL_EXECUTION = 'ideal_exec'  # new row of ideal_executions_df
+MARK = 'mark'          # runner state, e.g. the last candle processed per symbol
+
+
+def _jsonable(value):
+    '''numpy scalars, timestamps and NaN of a dataframe row as plain json values'''
+    if value is None:
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _records(df):
+    return [{col: _jsonable(value) for col, value in row.items()} for row in df.to_dict('records')]
+
+
+class OrderJournal:
+    '''
+    Order and execution state of one production strategy as an append-only json-lines journal.
+    <name>.snapshot.json holds the open orders as of a journal seq, <name>.journal.jsonl the events since,
+    so loading reads the snapshot and the events of recent runs only. Compaction appends the journal to
+    <name>.history.jsonl, which is only read to export the full order/execution csvs on demand.
+    One process at a time: the journal is flocked for the life of the object.
+    '''
+
+    def __init__(self, folder, name, compact_events=COMPACT_EVENTS):
+        self.name = name
+        self.compact_events = compact_events
+        os.makedirs(folder, exist_ok=True)
+        base = os.path.join(folder, name)
+        self.journal_file = base + '.journal.jsonl'
+        self.snapshot_file = base + '.snapshot.json'
+        self.history_file = base + '.history.jsonl'
+
+        self.lock_file = open(base + '.journal.lock', 'a')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock_file.close()
+            raise RuntimeError(f"{self.journal_file} is in use by another run of {name}")
+
+        self.open_orders = {}  # order_id -> row, OPEN orders only
+        self.marks = {}        # key -> value, see record(marks=)
+        self.next_order_id = 0
+        self.seq = 0
+        self.tail_events = 0  # events in the journal since the snapshot
+        self.exec_rows = 0    # rows of the strategy's executions_df already journaled
+        self.ideal_rows = 0
+        self._load()
+        self.journal = open(self.journal_file, 'a')
+
+    def _read_events(self, path, after_seq=0):
+        if not os.path.exists(path):
+            return
+        with open(path) as file:
+            for line in file:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # torn last line of a run that died mid write
+                    logging.warning(f"Skipping unreadable line in {path}")
+                    continue
+                if event['seq'] > after_seq:
+                    yield event
+
+    def _apply(self, orders, event):
+        '''apply one order event to orders, {order_id: row}'''
+        if event['type'] == OPEN:
+            orders[event['order_id']] = dict(event['row'])
+        elif event['type'] == UPDATE and event['order_id'] in orders:
+            orders[event['order_id']].update(event['fields'])
+
+    def _load(self):
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file) as file:
+                snapshot = json.load(file)
+            self.seq = snapshot['seq']
+            self.next_order_id = snapshot['next_order_id']
+            self.open_orders = {int(order_id): row for order_id, row in snapshot['open_orders'].items()}
+            self.marks = snapshot.get('marks', {})
+        for event in self._read_events(self.journal_file, self.seq):
+            self._apply(self.open_orders, event)
+            if event['type'] == MARK:
+                self.marks[event['key']] = event['value']
+            if event['type'] == OPEN:
+                self.next_order_id = max(self.next_order_id, event['order_id'] + 1)
+            self.seq = event['seq']
+            self.tail_events += 1
+        self.open_orders = {order_id: row for order_id, row in self.open_orders.items() if row.get('status') == 'OPEN'}
+        logging.info(f"{self.name}: {len(self.open_orders)} open orders, {self.tail_events} journal events since the snapshot")
+
+    def is_empty(self):
+        return self.seq == 0
+
+    def open_orders_df(self):
+        '''open orders for the strategy's open_orders_df, order_id ties its rows back to the journal'''
+        if not self.open_orders:
+            return pd.DataFrame()
+        df = pd.DataFrame([{**row, 'order_id': order_id} for order_id, row in self.open_orders.items()])
+        # an all empty column (e.g. close_reason) would come back as float and refuse the string set on close
+        return df.dropna(axis=1, how='all')
+
+    def _append(self, events):
+        lines = []
+        for event in events:
+            self.seq += 1
+            event['seq'] = self.seq
+            lines.append(json.dumps(event))
+        self.journal.write('\n'.join(lines) + '\n')
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.tail_events += len(events)
+
+    def record(self, strategy, marks=None):
+        '''
+        Journal what a run changed: rows added to open_orders_df, fields changed on the open ones and the rows
+        added to executions_df/ideal_executions_df since the last record(). Returns the number of events.
+        marks: {key: json value} written in the same append, e.g. the last candle the run processed
+        '''
+        events = []
+        for key, value in (marks or {}).items():
+            if self.marks.get(key) != value:
+                events.append({'type': MARK, 'key': key, 'value': value})
+                self.marks[key] = value
+        orders_df = strategy.open_orders_df
+        if not orders_df.empty:
+            if 'order_id' not in orders_df.columns:
+                orders_df['order_id'] = None
+            for index, row in zip(orders_df.index, _records(orders_df)):
+                order_id = row.pop('order_id')
+                if order_id is None:
+                    order_id = self.next_order_id
+                    self.next_order_id += 1
+                    orders_df.at[index, 'order_id'] = order_id
+                    events.append({'type': OPEN, 'order_id': order_id, 'row': row})
+                    self.open_orders[order_id] = row
+                    continue
+                order_id = int(order_id)
+                known = self.open_orders.get(order_id)
+                if known is None:
+                    continue  # closed in an earlier record()
+                fields = {col: value for col, value in row.items() if known.get(col) != value}
+                if fields:
+                    events.append({'type': UPDATE, 'order_id': order_id, 'fields': fields})
+                    known.update(fields)
+            self.open_orders = {order_id: row for order_id, row in self.open_orders.items() if row.get('status') == 'OPEN'}
+
+        for attr, kind, counter in (('executions_df', EXECUTION, 'exec_rows'),
+                                    ('ideal_executions_df', IDEAL_EXECUTION, 'ideal_rows')):
+            df = getattr(strategy, attr, None)
+            if df is None or len(df) <= getattr(self, counter):
+                continue
+            events.extend({'type': kind, 'row': row} for row in _records(df.iloc[getattr(self, counter):]))
+            setattr(self, counter, len(df))
+
+        if events:
+            self._append(events)
+        if self.tail_events >= self.compact_events:
+            self.compact()
+        return len(events)
+
+    def compact(self):
+        '''
+        Fold the journal into a new snapshot. The journal goes to the history file first, so a crash leaves
+        events in both at worst; history readers drop repeated seqs.
+        '''
+        if not self.tail_events:
+            return
+        self.journal.flush()
+        with open(self.journal_file) as src, open(self.history_file, 'a') as dst:
+            dst.write(src.read())
+            dst.flush()
+            os.fsync(dst.fileno())
+
+        snapshot = {'seq': self.seq, 'next_order_id': self.next_order_id, 'marks': self.marks,
+                    'open_orders': {str(order_id): row for order_id, row in self.open_orders.items()}}
+        tmp_path = self.snapshot_file + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(snapshot, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.snapshot_file)
+
+        self.journal.truncate(0)
+        os.fsync(self.journal.fileno())
+        logging.info(f"{self.name}: compacted {self.tail_events} journal events into the snapshot at seq {self.seq}")
+        self.tail_events = 0
+
+    def history(self):
+        '''every event ever journaled, in order, each seq once'''
+        last_seq = 0
+        for path in (self.history_file, self.journal_file):
+            for event in self._read_events(path):
+                if event['seq'] <= last_seq:
+                    continue  # copied again by a compaction that died before truncating the journal
+                last_seq = event['seq']
+                yield event
+
+    def export_dfs(self):
+        '''(orders_df, executions_df, ideal_executions_df) with the full history, as the old csvs had them'''
+        orders, executions, ideal_executions = {}, [], []
+        for event in self.history():
+            if event['type'] == EXECUTION:
+                executions.append(event['row'])
+            elif event['type'] == IDEAL_EXECUTION:
+                ideal_executions.append(event['row'])
+            else:
+                self._apply(orders, event)
+        return (pd.DataFrame([{**row, 'order_id': order_id} for order_id, row in orders.items()]),
+                pd.DataFrame(executions), pd.DataFrame(ideal_executions))
+
+    def export_csvs(self, order_csv_file, exec_csv_file, ideal_exec_csv_file):
+        for df, file_path in zip(self.export_dfs(), (order_csv_file, exec_csv_file, ideal_exec_csv_file)):
+            df.to_csv(file_path, index=False)
+        logging.info(f"{self.name}: exported orders and executions to {os.path.dirname(order_csv_file)}")
+
+    def import_csvs(self, order_csv_file, exec_csv_file, ideal_exec_csv_file):
+        '''journal the csvs the pipeline used to rewrite every run, once, into an empty journal'''
+        events = []
+        if os.path.exists(order_csv_file):
+            for row in _records(pd.read_csv(order_csv_file)):
+                row.pop('order_id', None)
+                events.append({'type': OPEN, 'order_id': self.next_order_id, 'row': row})
+                if row.get('status') == 'OPEN':
+                    self.open_orders[self.next_order_id] = row
+                self.next_order_id += 1
+        for file_path, kind in ((exec_csv_file, EXECUTION), (ideal_exec_csv_file, IDEAL_EXECUTION)):
+            if os.path.exists(file_path):
+                events.extend({'type': kind, 'row': row} for row in _records(pd.read_csv(file_path)))
+        if events:
+            self._append(events)
+            self.compact()
+            logging.info(f"{self.name}: imported {len(events)} orders and executions from csv")
+
+    def close(self):
+        self.journal.close()
+        self.lock_file.close()  # releases the flock
+
+
+def load_order_journal(folder, name, order_csv_file=None, exec_csv_file=None, ideal_exec_csv_file=None):
+    '''open the journal, importing the legacy csvs the first time'''
+    journal = OrderJournal(folder, name)
+    if journal.is_empty() and order_csv_file:
+        journal.import_csvs(order_csv_file, exec_csv_file, ideal_exec_csv_file)
+    return journal
@@ -0,0 +1,85 @@
+import logging
+import threading
+from utils.trading_utils import symbol_filters
+from utils.metrics import NULL_METRICS
+
+BUY = 'BUY'
+SELL = 'SELL'
+SELL_ALL = 'SELL_ALL'
+
+
+class OrderIntent:
+    '''a market order a strategy decided on, placed later by the OrderQueue'''
+    __slots__ = ('strategy', 'action', 'symbol', 'quantity', 'order_info', 'error')
+
+    def __init__(self, strategy, action, symbol, quantity):
+        self.strategy = strategy
+        self.action = action
+        self.symbol = symbol
+        self.quantity = quantity  # None for SELL_ALL, the free balance at placement
+        self.order_info = None
+        self.error = None
+
+
+class OrderQueue:
+    '''
+    One queue the production strategies submit their market orders to while they decide in parallel.
+    place_all() then sends them from one thread on one client: sells before buys so the buys have the USDT,
+    free balances fetched once per asset and shared by every strategy selling it.
+    Each fill is handed back to its strategy (record_fill) for its executions log.
+    '''
+
+    def __init__(self, client, metrics=None):
+        self.client = client
+        self.metrics = metrics or NULL_METRICS
+        self.lock = threading.Lock()
+        self.intents = []
+
+    def submit(self, strategy, action, symbol, quantity=None):
+        with self.lock:
+            self.intents.append(OrderIntent(strategy, action, symbol, quantity))
+
+    def discard(self, strategy):
+        '''drop what a strategy submitted, e.g. when its run failed half way'''
+        with self.lock:
+            self.intents = [intent for intent in self.intents if intent.strategy is not strategy]
+
+    def _free_balance(self, balances, symbol):
+        asset = symbol.replace('USDT', '')
+        if asset not in balances:
+            balances[asset] = float(self.client.get_asset_balance(asset=asset)['free'])
+        return balances[asset]
+
+    def _place(self, intent, balances):
+        symbol = intent.symbol
+        if intent.action == BUY:
+            return self.client.order_market_buy(symbol=symbol, quantity=symbol_filters.round_qty(symbol, intent.quantity))
+
+        balance = self._free_balance(balances, symbol)
+        quantity = balance if intent.action == SELL_ALL else intent.quantity
+        if quantity > balance:  # make sure have enough to sell
+            raise ValueError(f"Insufficient balance. Attempted to sell {quantity} {symbol}, but only {balance} available.")
+        order_info = self.client.order_market_sell(symbol=symbol, quantity=symbol_filters.round_qty(symbol, quantity))
+        balances[symbol.replace('USDT', '')] = balance - float(order_info['executedQty'])
+        return order_info
+
+    def place_all(self):
+        '''place every queued order, returns the intents with order_info or error set'''
+        with self.lock:
+            intents, self.intents = self.intents, []
+        if not intents:
+            return []
+        intents.sort(key=lambda intent: intent.action == BUY)
+        symbol_filters.ensure_fresh(self.client)
+        balances = {}
+        with self.metrics.stage('order placement'):
+            for intent in intents:
+                try:
+                    intent.order_info = self._place(intent, balances)
+                except Exception as e:
+                    intent.error = e
+                    logging.error(f"Error executing {intent.action} {intent.symbol} for {intent.strategy.name}: {e}")
+                    continue
+                intent.strategy.record_fill(intent.action, intent.symbol, intent.order_info)
+        logging.info(f"Placed {sum(intent.error is None for intent in intents)} of {len(intents)} queued orders")
+        return intents
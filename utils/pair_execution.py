@@ -0,0 +1,123 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from binance.enums import *
+from utils.metrics import NULL_METRICS
+
+
+class PairExecutionError(Exception):
+    '''
+    one or both legs failed. result holds whatever did fill so it can be unwound by hand,
+    including the steps a failed leg got through (e.g. the loan of a short whose sell failed)
+    '''
+
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
+
+
+class PairLeg:
+    '''one side of a pair trade: exchange calls run in order, each gets the previous responses'''
+
+    def __init__(self, name, symbol, steps):
+        self.name = name
+        self.symbol = symbol
+        self.steps = steps  # list of (response_name, callable(responses) -> response)
+
+    def run(self):
+        '''a step that raises gets the responses of the steps before it attached as e.responses'''
+        responses = {}
+        timing = {'submit_time': time.time()}
+        for response_name, step in self.steps:
+            try:
+                responses[response_name] = step(responses)
+            except Exception as e:
+                e.responses = responses
+                raise
+        timing['done_time'] = time.time()
+        return responses, timing
+
+
+def _loan_step(call, asset, amount):
+    '''margin loan/repay response with the asset and amount it was for, binance only returns the tranId'''
+    response = dict(call(asset=asset, amount=amount))
+    response.update(asset=asset, amount=amount)
+    return response
+
+
+class PairOrderExecutor:
+    '''
+    Prepare both legs of a pairs trade up front, then fire them at the same time.
+    Nothing is persisted here, callers write to db/csv once both legs are back.
+    '''
+
+    def __init__(self, client, metrics=None):
+        self.client = client
+        self.metrics = metrics or NULL_METRICS
+        self.pool = ThreadPoolExecutor(max_workers=2)
+
+    def prepare_open(self, long_symbol, long_quantity, short_symbol, short_quantity):
+        client = self.client
+        long_leg = PairLeg('long', long_symbol, [
+            ('order', lambda r: client.order_market_buy(symbol=long_symbol, quantity=long_quantity)),
+        ])
+        short_leg = PairLeg('short', short_symbol, [
+            ('loan', lambda r: _loan_step(client.create_margin_loan, short_symbol.replace('USDT', ''), str(short_quantity))),
+            ('order', lambda r: client.create_margin_order(
+                symbol=short_symbol, side=SIDE_SELL, type=ORDER_TYPE_MARKET, quantity=short_quantity)),
+        ])
+        return long_leg, short_leg
+
+    def prepare_close(self, long_symbol, long_quantity, short_symbol, short_quantity):
+        '''short_quantity is the loan principal to buy back and repay'''
+        client = self.client
+        long_leg = PairLeg('long', long_symbol, [
+            ('order', lambda r: client.order_market_sell(symbol=long_symbol, quantity=long_quantity)),
+        ])
+        short_leg = PairLeg('short', short_symbol, [
+            ('order', lambda r: client.create_margin_order(
+                symbol=short_symbol, side=SIDE_BUY, type=ORDER_TYPE_MARKET, quantity=short_quantity)),
+            ('loan', lambda r: _loan_step(client.repay_margin_loan, short_symbol.replace('USDT', ''), str(short_quantity))),
+        ])
+        return long_leg, short_leg
+
+    def execute(self, long_leg, short_leg):
+        '''
+        Submit both legs concurrently. Returns {'long': responses, 'short': responses, 'timing': {...}},
+        raises PairExecutionError with the partial result if either leg failed, a failed leg's entry holds the
+        responses of the steps it completed.
+        '''
+        metrics = self.metrics
+        with metrics.stage('order placement'):
+            futures = {leg.name: self.pool.submit(leg.run) for leg in (long_leg, short_leg)}
+            for future in futures.values():
+                future.exception()  # wait for both legs
+        result = {'timing': {}}
+        errors = {}
+        for name, future in futures.items():
+            try:
+                responses, timing = future.result()
+                result[name] = responses
+                result['timing'][f'{name}_submit_time'] = timing['submit_time']
+                result['timing'][f'{name}_done_time'] = timing['done_time']
+                metrics.observe('order_roundtrip_seconds', timing['done_time'] - timing['submit_time'], leg=name)
+            except Exception as e:
+                errors[name] = e
+                if getattr(e, 'responses', None):
+                    result[name] = e.responses
+                metrics.inc('pair_orders_total', result=f'{name}_failed')
+
+        if not errors:
+            long_transact = result['long']['order']['transactTime']
+            short_transact = result['short']['order']['transactTime']
+            result['timing']['leg_skew_ms'] = abs(long_transact - short_transact)
+            metrics.observe('leg_skew_ms', result['timing']['leg_skew_ms'])
+            logging.info(f"{long_leg.symbol}/{short_leg.symbol} legs filled {result['timing']['leg_skew_ms']}ms apart.")
+
+        if errors:
+            filled = [f'{name} {step}' for name in ('long', 'short') for step in result.get(name, {})]
+            raise PairExecutionError(
+                f"Pair legs failed: {', '.join(f'{k}: {v}' for k, v in errors.items())}. Filled steps: {filled or 'none'}",
+                result)
+        metrics.inc('pair_orders_total', result='filled')
+        return result
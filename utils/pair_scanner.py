@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from utils.trading_utils import BB_BAND_WINDOW, BB_SIGNAL_STD_MULT, BB_STOPLOSS_STD_MULT
+
+# signal values, same meaning as the opener's strategy strings
+SHORT_Y_LONG_X = 1
+LONG_Y_SHORT_X = -1
+STAND_BY = 0
+SIGNAL_NAMES = {SHORT_Y_LONG_X: 'short Y long X', LONG_Y_SHORT_X: 'long Y short X', STAND_BY: 'stand_by'}
+
+
+def build_close_matrix(frames, symbols, column='close'):
+    '''
+    frames: symbol -> candle df. returns (dates, T x N matrix) outer joined on date,
+    NaN where a symbol has no candle so its pairs drop out of the scan at that row.
+    '''
+    closes = pd.concat({symbol: frames[symbol].set_index('date')[column] for symbol in symbols}, axis=1)
+    closes = closes.sort_index()
+    return closes.index.values, closes.to_numpy(dtype=np.float64)
+
+
+def rolling_bands(daily_spread, window):
+    '''rolling mean and sample std (same as pandas rolling().std()) down axis 0 of a T x P matrix'''
+    rows, num_pairs = daily_spread.shape
+    if rows < window:
+        empty = np.full((0, num_pairs), np.nan)
+        return empty, empty
+    windows = sliding_window_view(daily_spread, window, axis=0)
+    return windows.mean(axis=-1), windows.std(axis=-1, ddof=1)
+
+
+def scan_pairs(minute_dates, minute_close, daily_dates, daily_close, y_idx, x_idx, ols_coeff, ols_constant,
+               window=BB_BAND_WINDOW, signal_std_mult=BB_SIGNAL_STD_MULT,
+               stoploss_std_mult=BB_STOPLOSS_STD_MULT, n_bars=2):
+    '''
+    Spread, daily bollinger band and signal state of every pair at the last minute bar, in one set of array ops.
+    Each 2h bar is compared with the band of its own day's daily spread, like the opener's date_only merge.
+    y_idx/x_idx index the columns of the close matrices, ols_coeff/ols_constant are per pair.
+    Returns one row per pair.
+    '''
+    y_idx = np.asarray(y_idx)
+    x_idx = np.asarray(x_idx)
+    ols_coeff = np.asarray(ols_coeff, dtype=np.float64)
+    ols_constant = np.asarray(ols_constant, dtype=np.float64)
+    num_pairs = len(y_idx)
+
+    # spread on the last n_bars minute bars
+    minute_rows = minute_close[-n_bars:]
+    spread = minute_rows[:, y_idx] - ols_constant - ols_coeff * minute_rows[:, x_idx]
+
+    # daily row each of those bars falls on
+    bar_days = minute_dates[-n_bars:].astype('datetime64[D]')
+    daily_days = daily_dates.astype('datetime64[D]')
+    day_pos = np.searchsorted(daily_days, bar_days)
+    found = day_pos < len(daily_days)
+    found[found] = daily_days[day_pos[found]] == bar_days[found]
+
+    # bands only for the days needed, window rows back from the earliest one
+    bar_mean = np.full((n_bars, num_pairs), np.nan)
+    bar_std = np.full((n_bars, num_pairs), np.nan)
+    if found.any():
+        first_row = max(day_pos[found].min() - window + 1, 0)
+        last_row = day_pos[found].max()
+        daily_rows = daily_close[first_row:last_row + 1]
+        daily_spread = daily_rows[:, y_idx] - ols_constant - ols_coeff * daily_rows[:, x_idx]
+        rolling_mean, rolling_std = rolling_bands(daily_spread, window)
+        band_row = day_pos - (first_row + window - 1)  # rolling output row of each bar's day
+        has_band = found & (band_row >= 0)
+        bar_mean[has_band] = rolling_mean[band_row[has_band]]
+        bar_std[has_band] = rolling_std[band_row[has_band]]
+
+    latest_spread, prev_spread = spread[-1], spread[-2]
+    latest_mean, prev_mean = bar_mean[-1], bar_mean[-2]
+    latest_std = bar_std[-1]
+    upper_band = latest_mean + latest_std * signal_std_mult
+    lower_band = latest_mean - latest_std * signal_std_mult
+    upper_stop_loss = latest_mean + latest_std * stoploss_std_mult
+    lower_stop_loss = latest_mean - latest_std * stoploss_std_mult
+
+    signal = np.where(latest_spread > upper_band, SHORT_Y_LONG_X,
+                      np.where(latest_spread < lower_band, LONG_Y_SHORT_X, STAND_BY))
+
+    return pd.DataFrame({
+        'date': np.repeat(minute_dates[-1], num_pairs),
+        'spread': latest_spread,
+        'prev_spread': prev_spread,
+        'rolling_mean': latest_mean,
+        'prev_mean': prev_mean,
+        'rolling_std': latest_std,
+        'upper_band': upper_band,
+        'lower_band': lower_band,
+        'upper_stop_loss': upper_stop_loss,
+        'lower_stop_loss': lower_stop_loss,
+        'signal': signal,
+        'crossover': (latest_spread - latest_mean) * (prev_spread - prev_mean) <= 0,
+        'upper_stopped': latest_spread >= upper_stop_loss,
+        'lower_stopped': latest_spread <= lower_stop_loss,
+    })
+
+
+def scan_pair_frames(frames, pairs_df, y_col='symbol_Y', x_col='symbol_X', hedge_ratios=None, hedge_cols=None,
+                     **kwargs):
+    '''
+    scan_pairs from candle frames. frames: symbol -> (minute_data, daily_data),
+    pairs_df needs y_col, x_col, ols_coeff and ols_constant. Returns pairs_df with the scan columns added.
+    hedge_ratios (an OnlineHedgeRatios) replaces ols_coeff/ols_constant with the current online estimates first.
+    hedge_cols: the (y, x) columns the online ratios are keyed and fitted on, when not y_col/x_col.
+    E.g. the closer scans long on short but the opener fits symbol_Y on symbol_X. Rows whose y_col leg is the
+    hedge x leg get the ratio inverted, y = constant + coeff * x as x = -constant / coeff + y / coeff.
+    '''
+    symbols = sorted(set(pairs_df[y_col]) | set(pairs_df[x_col]))
+    column = {symbol: i for i, symbol in enumerate(symbols)}
+    y_idx = pairs_df[y_col].map(column).to_numpy()
+    x_idx = pairs_df[x_col].map(column).to_numpy()
+    minute_dates, minute_close = build_close_matrix({s: frames[s][0] for s in symbols}, symbols)
+    daily_dates, daily_close = build_close_matrix({s: frames[s][1] for s in symbols}, symbols)
+    if hedge_ratios is not None:
+        hedge_y, hedge_x = hedge_cols or (y_col, x_col)
+        swapped = (pairs_df[y_col] != pairs_df[hedge_y]).to_numpy()
+        coeff, constant = hedge_ratios.update(pairs_df[hedge_y], pairs_df[hedge_x],
+                                              pairs_df['ols_coeff'].to_numpy(), pairs_df['ols_constant'].to_numpy(),
+                                              minute_dates, minute_close,
+                                              np.where(swapped, x_idx, y_idx), np.where(swapped, y_idx, x_idx))
+        if swapped.any():
+            with np.errstate(divide='ignore', invalid='ignore'):
+                coeff, constant = np.where(swapped, 1 / coeff, coeff), np.where(swapped, -constant / coeff, constant)
+        pairs_df = pairs_df.assign(ols_coeff=coeff, ols_constant=constant)
+    scan = scan_pairs(minute_dates, minute_close, daily_dates, daily_close, y_idx, x_idx,
+                      pairs_df['ols_coeff'].to_numpy(), pairs_df['ols_constant'].to_numpy(), **kwargs)
+    scan['y_price'] = minute_close[-1, y_idx]
+    scan['x_price'] = minute_close[-1, x_idx]
+    pairs_df = pairs_df.drop(columns=scan.columns.intersection(pairs_df.columns)).reset_index(drop=True)
+    return pd.concat([pairs_df, scan], axis=1)
@@ -0,0 +1,273 @@
+import itertools
+import logging
+import numpy as np
+import pandas as pd
+from utils.trading_utils import (BB_BAND_WINDOW, BB_SIGNAL_STD_MULT, BB_STOPLOSS_STD_MULT,
+                                 MIN_RECENT_COINT, MIN_R_SQUARED, TOTAL_USDT_PER_TRADE)
+from utils.margin_costs import margin_interest, MARGIN_HOURLY_INTEREST
+# side of a pair position, the scanner's signal values
+from utils.pair_scanner import LONG_Y_SHORT_X, SHORT_Y_LONG_X
+
+BACKTEST_COMMISSION_PCT = 0.001
+
+TRADE_COLUMNS = ['side', 'open_time', 'close_time', 'close_status',
+                 'long_qty', 'long_open', 'long_close', 'short_qty', 'short_open', 'short_close',
+                 'gross_pnl', 'commission', 'borrow_cost', 'net_pnl', 'holding_hours']
+
+
+def load_pair_closes(conn, symbols, start_date, end_date,
+                     hourly_table='binance_coin_hourly_historical_price', daily_table='binance_coin_historical_price'):
+    '''2h (resampled from hourly) and daily close matrices of symbols between the dates'''
+    symbol_list = ', '.join(f"'{symbol}'" for symbol in symbols)
+    matrices = []
+    for table_name in (hourly_table, daily_table):
+        query = f"""
+        SELECT symbol, date, close FROM {table_name}
+        WHERE symbol IN ({symbol_list})
+        AND date BETWEEN '{start_date}' AND '{end_date}'
+        """
+        df = pd.read_sql(query, conn)
+        df['date'] = pd.to_datetime(df['date'], utc=True).dt.tz_localize(None)
+        df['close'] = df['close'].astype(float)
+        matrices.append(df.pivot(index='date', columns='symbol', values='close').sort_index())
+    minute_df = matrices[0].resample('2h').last()
+    daily_df = matrices[1].reindex(columns=minute_df.columns)
+    return (minute_df.index.values, minute_df.to_numpy(dtype=np.float64),
+            daily_df.index.values, daily_df.to_numpy(dtype=np.float64), list(minute_df.columns))
+
+
+def live_bands(minute_dates, minute_spread, daily_dates, daily_spread, window=BB_BAND_WINDOW):
+    '''
+    Daily band of every 2h bar as the opener/closer see it live: the window - 1 completed days before the bar's day
+    plus the forming day whose close is the bar's own spread. Also the band of the previous bar as seen
+    at the current one, which is what the closer's crossover check compares against.
+    Returns rolling_mean, rolling_std and prev_mean, each T x P.
+    '''
+    daily_days = daily_dates.astype('datetime64[D]')
+    bar_days = minute_dates.astype('datetime64[D]')
+    day_pos = np.searchsorted(daily_days, bar_days)
+    found = day_pos < len(daily_days)
+    found[found] = daily_days[day_pos[found]] == bar_days[found]
+
+    # stats of the window - 1 days up to each day (inclusive), read at day_pos - 1 for "days before"
+    prior = pd.DataFrame(daily_spread).rolling(window - 1)
+    prior_mean = prior.mean().to_numpy()
+    prior_m2 = prior.var(ddof=0).to_numpy() * (window - 1)
+    prior_row = np.where(found & (day_pos > 0), day_pos - 1, -1)
+
+    def band_with(row, x):
+        m1 = np.where((row >= 0)[:, None], prior_mean[row], np.nan)
+        m2 = np.where((row >= 0)[:, None], prior_m2[row], np.nan)
+        mean = m1 + (x - m1) / window
+        std = np.sqrt((m2 + (x - m1) * (x - mean)) / (window - 1))
+        return mean, std
+
+    rolling_mean, rolling_std = band_with(prior_row, minute_spread)
+
+    # previous bar: its day's band with that day's close as known now
+    prev_spread = np.vstack([np.full((1, minute_spread.shape[1]), np.nan), minute_spread[:-1]])
+    prev_row = np.concatenate([[-1], prior_row[:-1]])
+    same_day = np.concatenate([[False], bar_days[1:] == bar_days[:-1]])
+    prev_day_close = np.where(same_day[:, None], minute_spread, prev_spread)
+    prev_mean, _ = band_with(prev_row, prev_day_close)
+    return rolling_mean, rolling_std, prev_mean
+
+
+class PairsBacktest:
+    '''
+    Replay the live pairs rules over history for many pairs at once.
+    Open when the 2h spread leaves the BB_SIGNAL_STD_MULT daily band (long the cheap leg, short the rich one),
+    close on a mean crossover (PROFIT_CLOSED) or at the BB_STOPLOSS_STD_MULT band (UPPER/LOWER_STOPPED).
+    Stopped pairs are never traded again, like the opener's blocking statuses.
+    Signals are array ops over T x pairs, the position state steps through time vectorized across pairs.
+    Both checks use the pair's Y/X spread (the live closer recomputes it with the long leg as Y).
+    '''
+
+    def __init__(self, minute_dates, minute_close, daily_dates, daily_close, symbols, pairs_df,
+                 window=BB_BAND_WINDOW, signal_std_mult=BB_SIGNAL_STD_MULT, stoploss_std_mult=BB_STOPLOSS_STD_MULT,
+                 tlt_dollar=TOTAL_USDT_PER_TRADE, commission_pct=BACKTEST_COMMISSION_PCT,
+                 hourly_interest_rate=MARGIN_HOURLY_INTEREST, pairs_per_batch=500):
+        self.minute_dates = minute_dates
+        self.minute_close = minute_close
+        self.daily_dates = daily_dates
+        self.daily_close = daily_close
+        self.column = {symbol: i for i, symbol in enumerate(symbols)}
+        self.pairs_df = pairs_df.reset_index(drop=True)  # symbol1 (Y), symbol2 (X), ols_coeff, ols_constant
+        self.window = window
+        self.signal_std_mult = signal_std_mult
+        self.stoploss_std_mult = stoploss_std_mult
+        self.tlt_dollar = tlt_dollar
+        self.commission_pct = commission_pct
+        self.hourly_interest_rate = hourly_interest_rate
+        self.pairs_per_batch = pairs_per_batch
+        self.trades_df = None
+
+    def _signals(self, y_idx, x_idx, coeff, constant):
+        minute_spread = self.minute_close[:, y_idx] - constant - coeff * self.minute_close[:, x_idx]
+        daily_spread = self.daily_close[:, y_idx] - constant - coeff * self.daily_close[:, x_idx]
+        mean, std, prev_mean = live_bands(self.minute_dates, minute_spread, self.daily_dates, daily_spread,
+                                          self.window)
+        prev_spread = np.vstack([np.full((1, len(y_idx)), np.nan), minute_spread[:-1]])
+        return {
+            'open_long_y': minute_spread < mean - std * self.signal_std_mult,
+            'open_short_y': minute_spread > mean + std * self.signal_std_mult,
+            'crossover': (minute_spread - mean) * (prev_spread - prev_mean) <= 0,
+            'upper_stopped': minute_spread >= mean + std * self.stoploss_std_mult,
+            'lower_stopped': minute_spread <= mean - std * self.stoploss_std_mult,
+            'tradable': np.isfinite(minute_spread),
+        }
+
+    def _step_positions(self, signals):
+        '''walk the bars, returns (pair, side, open_row, close_row, close_status) of every round trip'''
+        num_bars, num_pairs = signals['tradable'].shape
+        side = np.zeros(num_pairs, dtype=np.int8)
+        open_row = np.full(num_pairs, -1)
+        blocked = np.zeros(num_pairs, dtype=bool)
+        last_row = np.full(num_pairs, -1)
+        trades = []
+        for t in range(1, num_bars):
+            holding = side != 0
+            stopped_up = holding & signals['upper_stopped'][t]
+            stopped_low = holding & signals['lower_stopped'][t]
+            closing = holding & (signals['crossover'][t] | stopped_up | stopped_low)
+            for i in np.flatnonzero(closing):
+                status = 'LOWER_STOPPED' if stopped_low[i] else 'UPPER_STOPPED' if stopped_up[i] else 'PROFIT_CLOSED'
+                trades.append((i, side[i], open_row[i], t, status))
+            blocked |= stopped_up | stopped_low
+            side[closing] = 0
+
+            free = (side == 0) & ~blocked & ~closing
+            long_y = free & signals['open_long_y'][t]
+            short_y = free & signals['open_short_y'][t]
+            side[long_y] = LONG_Y_SHORT_X
+            side[short_y] = SHORT_Y_LONG_X
+            open_row[long_y | short_y] = t
+            last_row[signals['tradable'][t]] = t
+
+        # still open at the end: closed on the pair's last tradable bar
+        for i in np.flatnonzero(side != 0):
+            trades.append((i, side[i], open_row[i], last_row[i], 'END_OF_TEST'))
+        return trades
+
+    def _trade_results(self, trades, y_idx, x_idx, coeff):
+        '''prices, pnl, commission, borrow cost and holding time of the round trips, as arrays'''
+        pair, side, open_row, close_row, status = (np.array(column) for column in zip(*trades))
+        y_col, x_col, pair_coeff = y_idx[pair], x_idx[pair], coeff[pair]
+        y_open, x_open = self.minute_close[open_row, y_col], self.minute_close[open_row, x_col]
+        y_close, x_close = self.minute_close[close_row, y_col], self.minute_close[close_row, x_col]
+
+        # same sizing as the opener
+        amt_Y = self.tlt_dollar / (x_open * pair_coeff + y_open)
+        amt_X = pair_coeff * amt_Y
+        long_y = side == LONG_Y_SHORT_X
+        long_qty, short_qty = np.where(long_y, amt_Y, amt_X), np.where(long_y, amt_X, amt_Y)
+        long_open, long_close = np.where(long_y, y_open, x_open), np.where(long_y, y_close, x_close)
+        short_open, short_close = np.where(long_y, x_open, y_open), np.where(long_y, x_close, y_close)
+
+        gross_pnl = long_qty * (long_close - long_open) + short_qty * (short_open - short_close)
+        commission = self.commission_pct * (long_qty * (long_open + long_close) + short_qty * (short_open + short_close))
+        open_time = self.minute_dates[open_row]
+        close_time = self.minute_dates[close_row]
+        holding_hours = (close_time - open_time) / np.timedelta64(1, 'h')
+        borrow_cost = margin_interest(short_qty * short_open, open_time, close_time, self.hourly_interest_rate)
+        return pd.DataFrame({
+            'pair_index': pair,
+            'side': np.where(long_y, 'long Y short X', 'short Y long X'),
+            'open_time': open_time,
+            'close_time': close_time,
+            'close_status': status,
+            'long_qty': long_qty,
+            'long_open': long_open,
+            'long_close': long_close,
+            'short_qty': short_qty,
+            'short_open': short_open,
+            'short_close': short_close,
+            'gross_pnl': gross_pnl,
+            'commission': commission,
+            'borrow_cost': borrow_cost,
+            'net_pnl': gross_pnl - commission - borrow_cost,
+            'holding_hours': holding_hours,
+        })
+
+    def run(self):
+        y_all = self.pairs_df['symbol1'].map(self.column).to_numpy()
+        x_all = self.pairs_df['symbol2'].map(self.column).to_numpy()
+        coeff_all = self.pairs_df['ols_coeff'].to_numpy(dtype=np.float64)
+        constant_all = self.pairs_df['ols_constant'].to_numpy(dtype=np.float64)
+        results = []
+        for start in range(0, len(self.pairs_df), self.pairs_per_batch):
+            batch = slice(start, start + self.pairs_per_batch)
+            y_idx, x_idx, coeff = y_all[batch], x_all[batch], coeff_all[batch]
+            trades = self._step_positions(self._signals(y_idx, x_idx, coeff, constant_all[batch]))
+            if trades:
+                batch_df = self._trade_results(trades, y_idx, x_idx, coeff)
+                batch_df['pair_index'] += start
+                results.append(batch_df)
+        if results:
+            trades_df = pd.concat(results, ignore_index=True)
+        else:
+            trades_df = pd.DataFrame(columns=['pair_index'] + TRADE_COLUMNS)
+        pair_cols = self.pairs_df[['symbol1', 'symbol2']].rename(columns={'symbol1': 'symbol_Y', 'symbol2': 'symbol_X'})
+        self.trades_df = pd.concat([pair_cols.iloc[trades_df['pair_index']].reset_index(drop=True),
+                                    trades_df.drop(columns='pair_index').reset_index(drop=True)], axis=1)
+        logging.info(f"Backtested {len(self.pairs_df)} pairs, {len(self.trades_df)} round trips.")
+        return self.trades_df
+
+    def pair_summary(self):
+        '''per pair trade count, pnl, borrow cost, win rate and holding time'''
+        trades_df = self.trades_df
+        summary = trades_df.groupby(['symbol_Y', 'symbol_X']).agg(
+            num_trades=('net_pnl', 'size'),
+            net_pnl=('net_pnl', 'sum'),
+            gross_pnl=('gross_pnl', 'sum'),
+            commission=('commission', 'sum'),
+            borrow_cost=('borrow_cost', 'sum'),
+            win_rate=('net_pnl', lambda pnl: (pnl > 0).mean()),
+            avg_holding_hours=('holding_hours', 'mean'),
+            num_stopped=('close_status', lambda status: status.str.endswith('STOPPED').sum()),
+        ).reset_index()
+        return summary
+
+
+def tune_pairs_backtest(minute_dates, minute_close, daily_dates, daily_close, symbols, signal_df, param_grid, **kwargs):
+    '''
+    Grid over min_recent_coint, min_r_squared, signal_std_mult and stoploss_std_mult.
+    Pairs trade independently, so each band setting is backtested once on the loosest coint selection
+    and the coint thresholds just filter its trades. signal_df is coin_signal, note today's coin_signal
+    applied to the past is optimistic.
+    '''
+    min_recent_coints = param_grid.get('min_recent_coint', [MIN_RECENT_COINT])
+    min_r_squareds = param_grid.get('min_r_squared', [MIN_R_SQUARED])
+    candidates = signal_df[(signal_df['most_recent_coint_pct'] >= min(min_recent_coints)) &
+                           (signal_df['r_squared'] >= min(min_r_squareds))]
+    candidates = candidates[candidates['symbol1'].isin(symbols) & candidates['symbol2'].isin(symbols)]
+    results = []
+    for signal_std_mult, stoploss_std_mult in itertools.product(
+            param_grid.get('signal_std_mult', [BB_SIGNAL_STD_MULT]),
+            param_grid.get('stoploss_std_mult', [BB_STOPLOSS_STD_MULT])):
+        backtest = PairsBacktest(minute_dates, minute_close, daily_dates, daily_close, symbols, candidates,
+                                 signal_std_mult=signal_std_mult, stoploss_std_mult=stoploss_std_mult, **kwargs)
+        trades_df = backtest.run().merge(
+            candidates.rename(columns={'symbol1': 'symbol_Y', 'symbol2': 'symbol_X'}), on=['symbol_Y', 'symbol_X'])
+        for min_recent_coint, min_r_squared in itertools.product(min_recent_coints, min_r_squareds):
+            selected = candidates[(candidates['most_recent_coint_pct'] >= min_recent_coint) &
+                                  (candidates['r_squared'] >= min_r_squared)]
+            trades = trades_df[(trades_df['most_recent_coint_pct'] >= min_recent_coint) &
+                               (trades_df['r_squared'] >= min_r_squared)]
+            results.append({
+                'min_recent_coint': min_recent_coint,
+                'min_r_squared': min_r_squared,
+                'signal_std_mult': signal_std_mult,
+                'stoploss_std_mult': stoploss_std_mult,
+                'num_pairs': len(selected),
+                'num_trades': len(trades),
+                'net_pnl': trades['net_pnl'].sum(),
+                'borrow_cost': trades['borrow_cost'].sum(),
+                'commission': trades['commission'].sum(),
+                'win_rate': (trades['net_pnl'] > 0).mean() if len(trades) else 0,
+                'stopped_pct': trades['close_status'].str.endswith('STOPPED').mean() if len(trades) else 0,
+                'avg_holding_hours': trades['holding_hours'].mean() if len(trades) else 0,
+            })
+            logging.info(f"coint>={min_recent_coint} r2>={min_r_squared} band {signal_std_mult}/{stoploss_std_mult}: "
+                         f"{len(trades)} trades, net ${trades['net_pnl'].sum():.2f}")
+    return pd.DataFrame(results)
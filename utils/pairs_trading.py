@@ -0,0 +1,345 @@
+import pandas as pd
+from datetime import datetime
+from binance.client import Client
+from binance.enums import *
+from utils.trading_utils import *
+from utils.market_data import MarketDataSession
+from utils.candidate_pairs import CANDIDATE_PAIRS_QUERY
+from utils.pair_scanner import scan_pair_frames, SIGNAL_NAMES, STAND_BY, LONG_Y_SHORT_X
+from utils.position_store import load_position_store
+from utils.pair_execution import PairOrderExecutor, PairExecutionError
+from utils.hedge_ratio import HedgeRatioStore, OnlineHedgeRatios, HEDGE_RATIO_ESTIMATORS
+from utils.metrics import NULL_METRICS
+from utils.trade_writer import TradeWriter
+
+'''open scan and close checks of the pairs bot, shared by opener.py, closer.py and trading_service.py'''
+
+PARTIAL = 'PARTIAL'
+
+
+class PairsTradingContext:
+    '''
+    State shared by the open scan and the close checks.
+    Keeps the binance client, the db connection, the market data source and the position store alive across runs.
+    metrics is optional, a BotMetrics the stages, api calls and orders of each run are recorded to.
+    '''
+
+    def __init__(self, client, db_params, bar_source=None, candidate_max_age=300, positions=None, metrics=None):
+        self.client = client
+        self.metrics = metrics or NULL_METRICS
+        self.db_params = db_params  # (DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD)
+        self.bar_source = bar_source
+        self.candidate_max_age = candidate_max_age
+        self.conn = None
+        self.executor = PairOrderExecutor(client, metrics=self.metrics)
+        # fills and strategy decisions are written behind the trading loop, on a connection of its own
+        self.writer = TradeWriter(lambda: connect_to_db(*self.db_params), trade_journal_file, metrics=self.metrics)
+        self.positions = positions or load_position_store(position_db_file, order_csv_file)
+        self.candidates_df = None
+        self.candidates_time = None
+        # coin_signal ratios unless ONLINE_HEDGE_RATIO picks an online estimator
+        self.hedge_ratios = None
+        if ONLINE_HEDGE_RATIO:
+            self.hedge_ratios = OnlineHedgeRatios(HedgeRatioStore(hedge_ratio_db_file),
+                                                  HEDGE_RATIO_ESTIMATORS[ONLINE_HEDGE_RATIO]())
+
+    def get_conn(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = connect_to_db(*self.db_params)
+        return self.conn
+
+    def get_candidate_pairs(self):
+        '''candidate pairs from coin_signal, requeried at most every candidate_max_age seconds'''
+        if (self.candidates_df is None or
+                (datetime.now() - self.candidates_time).total_seconds() >= self.candidate_max_age):
+            with self.metrics.stage('candidate sql'):
+                self.candidates_df = pd.read_sql(CANDIDATE_PAIRS_QUERY, self.get_conn())
+            self.candidates_time = datetime.now()
+        return self.candidates_df
+
+    def new_market_data_session(self):
+        return MarketDataSession(self.client, bar_source=self.bar_source)
+
+    def close(self):
+        self.writer.close()
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+        self.positions.close()
+        if self.hedge_ratios is not None:
+            self.hedge_ratios.store.close()
+
+
+def partial_order_row(symbol_Y, symbol_X, long_symbol, short_symbol, result):
+    '''
+    order row of a pair where only some legs or steps filled, the filled orders' columns as pairs_order_to_pd_df
+    has them. A margin loan or repay that went through without its order keeps its tranId and short_loan_amount.
+    '''
+    row = {'pair_trade_status': PARTIAL, 'symbol_Y': symbol_Y, 'symbol_X': symbol_X,
+           'long_symbol': long_symbol, 'short_symbol': short_symbol}
+    for name in ('long', 'short'):
+        responses = result.get(name, {})
+        if 'loan' in responses:
+            row['short_loanId'] = str(responses['loan']['tranId'])
+            row['short_loan_amount'] = float(responses['loan']['amount'])
+        if 'order' not in responses:
+            continue
+        order = responses['order']
+        row.update({
+            f'{name}_time': datetime.fromtimestamp(order['transactTime'] / 1000).strftime('%Y-%m-%d %H:%M:%S'),
+            f'{name}_side': order['side'],
+            f'{name}_quantity': float(order['executedQty']),
+            f'{name}_usdt_amt': float(order['cummulativeQuoteQty']),
+            f'{name}_status': order['status'],
+            f'{name}_orderId': str(order['orderId']),
+            f'{name}_clientOrderId': str(order['clientOrderId']),
+        })
+    row.update(result.get('timing', {}))
+    return row
+
+
+def record_partial_fill(ctx, error, symbol_Y, symbol_X, long_symbol, short_symbol, position_id=None):
+    '''
+    Keep whatever did go through when a leg failed: filled orders go to the trade journal and the pair to PARTIAL
+    (a new position on open, a transition of position_id on close), which blocks it until resolved by hand.
+    That includes a failed leg's completed steps, e.g. a loan whose margin sell failed or a buy back whose
+    repay failed.
+    '''
+    done_steps = [(name, step) for name in ('long', 'short') for step in error.result.get(name, {})]
+    if not done_steps:
+        return
+    filled_orders = [error.result[name]['order'] for name, step in done_steps if step == 'order']
+    row = partial_order_row(symbol_Y, symbol_X, long_symbol, short_symbol, error.result)
+    if filled_orders:
+        with ctx.metrics.stage('db write'):
+            ctx.writer.record_fills(filled_orders)
+    with ctx.metrics.stage('position write'):
+        if position_id is None:
+            ctx.positions.open_position(row, PARTIAL)
+        else:
+            ctx.positions.transition(position_id, PARTIAL, row)
+    print(f"Only {', '.join(f'{name} {step}' for name, step in done_steps)} went through for {symbol_Y} X {symbol_X}. "
+          f"Recorded it as {PARTIAL}, unwind it by hand.")
+
+
+def scan_candidate_pairs(ctx, monitored_pairs_df):
+    '''
+    Scan every candidate pair not already traded in one vectorized pass.
+    Returns the scanned pairs (bands, signal and latest prices added) and how many were skipped as traded.
+    '''
+    pairs_df = pd.DataFrame({
+        'symbol_Y': monitored_pairs_df['symbol_a'] + 'USDT',
+        'symbol_X': monitored_pairs_df['symbol_b'] + 'USDT',
+        'ols_coeff': monitored_pairs_df['ols_coeff'],
+        'ols_constant': monitored_pairs_df['ols_constant'],
+    })
+    is_traded = [bool(ctx.positions.is_active(symbol_Y, symbol_X))
+                 for symbol_Y, symbol_X in zip(pairs_df['symbol_Y'], pairs_df['symbol_X'])]
+    pairs_df = pairs_df[[not traded for traded in is_traded]]
+
+    # fetch each symbol once for all candidate pairs not already traded
+    market_data = ctx.new_market_data_session()
+    with ctx.metrics.stage('market data'):
+        market_data.prefetch(set(pairs_df['symbol_Y']) | set(pairs_df['symbol_X']))
+    for symbol, error in market_data.errors.items():
+        print(f"No Data for {symbol} on Binance: {str(error)}")
+    pairs_df = pairs_df[pairs_df['symbol_Y'].isin(list(market_data.data)) & pairs_df['symbol_X'].isin(list(market_data.data))]
+    if pairs_df.empty:
+        return pairs_df, sum(is_traded)
+    with ctx.metrics.stage('spread math'):
+        scan = scan_pair_frames(market_data.data, pairs_df, hedge_ratios=ctx.hedge_ratios)
+    return scan, sum(is_traded)
+
+
+def run_open_scan(ctx):
+    '''check every candidate pair and open a long/short position when the spread leaves the bands'''
+    monitored_pairs_df = ctx.get_candidate_pairs()
+    client = ctx.client
+    with ctx.metrics.stage('exchange filters'):
+        symbol_filters.ensure_fresh(client)
+    strat_csv_file = get_strat_csv_file()
+
+    scan, num_traded = scan_candidate_pairs(ctx, monitored_pairs_df)
+    if scan.empty:
+        print(f"---\n No pairs to scan, {num_traded} ALREADY TRADED.")
+        return
+    signals = scan[scan['signal'] != STAND_BY]
+    print(f"---\n Scanned {len(scan)} pairs, {num_traded} ALREADY TRADED, {len(signals)} signals.")
+
+    # one journal entry for the whole scan, the csv append happens in the writer
+    latest_strat = pd.DataFrame({'date': scan['date'],
+                                 'symbol_Y': scan['symbol_Y'],
+                                 'symbol_X': scan['symbol_X'],
+                                 'strategy': scan['signal'].map(SIGNAL_NAMES)})
+    with ctx.metrics.stage('csv write'):
+        ctx.writer.record_decisions(latest_strat, strat_csv_file)
+
+    '''Execute trade at prime condition'''
+    for latest_min in signals.to_dict('records'):
+        symbol_Y = latest_min['symbol_Y']
+        symbol_X = latest_min['symbol_X']
+        ols_coeff = latest_min['ols_coeff']
+        ols_constant = latest_min['ols_constant']
+        print(
+            f"---\n {symbol_Y} X {symbol_X} - coeff:{round(ols_coeff,2)} constant:{round(ols_constant,2)}")
+        print(
+            f"current:{round(latest_min['spread'], 2)} upper:{round(latest_min['upper_band'], 2)} lower:{round(latest_min['lower_band'], 2)}")
+        print(f"Executing a trade for {symbol_Y}X{symbol_X}...")
+
+        # determine order size with formula, rounded to the symbols' exchange filters
+        curr_price_Y = symbol_filters.round_price(symbol_Y, latest_min['y_price'])
+        curr_price_X = symbol_filters.round_price(symbol_X, latest_min['x_price'])
+
+        amt_Y = symbol_filters.round_qty(
+            symbol_Y, TOTAL_USDT_PER_TRADE / (curr_price_X * ols_coeff + curr_price_Y))
+        amt_X = symbol_filters.round_qty(symbol_X, ols_coeff * amt_Y)
+
+        usdt_on_Y = amt_Y * curr_price_Y
+        usdt_on_X = amt_X * curr_price_X
+        print("curr_price_Y, amt_Y, curr_price_X, amt_X, usdt_on_Y, usdt_on_X")
+        print(curr_price_Y, amt_Y, curr_price_X, amt_X, usdt_on_Y, usdt_on_X)
+
+        if not (symbol_filters.is_tradable(symbol_Y, amt_Y, curr_price_Y) and
+                symbol_filters.is_tradable(symbol_X, amt_X, curr_price_X)):
+            print(f"{symbol_Y}X{symbol_X} not TRADING or order size below LOT_SIZE/NOTIONAL minimum. NO TRADE")
+            continue
+
+        if latest_min['signal'] == LONG_Y_SHORT_X:
+            long_symbol, long_amt, long_price = symbol_Y, amt_Y, curr_price_Y
+            short_symbol, short_amt, short_price = symbol_X, amt_X, curr_price_X
+        else:
+            long_symbol, long_amt, long_price = symbol_X, amt_X, curr_price_X
+            short_symbol, short_amt, short_price = symbol_Y, amt_Y, curr_price_Y
+
+        # long one leg, borrow and short the other, both at once
+        try:
+            fills = ctx.executor.execute(*ctx.executor.prepare_open(
+                long_symbol, long_amt, short_symbol, short_amt))
+        except PairExecutionError as e:
+            print(f"An error occurred opening {symbol_Y} X {symbol_X}: {str(e)}")
+            record_partial_fill(ctx, e, symbol_Y, symbol_X, long_symbol, short_symbol)
+            continue
+        long_order = fills['long']['order']
+        short_order = fills['short']['order']
+        short_loan = fills['short']['loan']
+        print(
+            f'longed {long_symbol}. bought {long_amt} of them of ${long_amt*long_price}')
+        print(
+            f'shorted {short_symbol}. short sold {short_amt} of them of ${short_amt*short_price}')
+
+        # persist once both legs are filled
+        with ctx.metrics.stage('db write'):
+            ctx.writer.record_fills([long_order, short_order])
+        position = pairs_order_to_pd_df("OPEN",
+                                        latest_min,
+                                        ols_coeff,
+                                        ols_constant,
+                                        long_order,
+                                        short_order,
+                                        short_loan,
+                                        symbol_Y,
+                                        symbol_X).iloc[0].to_dict()
+        position.update(fills['timing'])
+        with ctx.metrics.stage('position write'):
+            ctx.positions.open_position(position)
+        print(f'Recorded the new position to {position_db_file}!')
+
+
+def run_close_checks(ctx):
+    '''close open pairs on a mean crossover or when the spread reaches a stop loss band'''
+    client = ctx.client
+    open_positions = ctx.positions.open_positions()
+    if not open_positions:
+        print('no existing open order.')
+        return
+    with ctx.metrics.stage('exchange filters'):
+        symbol_filters.ensure_fresh(client)
+
+    # fetch each symbol once for all open pairs, then scan them together
+    market_data = ctx.new_market_data_session()
+    with ctx.metrics.stage('market data'):
+        market_data.prefetch([row['long_symbol'] for row in open_positions] +
+                             [row['short_symbol'] for row in open_positions])
+    for symbol, error in market_data.errors.items():
+        print(f"No Data for {symbol} on Binance: {str(error)}")
+    open_positions = [row for row in open_positions
+                      if row['long_symbol'] in market_data.data and row['short_symbol'] in market_data.data]
+    if not open_positions:
+        return
+    with ctx.metrics.stage('spread math'):
+        # spread of long on short as opened, the online ratio is the opener's symbol_Y on symbol_X state
+        scan = scan_pair_frames(market_data.data, pd.DataFrame(open_positions),
+                                y_col='long_symbol', x_col='short_symbol', hedge_ratios=ctx.hedge_ratios,
+                                hedge_cols=('symbol_Y', 'symbol_X'))
+
+    for row in scan.to_dict('records'):
+        symbol_Y = row['symbol_Y']
+        symbol_X = row['symbol_X']
+        long_symbol = row['long_symbol']
+        short_symbol = row['short_symbol']
+        ols_coeff = row['ols_coeff']
+        ols_constant = row['ols_constant']
+        latest_min = row
+
+        # crossover detected
+        if row['crossover'] or row['upper_stopped'] or row['lower_stopped']:
+            try:
+                if row['crossover']:
+                    print(
+                        f"Crossover detected between {symbol_Y} X {symbol_X}.")
+                    close_status = 'PROFIT_CLOSED'
+                if row['upper_stopped']:
+                    print(
+                        f"Upper Stop loss band reached between {symbol_Y} X {symbol_X}.")
+                    close_status = 'UPPER_STOPPED'
+                if row['lower_stopped']:
+                    print(
+                        f"Lower Stop loss band reached between {symbol_Y} X {symbol_X}.")
+                    close_status = 'LOWER_STOPPED'
+
+                # loan lookup is done up front so both legs can go out together
+                loan_detail = client.get_margin_loan_details(
+                    asset=short_symbol.replace(
+                        'USDT', ''), txId=str(row['short_loanId']))
+                coin_amt_to_sell = symbol_filters.round_qty(
+                    long_symbol, row['long_quantity'])
+                coin_amt_to_repay = symbol_filters.round_qty(
+                    short_symbol, loan_detail['rows'][0]['principal'])
+
+                # sell the long, buy back the short and repay the loan
+                fills = ctx.executor.execute(*ctx.executor.prepare_close(
+                    long_symbol, coin_amt_to_sell, short_symbol, coin_amt_to_repay))
+                close_long_order = fills['long']['order']
+                short_repurchase = fills['short']['order']
+                close_short_loan = fills['short']['loan']
+                print(
+                    f'Closed long order for {long_symbol}. Sold {coin_amt_to_sell} of them.')
+                print(
+                    f'Closed short order for {short_symbol}. Repaid {coin_amt_to_repay} of them.')
+
+                # position only moves once both legs are closed
+                closing_trade = pairs_order_to_pd_df("CLOSING_TRADE",
+                                                     latest_min,
+                                                     ols_coeff,
+                                                     ols_constant,
+                                                     close_long_order,
+                                                     short_repurchase,
+                                                     close_short_loan,
+                                                     symbol_Y,
+                                                     symbol_X).iloc[0].to_dict()
+                closing_trade.update(fills['timing'])
+                with ctx.metrics.stage('position write'):
+                    ctx.positions.transition(row['position_id'], close_status, closing_trade)
+
+                with ctx.metrics.stage('db write'):
+                    ctx.writer.record_fills([close_long_order, short_repurchase])
+            except PairExecutionError as e:
+                print(f"An error occurred executing orders: {str(e)}")
+                record_partial_fill(ctx, e, symbol_Y, symbol_X, long_symbol, short_symbol, row['position_id'])
+                continue
+            except Exception as e:
+                print(f"An error occurred executing orders: {str(e)}")
+                continue
+        else:
+            print(f'{symbol_Y} X {symbol_X} spread is NORMAL at {datetime.now()}.')
+
+    print('Went through all orders :)')
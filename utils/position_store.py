@@ -0,0 +1,225 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+import pandas as pd
+from datetime import datetime
+
+# a pair with a position in one of these is not traded again
+# PARTIAL: only one leg filled on open or close, the pair waits until someone unwinds it by hand
+BLOCKING_STATUSES = ('OPEN', 'UPPER_STOPPED', 'LOWER_STOPPED', 'PARTIAL')
+
+# column layout of the legacy order_df.csv
+ORDERS_DF_DTYPES = {
+    'pair_trade_status': 'str',
+    'symbol_Y': 'str',
+    'symbol_X': 'str',
+    'long_symbol': 'str',
+    'long_time': 'str',
+    'long_side': 'str',
+    'long_quantity': 'float64',
+    'long_usdt_amt': 'float64',
+    'long_status': 'str',
+    'long_orderId': 'str',
+    'long_clientOrderId': 'str',
+    'short_symbol': 'str',
+    'short_time': 'str',
+    'short_side': 'str',
+    'short_quantity': 'float64',
+    'short_usdt_amt': 'float64',
+    'short_status': 'str',
+    'short_loanId': 'str',
+    'short_orderId': 'str',
+    'short_clientOrderId': 'str',
+    'ols_coeff': 'float64',
+    'ols_constant': 'float64',
+    'lower_band': 'float64',
+    'spread': 'float64',
+    'upper_band': 'float64'
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    position_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pair_key TEXT NOT NULL,
+    symbol_Y TEXT NOT NULL,
+    symbol_X TEXT NOT NULL,
+    status TEXT NOT NULL,
+    opened_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    open_order TEXT NOT NULL,
+    close_order TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_positions_pair_status ON positions (pair_key, status);
+CREATE INDEX IF NOT EXISTS idx_positions_status ON positions (status);
+CREATE TABLE IF NOT EXISTS position_events (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    position_id INTEGER NOT NULL REFERENCES positions (position_id),
+    status TEXT NOT NULL,
+    event_time TEXT NOT NULL,
+    order_row TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_position_events_position ON position_events (position_id);
+"""
+
+
+def get_pair_key(symbol_Y, symbol_X):
+    '''same key whichever leg is Y'''
+    return '|'.join(sorted((symbol_Y, symbol_X)))
+
+
+def _to_json(order_row):
+    return None if order_row is None else json.dumps(order_row, default=str)
+
+
+class PositionStore:
+    '''
+    Pairs positions in sqlite, keyed by the unordered pair and status.
+    positions holds the current status of each position, position_events is the append-only transition log.
+    Blocking pairs are also kept in memory so "is this pair active" never touches disk.
+    '''
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+        self.blocking = {}  # pair_key -> {position_id: status}
+        placeholders = ','.join('?' * len(BLOCKING_STATUSES))
+        rows = self.conn.execute(
+            f"SELECT position_id, pair_key, status FROM positions WHERE status IN ({placeholders})",
+            BLOCKING_STATUSES).fetchall()
+        for row in rows:
+            self.blocking.setdefault(row['pair_key'], {})[row['position_id']] = row['status']
+
+    def _track(self, pair_key, position_id, status):
+        positions = self.blocking.setdefault(pair_key, {})
+        if status in BLOCKING_STATUSES:
+            positions[position_id] = status
+        else:
+            positions.pop(position_id, None)
+        if not positions:
+            del self.blocking[pair_key]
+
+    def is_active(self, symbol_Y, symbol_X):
+        '''status blocking the pair from being traded again, None if it is free'''
+        positions = self.blocking.get(get_pair_key(symbol_Y, symbol_X))
+        return next(iter(positions.values())) if positions else None
+
+    def has_open_positions(self):
+        return any('OPEN' in positions.values() for positions in self.blocking.values())
+
+    def open_position(self, order_row, status='OPEN', event_time=None):
+        '''order_row is one row of pairs_order_to_pd_df as a dict'''
+        event_time = event_time or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        pair_key = get_pair_key(order_row['symbol_Y'], order_row['symbol_X'])
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                """INSERT INTO positions (pair_key, symbol_Y, symbol_X, status, opened_at, updated_at, open_order)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (pair_key, order_row['symbol_Y'], order_row['symbol_X'], status,
+                 event_time, event_time, _to_json(order_row)))
+            position_id = cursor.lastrowid
+            self.conn.execute(
+                "INSERT INTO position_events (position_id, status, event_time, order_row) VALUES (?, ?, ?, ?)",
+                (position_id, status, event_time, _to_json(order_row)))
+        self._track(pair_key, position_id, status)
+        return position_id
+
+    def transition(self, position_id, status, order_row=None, event_time=None):
+        '''move a position to a new status, order_row is the closing trade if there is one'''
+        event_time = event_time or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self.lock, self.conn:
+            pair_key = self.conn.execute(
+                "SELECT pair_key FROM positions WHERE position_id = ?", (position_id,)).fetchone()['pair_key']
+            if order_row is None:
+                self.conn.execute(
+                    "UPDATE positions SET status = ?, updated_at = ? WHERE position_id = ?",
+                    (status, event_time, position_id))
+            else:
+                self.conn.execute(
+                    "UPDATE positions SET status = ?, updated_at = ?, close_order = ? WHERE position_id = ?",
+                    (status, event_time, _to_json(order_row), position_id))
+            self.conn.execute(
+                "INSERT INTO position_events (position_id, status, event_time, order_row) VALUES (?, ?, ?, ?)",
+                (position_id, status, event_time, _to_json(order_row)))
+        self._track(pair_key, position_id, status)
+
+    def open_positions(self):
+        '''open order rows of every OPEN position, with their position_id'''
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT position_id, open_order FROM positions WHERE status = 'OPEN' ORDER BY position_id").fetchall()
+        positions = []
+        for row in rows:
+            position = json.loads(row['open_order'])
+            position['position_id'] = row['position_id']
+            positions.append(position)
+        return positions
+
+    def to_orders_df(self):
+        '''legacy order_df.csv layout: the open row with its current status, then the closing trade row if any'''
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT status, open_order, close_order FROM positions ORDER BY position_id").fetchall()
+        records = []
+        for row in rows:
+            open_order = json.loads(row['open_order'])
+            open_order['pair_trade_status'] = row['status']
+            records.append(open_order)
+            if row['close_order'] is not None:
+                records.append(json.loads(row['close_order']))
+        if not records:
+            return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in ORDERS_DF_DTYPES.items()})
+        return pd.DataFrame(records).reindex(columns=list(ORDERS_DF_DTYPES))
+
+    def export_orders_csv(self, file_path):
+        self.to_orders_df().to_csv(file_path, index=False)
+
+    def import_orders_csv(self, file_path):
+        '''
+        Load an existing order_df.csv. Each non CLOSING_TRADE row becomes a position with its recorded status,
+        each CLOSING_TRADE row is attached to the latest closed position of the same pair still missing one.
+        '''
+        orders_df = pd.read_csv(file_path, dtype={'long_orderId': str, 'long_clientOrderId': str,
+                                                  'short_loanId': str, 'short_orderId': str,
+                                                  'short_clientOrderId': str})
+        orders_df = orders_df.astype(object).where(orders_df.notna(), None)
+        awaiting_close = {}  # pair_key -> position ids closed without a closing trade row
+        num_positions = 0
+        for record in orders_df.to_dict('records'):
+            pair_key = get_pair_key(record['symbol_Y'], record['symbol_X'])
+            event_time = record.get('long_time') or None
+            if record['pair_trade_status'] == 'CLOSING_TRADE':
+                if awaiting_close.get(pair_key):
+                    position_id = awaiting_close[pair_key].pop()
+                    status = self.conn.execute(
+                        "SELECT status FROM positions WHERE position_id = ?", (position_id,)).fetchone()['status']
+                    self.transition(position_id, status, record, event_time)
+                else:
+                    logging.warning(f"Closing trade for {pair_key} at {event_time} has no matching position, skipped.")
+                continue
+            position_id = self.open_position(record, record['pair_trade_status'], event_time)
+            num_positions += 1
+            if record['pair_trade_status'] != 'OPEN':
+                awaiting_close.setdefault(pair_key, []).append(position_id)
+        logging.info(f"Imported {num_positions} positions from {file_path}.")
+
+    def is_empty(self):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM positions LIMIT 1").fetchone() is None
+
+    def close(self):
+        self.conn.close()
+
+
+def load_position_store(db_path, legacy_csv_path=None):
+    '''open the store, importing the legacy order csv the first time'''
+    store = PositionStore(db_path)
+    if store.is_empty() and legacy_csv_path and os.path.exists(legacy_csv_path):
+        store.import_orders_csv(legacy_csv_path)
+    return store
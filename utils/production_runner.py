@@ -0,0 +1,231 @@
+import os
+import json
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from utils.trading_utils import candle_cache, MINUTE_LOOKBACK_DAYS, DAILY_LOOKBACK_DAYS
+from utils.strat_utils import Strategy, BinanceProductionStrategy
+from utils.order_journal import load_order_journal
+from utils.order_queue import OrderQueue
+from utils.metrics import NULL_METRICS
+import utils.child_strats as child_strats
+
+RUNNER_WORKERS = 4
+DEFAULT_TRADE_INTERVAL = '2h'
+DEFAULT_INDICATOR_INTERVAL = '1d'
+# days of candles fetched per interval, the lookbacks get_bn_data uses
+INTERVAL_LOOKBACK_DAYS = {'2h': MINUTE_LOOKBACK_DAYS, '1d': DAILY_LOOKBACK_DAYS}
+# Strategy.__init__ arguments are trading params, anything else a strategy takes feeds its indicators
+BASE_STRATEGY_PARAMS = set(inspect.signature(Strategy.__init__).parameters) - {'self'}
+
+_production_classes = {}
+
+
+def production_class(strat_class):
+    '''
+    The strategy's open/close logic and indicators on BinanceProductionStrategy's orders and run_once,
+    e.g. StoneWellStrategy, written against TestStrategy, becomes StoneWellStrategyProduction.
+    '''
+    if issubclass(strat_class, BinanceProductionStrategy):
+        return strat_class
+    if strat_class not in _production_classes:
+        _production_classes[strat_class] = type(f'{strat_class.__name__}Production',
+                                                (BinanceProductionStrategy, strat_class), {})
+    return _production_classes[strat_class]
+
+
+class StrategyConfig:
+    '''one entry of the runner config: a strategy class with its params traded on a list of symbols'''
+
+    def __init__(self, name, strategy, params, symbols, trade_interval=DEFAULT_TRADE_INTERVAL,
+                 indicator_interval=DEFAULT_INDICATOR_INTERVAL):
+        self.name = name  # also the name of its journal
+        self.strat_class = production_class(getattr(child_strats, strategy))
+        self.params = params
+        self.symbols = symbols
+        self.trade_interval = trade_interval
+        self.indicator_interval = indicator_interval
+
+    def indicator_key(self, symbol):
+        '''strategies with the same key compute the same indicator frame'''
+        indicator_params = tuple(sorted((name, value) for name, value in self.params.items()
+                                        if name not in BASE_STRATEGY_PARAMS))
+        return (self.strat_class.__name__, indicator_params, symbol, self.indicator_interval)
+
+
+def load_runner_config(file_path):
+    '''
+    json config: {"strategies": [{"name": "stonewell", "strategy": "StoneWellStrategy", "symbols": ["BTCUSDT"],
+    "trade_interval": "2h", "indicator_interval": "1d", "params": {...}}]}, params are the strategy's kwargs
+    '''
+    with open(file_path) as file:
+        config = json.load(file)
+    configs = [StrategyConfig(**entry) for entry in config['strategies']]
+    names = [config.name for config in configs]
+    if len(names) != len(set(names)):
+        raise ValueError(f"Strategy names in {file_path} must be unique, they name the state journals: {names}")
+    return configs
+
+
+class ProductionRunner:
+    '''
+    One production tick of every configured strategy:
+    1. candles fetched once per unique (symbol, interval), through the candle cache
+    2. indicators computed once per (strategy class, indicator params, symbol, interval)
+    3. each strategy's run_once on every one of its symbols, strategies in parallel on a thread pool,
+       their orders go to one OrderQueue instead of the exchange
+    4. the queue places all orders on one client and every strategy journals its new state
+    Each strategy keeps its open orders and executions in its own OrderJournal.
+    incremental: run_incremental instead of run_once, the journal marks the last closed candle processed per
+    symbol and the forming one is re-run every tick, indicators are computed on the tail the new candles need
+    only and missed candles are caught up on.
+    '''
+
+    def __init__(self, client, configs, journal_folder, legacy_csv_folder=None, max_workers=RUNNER_WORKERS,
+                 metrics=None, incremental=True):
+        self.client = client
+        self.configs = configs
+        self.journal_folder = journal_folder
+        self.legacy_csv_folder = legacy_csv_folder  # <name>_order_df.csv etc. imported on a journal's first run
+        self.max_workers = max_workers
+        self.metrics = metrics or NULL_METRICS
+        self.incremental = incremental
+        self.queue = OrderQueue(client, metrics=self.metrics)
+
+    def _fetch_candles(self):
+        lookbacks = {}
+        for config in self.configs:
+            for symbol in config.symbols:
+                for interval in (config.trade_interval, config.indicator_interval):
+                    lookback_days = INTERVAL_LOOKBACK_DAYS.get(interval, MINUTE_LOOKBACK_DAYS)
+                    lookbacks[(symbol, interval)] = max(lookbacks.get((symbol, interval), 0), lookback_days)
+
+        def fetch(key):
+            symbol, interval = key
+            df = candle_cache.get_candles(self.client, symbol, interval, lookbacks[key])
+            df['symbol'] = symbol
+            return key, df
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            candles = dict(executor.map(fetch, lookbacks))
+        logging.info(f"Fetched {len(candles)} (symbol, interval) candle frames")
+        return candles
+
+    def _new_strategy(self, config, journal):
+        params = {'commission_pct': None, 'extra_indicator_candles_df': None, **config.params}
+        return config.strat_class(trade_candles_df=None, indicator_candles_df=None,
+                                  executions_df=pd.DataFrame(),
+                                  open_orders_df=journal.open_orders_df() if journal else pd.DataFrame(),
+                                  ideal_executions_df=pd.DataFrame(), client=self.client,
+                                  order_queue=self.queue, name=config.name, **params)
+
+    def _load_journal(self, config):
+        legacy = [os.path.join(self.legacy_csv_folder, f'{config.name}_{suffix}.csv')
+                  for suffix in ('order_df', 'exec_df', 'ideal_exec_df')] if self.legacy_csv_folder else []
+        return load_order_journal(self.journal_folder, config.name, *legacy)
+
+    def _first_new_dates(self, candles, journals):
+        '''{indicator key: date of the oldest trade candle any strategy sharing it has not processed yet}'''
+        first_dates = {}
+        for config in self.configs:
+            strategy = self._new_strategy(config, None)
+            for symbol in config.symbols:
+                strategy.trade_candles_df = candles[(symbol, config.trade_interval)]
+                start = strategy.new_candles_start(journals[config.name].marks.get(symbol))
+                if start is not None:
+                    key = config.indicator_key(symbol)
+                    first_dates[key] = min(first_dates.get(key, start[1]), start[1])
+        return first_dates
+
+    def _compute_indicators(self, candles, first_dates=None):
+        '''first_dates: only compute the tail of each indicator frame those candles need, see _first_new_dates'''
+        prototypes = {}
+        for config in self.configs:
+            for symbol in config.symbols:
+                key = config.indicator_key(symbol)
+                if first_dates is None or key in first_dates:
+                    prototypes.setdefault(key, (config, symbol))
+
+        def compute(item):
+            key, (config, symbol) = item
+            strategy = self._new_strategy(config, None)
+            df = candles[(symbol, config.indicator_interval)]
+            df = strategy.indicator_tail(df, first_dates[key]) if first_dates is not None else df.copy()
+            return key, strategy.get_indicators(df)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            indicators = dict(executor.map(compute, prototypes.items()))
+        logging.info(f"Computed {len(indicators)} indicator frames for "
+                     f"{sum(len(config.symbols) for config in self.configs)} strategy symbols")
+        return indicators
+
+    def _decide(self, config, candles, indicators, journal):
+        '''
+        run_once (run_incremental) of one strategy on each of its symbols, its orders are only queued.
+        Returns the strategy and the marks to journal with its orders.
+        '''
+        strategy = self._new_strategy(config, journal)
+        marks = {}
+        try:
+            for symbol in config.symbols:
+                key = config.indicator_key(symbol)
+                if self.incremental and key not in indicators:
+                    continue  # no new candles for any strategy on this key
+                trade_df = candles[(symbol, config.trade_interval)]
+                strategy.indicator_candles_df = indicators[key].copy()
+                if not self.incremental:
+                    strategy.trade_candles_df = trade_df.copy()
+                    result = strategy.run_once(indicators_ready=True)
+                else:
+                    # run_incremental slices the shared frame, it does not write to it
+                    strategy.trade_candles_df = trade_df
+                    last_date = journal.marks.get(symbol)
+                    result = strategy.run_incremental(last_date, indicators_ready=True)
+                    if result not in (-1, last_date):
+                        marks[symbol] = str(result)
+                if result == -1:
+                    logging.warning(f"{config.name} skipped {symbol}, its candle timeframes do not line up")
+        except Exception:
+            self.queue.discard(strategy)
+            raise
+        return strategy, marks
+
+    def run(self):
+        '''one tick, returns {strategy name: number of journal events}'''
+        with self.metrics.stage('data load'):
+            candles = self._fetch_candles()
+            journals = {}
+            try:
+                for config in self.configs:
+                    journals[config.name] = self._load_journal(config)
+            except Exception:
+                for journal in journals.values():
+                    journal.close()
+                raise
+        try:
+            with self.metrics.stage('indicators'):
+                first_dates = self._first_new_dates(candles, journals) if self.incremental else None
+                indicators = self._compute_indicators(candles, first_dates)
+
+            decided = []
+            with self.metrics.stage('decisions'), ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {config.name: executor.submit(self._decide, config, candles, indicators, journals[config.name])
+                           for config in self.configs}
+                for name, future in futures.items():
+                    try:
+                        decided.append(future.result())
+                    except Exception as e:
+                        # its orders were dropped and its journal left as it was, the other strategies carry on
+                        logging.error(f"{name} failed this tick: {e}")
+
+            self.queue.place_all()
+
+            events = {}
+            with self.metrics.stage('journal write'):
+                for strategy, marks in decided:
+                    events[strategy.name] = journals[strategy.name].record(strategy, marks=marks)
+            return events
+        finally:
+            for journal in journals.values():
+                journal.close()
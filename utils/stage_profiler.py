@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import logging
+import cProfile
+import functools
+from datetime import datetime
+
+# STRAT_PROFILE=1 times the stages, STRAT_PROFILE=cprofile also runs cProfile, unset or 0 is off
+STRAT_PROFILE_ENV = 'STRAT_PROFILE'
+STRAT_PROFILE_DIR_ENV = 'STRAT_PROFILE_DIR'
+DEFAULT_PROFILE_DIR = './data/profiles'
+
+
+class _NullStage:
+    '''what stage() hands out when profiling is off, entering and leaving it does nothing'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class _NullLaps:
+    def lap(self, name):
+        pass
+
+
+NULL_LAPS = _NullLaps()
+
+
+class _Laps:
+    '''consecutive sections of one function, each lap is timed from the end of the previous one'''
+    __slots__ = ('profiler', 'last')
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.profiler._record(tuple(self.profiler.stack) + (name,), now - self.last)
+        self.last = now
+
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stack = self.profiler.stack
+        path = tuple(stack)
+        stack.pop()
+        self.profiler._record(path, elapsed)
+        return False
+
+
+class StageProfiler:
+    '''
+    Cumulative wall time and call counts per named stage of a strategy run.
+    Stages nest, each is keyed by its path ('run_test', 'open loop', 'buy'), so the report has both
+    totals per stage and self time per path for a flamegraph (folded stacks, flamegraph.pl/speedscope).
+    Off by default: stage() returns a shared no-op context and methods are only wrapped when on.
+    '''
+
+    def __init__(self, name='strategy', enabled=None, use_cprofile=None, out_dir=None):
+        mode = os.getenv(STRAT_PROFILE_ENV, '').strip().lower()
+        self.name = name
+        self.enabled = (mode not in ('', '0', 'false')) if enabled is None else enabled
+        self.use_cprofile = self.enabled and (mode == 'cprofile' if use_cprofile is None else use_cprofile)
+        self.out_dir = out_dir or os.getenv(STRAT_PROFILE_DIR_ENV, DEFAULT_PROFILE_DIR)
+        self.stack = []
+        self.stats = {}
+        self.cprofile = None
+        self.run_start = None
+
+    def _record(self, path, elapsed):
+        stats = self.stats.get(path)
+        if stats is None:
+            self.stats[path] = [1, elapsed]
+        else:
+            stats[0] += 1
+            stats[1] += elapsed
+
+    def stage(self, name):
+        return _Stage(self, name) if self.enabled else NULL_STAGE
+
+    def laps(self):
+        '''lap timer for the sections of one function, e.g. one lap per indicator in get_indicators'''
+        return _Laps(self) if self.enabled else NULL_LAPS
+
+    def wrap(self, name, func, own_run=False):
+        '''
+        func timed as stage name, func itself when profiling is off.
+        own_run: a call outside of a run is reported as a run of its own (e.g. trading_summary after run_test).
+        '''
+        if not self.enabled:
+            return func
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = own_run and self.start_run()
+            try:
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            finally:
+                if started:
+                    self.finish_run(name)
+        return timed
+
+    def start_run(self):
+        '''start collecting a run, False when off or a run is already going (it then belongs to that run)'''
+        if not self.enabled or self.run_start is not None:
+            return False
+        self.stack = []
+        self.stats = {}
+        self.run_start = time.perf_counter()
+        if self.use_cprofile:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        return True
+
+    def report(self):
+        '''per stage name totals and per path self times, seconds'''
+        by_name = {}
+        for path, (calls, total) in self.stats.items():
+            entry = by_name.setdefault(path[-1], {'calls': 0, 'total_s': 0.0})
+            entry['calls'] += calls
+            # a stage nested in itself would be counted twice, only count the outermost one
+            if path[-1] not in path[:-1]:
+                entry['total_s'] += total
+        for entry in by_name.values():
+            entry['mean_ms'] = 1000 * entry['total_s'] / entry['calls']
+
+        child_time = {}
+        for path, (_, total) in self.stats.items():
+            if len(path) > 1:
+                child_time[path[:-1]] = child_time.get(path[:-1], 0.0) + total
+        paths = [{'path': list(path), 'calls': calls, 'total_s': total,
+                  'self_s': max(total - child_time.get(path, 0.0), 0.0)}
+                 for path, (calls, total) in self.stats.items()]
+
+        run_s = time.perf_counter() - self.run_start if self.run_start is not None else None
+        return {'name': self.name, 'run_s': run_s,
+                'stages': dict(sorted(by_name.items(), key=lambda item: -item[1]['total_s'])),
+                'paths': sorted(paths, key=lambda item: -item['total_s'])}
+
+    def finish_run(self, label=None):
+        '''write <name>_<label>_<time>.json, .folded and with cprofile .prof; returns the report'''
+        if not self.enabled:
+            return None
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        report = self.report()
+        self.run_start = None
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        stem = '_'.join(part for part in (self.name, label, datetime.now().strftime('%Y%m%d_%H%M%S')) if part)
+        base_path = os.path.join(self.out_dir, stem)
+        with open(base_path + '.json', 'w') as file:
+            json.dump(report, file, indent=2)
+        with open(base_path + '.folded', 'w') as file:
+            for entry in report['paths']:
+                file.write(f"{';'.join(entry['path'])} {int(entry['self_s'] * 1e6)}\n")
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(base_path + '.prof')
+            self.cprofile = None
+
+        top = ', '.join(f"{name} {entry['total_s']:.3f}s/{entry['calls']}"
+                        for name, entry in list(report['stages'].items())[:6])
+        logging.info(f"Profile of {self.name} written to {base_path}.json: {top}")
+        return report
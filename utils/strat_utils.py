@@ -1,8 +1,13 @@
 import pandas as pd
+import numpy as np
 from abc import ABC, abstractmethod
 from binance.client import Client
 from binance.enums import *
 from binance.helpers import round_step_size
+from utils.trading_utils import symbol_filters
+from utils.margin_costs import margin_interest, MARGIN_HOURLY_INTEREST
+from utils.intrabar_fills import STOP_EXIT, TARGET_EXIT
+from utils.stage_profiler import StageProfiler
 import requests
 import os 
 from dotenv import load_dotenv
@@ -53,10 +58,32 @@ def avan_intraday_stock_data_as_csv(interval, months, ticker, avan_api_key, outp
         logging.warning(f"No data retrieved for {ticker}")
         return None
 
+# methods timed as profiler stages when STRAT_PROFILE is set
+PROFILED_METHODS = {
+    'get_indicators': 'indicators',
+    'get_extra_indicators': 'extra indicators',
+    'merge_indicators': 'alignment',
+    'buy': 'orders',
+    'sell': 'orders',
+    'short_sell': 'orders',
+    'short_close': 'orders',
+    'sell_all': 'orders',
+    '_update_open_orders_logs': 'bookkeeping',
+    '_update_since_open': 'bookkeeping',
+    '_update_execution_logs': 'bookkeeping',
+    '_update_ideal_execution_logs': 'bookkeeping',
+}
+
+
+def _order_value(order, column, default):
+    '''a column of an open order row, default for orders written before the column existed (e.g. legacy csv imports)'''
+    value = order.get(column)
+    return default if value is None or pd.isna(value) else value
+
 '''grandparents'''  
 class Strategy(ABC):
     
-    def __init__(self, trade_candles_df, indicator_candles_df, executions_df, open_orders_df, tlt_dollar, commission_pct, extra_indicator_candles_df, profit_threshold, stoploss_threshold, max_high_retrace, max_open_orders_per_symbol, max_open_orders_total):
+    def __init__(self, trade_candles_df, indicator_candles_df, executions_df, open_orders_df, tlt_dollar, commission_pct, extra_indicator_candles_df, profit_threshold, stoploss_threshold, max_high_retrace, max_open_orders_per_symbol, max_open_orders_total, margin_hourly_interest=MARGIN_HOURLY_INTEREST, profiler=None):
         self.trade_candles_df = trade_candles_df
         self.indicator_candles_df = indicator_candles_df
         self.extra_indicator_candles_df = extra_indicator_candles_df
@@ -69,6 +96,19 @@ class Strategy(ABC):
         self.commission_pct = commission_pct
         self.max_open_orders_per_symbol = max_open_orders_per_symbol
         self.max_open_orders_total = max_open_orders_total
+        self.margin_hourly_interest = margin_hourly_interest
+        self.profiler = profiler if profiler is not None else StageProfiler(type(self).__name__)
+        self._instrument()
+
+    def _instrument(self):
+        '''time the steps in PROFILED_METHODS, nothing is wrapped when profiling is off'''
+        if not self.profiler.enabled:
+            return
+        for method_name, stage_name in PROFILED_METHODS.items():
+            if hasattr(self, method_name):
+                setattr(self, method_name, self.profiler.wrap(stage_name, getattr(self, method_name)))
+        if hasattr(self, 'trading_summary'):
+            self.trading_summary = self.profiler.wrap('summary', self.trading_summary, own_run=True)
         
     def _check_candle_frequency(self, df):
         # Check if 'date' column exists
@@ -103,16 +143,24 @@ class Strategy(ABC):
         else:
             return f"Unknown frequency: {time_diff}"
 
-    def _update_open_orders_logs(self, last_update_time, status, symbol, tlt_dollar, price, quantity, high_since_open): 
+    def _update_open_orders_logs(self, last_update_time, status, symbol, tlt_dollar, price, quantity, high_since_open, side='LONG', low_since_open=None): 
         new_order = {
             'last_update_time': last_update_time, 
             'status': status, 
             'symbol': symbol, 
+            'side': side,
             'tlt_dollar': tlt_dollar, 
             'price': price, 
             'quantity': quantity,
-            'high_since_open': high_since_open}
+            'high_since_open': high_since_open,
+            'low_since_open': price if low_since_open is None else low_since_open}
         self.open_orders_df = pd.concat([self.open_orders_df, pd.DataFrame([new_order])], ignore_index=True)
+
+    def _update_since_open(self, order_index, price):
+        '''track high_since_open (long retrace) and low_since_open (short retrace) of an open order'''
+        order = self.open_orders_df.loc[order_index]
+        self.open_orders_df.at[order_index, 'high_since_open'] = max(price, _order_value(order, 'high_since_open', order['price']))
+        self.open_orders_df.at[order_index, 'low_since_open'] = min(price, _order_value(order, 'low_since_open', order['price']))
   
     def _update_execution_logs(self, execution_time, action, symbol, tlt_dollar, price, quantity):   
         new_exec = {
@@ -152,6 +200,11 @@ class Strategy(ABC):
 
 '''parents'''
 class TestStrategy(Strategy):
+    
+    def __init__(self, *args, fill_model=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # IntrabarFillModel: fill stop loss/profit target on the previous candle's high/low instead of this open
+        self.fill_model = fill_model
 
     def buy(self, tlt_dollar, execution_time, symbol, price, quantity): 
         self._update_execution_logs(execution_time, 'BUY', symbol, tlt_dollar, price, quantity)
@@ -181,6 +234,28 @@ class TestStrategy(Strategy):
                 'executed_tlt_dollar': tlt_dollar,
                 'executed_price': price}
         
+    def profit_percentage(self, order, price):
+        '''profit of an open order closed at price: price up for a LONG, down for a SHORT'''
+        if _order_value(order, 'side', 'LONG') == 'SHORT':
+            return (order['price'] - price) / order['price']
+        return (price - order['price']) / order['price']
+
+    def is_retraced(self, order_index, price):
+        '''price gave back max_high_retrace from the best price since open, high_since_open or low_since_open for a SHORT'''
+        order = self.open_orders_df.loc[order_index]
+        if _order_value(order, 'side', 'LONG') == 'SHORT':
+            return price >= _order_value(order, 'low_since_open', order['price']) * (1 + self.max_high_retrace)
+        return price <= _order_value(order, 'high_since_open', order['price']) * (1 - self.max_high_retrace)
+
+    def close_position(self, order, execution_time, price):
+        '''sell a LONG or buy back a SHORT at price, commission on the dollar amount'''
+        quantity = order['quantity']
+        tlt_dollar = price * quantity
+        if _order_value(order, 'side', 'LONG') == 'SHORT':
+            self.short_close(tlt_dollar*(1+self.commission_pct), execution_time, order['symbol'], price, quantity)
+        else:
+            self.sell(quantity, execution_time, order['symbol'], tlt_dollar*(1-self.commission_pct), price)
+
     def close_all_trades(self):
         num_open_trades = 0
         for index, order in self.open_orders_df.iterrows():
@@ -194,13 +269,53 @@ class TestStrategy(Strategy):
                 quantity = order['quantity']
                 tlt_dollar = current_price * quantity
                 
-                self.sell(quantity, execution_time, symbol, tlt_dollar, current_price)
+                if _order_value(order, 'side', 'LONG') == 'SHORT':
+                    self.short_close(tlt_dollar, execution_time, symbol, current_price, quantity)
+                else:
+                    self.sell(quantity, execution_time, symbol, tlt_dollar, current_price)
                 self.open_orders_df.at[index, 'status'] = 'CLOSED'
                 self.open_orders_df.at[index, 'close_reason'] = 'close all'
                 num_open_trades += 1
         logging.info(f'Closed all {num_open_trades} remaining open trades!')
+
+    def _intrabar_close(self, candle_df_slices):
+        '''
+        Stop loss and profit target of all open orders of this symbol checked at once against the
+        previous candle's high/low. Only orders opened by that candle's open can have been hit in it.
+        '''
+        prev_candle = candle_df_slices.iloc[-2]
+        curr_candle = candle_df_slices.iloc[-1]
+        orders = self.open_orders_df[(self.open_orders_df['status'] == 'OPEN') &
+                                     (self.open_orders_df['symbol'] == curr_candle['symbol']) &
+                                     (self.open_orders_df['last_update_time'] <= prev_candle['date'])]
+        if orders.empty:
+            return
+
+        is_long = (orders['side'] != 'SHORT').to_numpy() if 'side' in orders else np.ones(len(orders), dtype=bool)
+        open_price = orders['price'].to_numpy(dtype=float)
+        direction = np.where(is_long, 1.0, -1.0)
+        stop_price = open_price * (1 + direction * self.stoploss_threshold)
+        target_price = open_price * (1 + direction * self.profit_threshold)
+        n = len(orders)
+        fills = self.fill_model.fills([prev_candle['symbol']] * n, [prev_candle['date']] * n, [curr_candle['date']] * n,
+                                      np.full(n, prev_candle['open']), np.full(n, prev_candle['high']), np.full(n, prev_candle['low']),
+                                      stop_price, target_price, is_long)
+
+        for order_index, fill in zip(orders.index, fills.itertuples()):
+            if fill.exit_kind not in (STOP_EXIT, TARGET_EXIT):
+                continue
+            order = self.open_orders_df.loc[order_index]
+            price = fill.fill_price
+            profit_percentage = self.profit_percentage(order, price)
+            self.close_position(order, fill.fill_time, price)
+            close_reason = (f"Stop loss hit intrabar (P%: {profit_percentage:.1%})" if fill.exit_kind == STOP_EXIT
+                            else f"Profit target met intrabar (P%: {profit_percentage:.1%})")
+            self.open_orders_df.at[order_index, 'status'] = 'CLOSED'
+            self.open_orders_df.at[order_index, 'close_reason'] = close_reason
+            self.open_orders_df.at[order_index, 'profit_percentage'] = f"{profit_percentage:.2%}"
+            logging.info(f'{fill.fill_time}: Closed position at {price:.2f} with {profit_percentage:.2%} profit. Reason: {close_reason}')
         
-    def run_test(self): 
+    def merge_indicators(self): 
         '''This function will join the trading tf with the indicators tf. The indicator will lag the trade by one day/hour to mimic real trading scenario.'''
         # check df frequencies
         trade_df_timestamp = self._check_candle_frequency(self.trade_candles_df)
@@ -253,21 +368,47 @@ class TestStrategy(Strategy):
             return -1
         
         logging.debug('All Columns in trading df: %s', self.trade_candles_df.columns) 
+        return 0
+
+    def run_test(self, first_row=0, close_at_end=True): 
+        '''Merge the indicators onto the trading tf and step through it candle by candle.
+        first_row/close_at_end let a streaming run trade only the new rows of a chunk and keep positions open across chunks.'''
+        started = self.profiler.start_run()
+        try:
+            with self.profiler.stage('run_test'):
+                return self._run_test(first_row, close_at_end)
+        finally:
+            if started:
+                self.profiler.finish_run('run_test')
+
+    def _run_test(self, first_row, close_at_end):
+        if self.merge_indicators() == -1:
+            return -1
+        
         # go through the all trade df row by row 
         offset = 4
-        for idx in tqdm(range(offset, len(self.trade_candles_df))):
+        for idx in tqdm(range(max(offset, first_row), len(self.trade_candles_df))):
             start_idx = idx - offset
             candle_df_slices = self.trade_candles_df.iloc[start_idx:idx+1]
             
+            # stops and targets hit inside the previous candle closed before this candle's entries are
+            # counted against the open order limits, as they would have filled on the exchange
+            if self.fill_model is not None and not self.open_orders_df.empty:
+                with self.profiler.stage('close loop'):
+                    self._intrabar_close(candle_df_slices)
             # opening 
-            self.stepwise_logic_open(candle_df_slices)
+            with self.profiler.stage('open loop'):
+                self.stepwise_logic_open(candle_df_slices)
             # closing
-            for order_index, open_order in self.open_orders_df.iterrows():
-                if open_order['status'] == 'OPEN' and open_order['symbol'] == candle_df_slices.iloc[-1]['symbol']:
-                    self.stepwise_logic_close(candle_df_slices, order_index)
+            with self.profiler.stage('close loop'):
+                for order_index, open_order in self.open_orders_df.iterrows():
+                    if open_order['status'] == 'OPEN' and open_order['symbol'] == candle_df_slices.iloc[-1]['symbol']:
+                        self.stepwise_logic_close(candle_df_slices, order_index)
         
         # wrap up all trades
-        self.close_all_trades()        
+        if close_at_end:
+            with self.profiler.stage('close loop'):
+                self.close_all_trades()        
         logging.info(f'Finished test run!')
 
     def trading_summary(self, df=None):
@@ -279,27 +420,51 @@ class TestStrategy(Strategy):
         # Calculate profit for each trade
         df.loc[:, 'trade_profit'] = 0.0
         df.loc[:, 'trade_duration'] = pd.Timedelta(0)
+        df.loc[:, 'trade_side'] = None
+        df.loc[:, 'margin_interest'] = 0.0
 
-        buy_stack = []
+        # BUY is closed by SELL, SHORT_SELL by SHORT_CLOSE, first in first out
+        open_stacks = {'BUY': [], 'SHORT_SELL': []}
+        close_matches = {'SELL': 'BUY', 'SHORT_CLOSE': 'SHORT_SELL'}
+        short_round_trips = []
         total_profit = 0.0
         total_trades = 0
+        total_short_trades = 0
         total_volume = 0.0
 
         for _, row in df.iterrows():
-            if row['action'] == 'BUY':
-                buy_stack.append(row)
+            if row['action'] in open_stacks:
+                open_stacks[row['action']].append(row)
                 total_volume += row['tlt_dollar']
-            elif row['action'] == 'SELL':
-                if buy_stack:
-                    buy_order = buy_stack.pop(0)
-                    profit = row['tlt_dollar'] - buy_order['tlt_dollar']
+            elif row['action'] in close_matches:
+                stack = open_stacks[close_matches[row['action']]]
+                if stack:
+                    open_order = stack.pop(0)
+                    if row['action'] == 'SELL':
+                        profit = row['tlt_dollar'] - open_order['tlt_dollar']
+                        df.loc[row.name, 'trade_side'] = 'LONG'
+                    else:
+                        profit = open_order['tlt_dollar'] - row['tlt_dollar']
+                        df.loc[row.name, 'trade_side'] = 'SHORT'
+                        short_round_trips.append((row.name, open_order['execution_time'], row['execution_time'], open_order['tlt_dollar']))
+                        total_short_trades += 1
                     df.loc[row.name, 'trade_profit'] = profit
-                    trade_duration = row['execution_time'] - buy_order['execution_time']
+                    trade_duration = row['execution_time'] - open_order['execution_time']
                     df.loc[row.name, 'trade_duration'] = trade_duration
                     total_profit += profit
                     total_trades += 1
                     total_volume += row['tlt_dollar']
 
+        # interest on the borrowed coins of every short round trip, all at once
+        total_margin_interest = 0.0
+        if short_round_trips:
+            close_idx, open_times, close_times, borrowed_dollar = zip(*short_round_trips)
+            interest = margin_interest(list(borrowed_dollar), list(open_times), list(close_times), self.margin_hourly_interest)
+            df.loc[list(close_idx), 'margin_interest'] = interest
+            df.loc[list(close_idx), 'trade_profit'] -= interest
+            total_margin_interest = interest.sum()
+            total_profit -= total_margin_interest
+
         total_commission = total_volume * self.commission_pct
         
         # Calculate price change
@@ -323,11 +488,13 @@ class TestStrategy(Strategy):
 
         summary = {
             "Total Number of Trades": total_trades,
+            "Short Trades": total_short_trades,
             "Total Profit": f"${total_profit:.0f}",
             "Total Trading Volume": f"${total_volume:.0f}",
             "Profit per Trade": f"${total_profit/total_trades:.2f}" if total_trades > 0 else "$0.00",
             "% Profit per Trade": f"{(total_profit/total_trades)/self.tlt_dollar:.2%}" if total_trades > 0 else "0.00%",
             "Total Commission Cost": f"${total_commission:.2f}",
+            "Total Margin Interest": f"${total_margin_interest:.2f}",
             "Price Change": f"${price_change:.2f}",
             "Price Change Percent": f"{price_change_percent:.2f}",
             "Trades Win Rate": f"{win_rate:.1%}", 
@@ -351,15 +518,44 @@ load_dotenv()
 api_key = os.getenv('BINANCE_API')
 api_secret = os.getenv('BINANCE_SECRET')
 avan_api_key = os.getenv('ALPHA_VANTAGE_PREM_API') 
-bn_client = Client(api_key, api_secret)
+# built on first use, Client() pings binance and importing this module should not
+_bn_client = None
+
+def get_bn_client():
+    global _bn_client
+    if _bn_client is None:
+        _bn_client = Client(api_key, api_secret)
+    return _bn_client
+
+# run_incremental computes indicators on this many times the longest *_window rows before the new candles,
+# at least INCREMENTAL_MIN_WARMUP so the fixed span EMAs have settled too
+INCREMENTAL_WARMUP_MULT = 3
+INCREMENTAL_MIN_WARMUP = 100
+# candles before the current one in the window the stepwise logic gets, as in run_test
+CANDLE_SLICE_OFFSET = 4
 
 class BinanceProductionStrategy(Strategy):
-    def __init__(self, *args, ideal_executions_df, **kwargs):
+    def __init__(self, *args, ideal_executions_df, client=None, order_queue=None, name=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self.bn_client = bn_client
+        # client: e.g. a SimulatedBinanceClient for load tests, the module client (built on first order) otherwise
+        self._client = client
+        # order_queue: an OrderQueue places the orders after run_once instead of buy/sell placing them
+        self.order_queue = order_queue
+        self.name = name or type(self).__name__
         self.commission_pct = 0
         self.ideal_executions_df = ideal_executions_df
+
+    @property
+    def bn_client(self):
+        if self._client is None:
+            self._client = get_bn_client()
+        return self._client
     
+    def _round_qty(self, symbol, quantity):
+        '''round down to the symbol's LOT_SIZE step from the cached exchangeInfo'''
+        symbol_filters.ensure_fresh(self.bn_client)
+        return symbol_filters.round_qty(symbol, quantity)
+
     def _update_ideal_execution_logs(self, execution_time, action, symbol, tlt_dollar, price, quantity):   
         new_exec = {
             'execution_time': execution_time,
@@ -370,52 +566,51 @@ class BinanceProductionStrategy(Strategy):
             'quantity': quantity
         }
         self.ideal_executions_df = pd.concat([self.ideal_executions_df, pd.DataFrame([new_exec])], ignore_index=True)
-    
-    @staticmethod
-    def _get_tick_size(price):
-        '''helper function to get the decimal right for trading'''
-        if price < 5:
-            tick_size = 1
-        elif price >=5 and price < 100:
-            tick_size = 0.01
-        elif price >=100 and price < 2000:
-            tick_size = 0.001  
-        elif price >=1000 and price < 10000:
-            tick_size = 0.0001 
-        elif price >=10000:
-            tick_size = 0.00001 
-        return tick_size
+
+    def record_fill(self, action, symbol, order_info):
+        '''log a filled market order to executions_df, action BUY or SELL (SELL_ALL from an OrderQueue)'''
+        executed_time_str = datetime.fromtimestamp(order_info['transactTime'] / 1000).strftime('%Y-%m-%d %H:%M:%S')
+        executed_quantity = float(order_info['executedQty'])
+        executed_tlt_dollar = float(order_info['cummulativeQuoteQty'])
+        executed_price = executed_tlt_dollar/executed_quantity
         
+        self._update_execution_logs(executed_time_str, 'BUY' if action == 'BUY' else 'SELL', 
+                                    symbol, executed_tlt_dollar, 
+                                    executed_price, executed_quantity)
+        return {'executed_time_str': executed_time_str,
+                'executed_quantity': executed_quantity,
+                'executed_tlt_dollar': executed_tlt_dollar,
+                'executed_price': executed_price}
+    
     def buy(self, tlt_dollar, execution_time, symbol, price, quantity): 
+        if self.order_queue is not None:
+            self._update_ideal_execution_logs(execution_time, 'BUY', symbol, tlt_dollar, price, quantity)
+            self.order_queue.submit(self, 'BUY', symbol, quantity)
+            return None
+
         # execute buy with a calculated decimal precision amount
         try:
             order_info = self.bn_client.order_market_buy(symbol=symbol, 
-                                                         quantity=round_step_size(quantity, self._get_tick_size(price)))
+                                                         quantity=self._round_qty(symbol, quantity))
         except Exception as e:
             logging.error(f"Error executing buy order: {str(e)}")
             return None
         
         # log order
-        executed_time_str = datetime.fromtimestamp(order_info['transactTime'] / 1000).strftime('%Y-%m-%d %H:%M:%S')
-        executed_quantity = float(order_info['executedQty'])
-        executed_tlt_dollar = float(order_info['cummulativeQuoteQty'])
-        executed_price = executed_tlt_dollar/executed_quantity
-        
-        self._update_execution_logs(executed_time_str, 'BUY', 
-                                    symbol, executed_tlt_dollar, 
-                                    executed_price, executed_quantity)
-        
+        fill = self.record_fill('BUY', symbol, order_info)
         self._update_ideal_execution_logs(execution_time, 'BUY', 
                                     symbol, tlt_dollar, 
                                     price, quantity)
         
-        logging.info(f'longed {symbol}. bought {executed_quantity} of them of ${executed_tlt_dollar}!')
-        return {'executed_time_str': executed_time_str,
-                'executed_quantity': executed_quantity,
-                'executed_tlt_dollar': executed_tlt_dollar,
-                'executed_price': executed_price}
+        logging.info(f'longed {symbol}. bought {fill["executed_quantity"]} of them of ${fill["executed_tlt_dollar"]}!')
+        return fill
          
     def sell(self, quantity, execution_time, symbol, tlt_dollar, price):  
+        if self.order_queue is not None:
+            self._update_ideal_execution_logs(execution_time, 'SELL', symbol, tlt_dollar, price, quantity)
+            self.order_queue.submit(self, 'SELL', symbol, quantity)
+            return None
+
         balance_amt = float(self.bn_client.get_asset_balance(
                     asset=symbol.replace('USDT', ''))['free'])
         if quantity > balance_amt: # make sure have enough to sell
@@ -423,64 +618,166 @@ class BinanceProductionStrategy(Strategy):
         
         try:
             order_info = self.bn_client.order_market_sell(symbol=symbol, 
-                                                         quantity=round_step_size(quantity, self._get_tick_size(price)))
+                                                         quantity=self._round_qty(symbol, quantity))
         except Exception as e:
             logging.error(f"Error executing sell order: {str(e)}")
             return None
         
         # log order
-        executed_time_str = datetime.fromtimestamp(order_info['transactTime'] / 1000).strftime('%Y-%m-%d %H:%M:%S')
-        executed_quantity = float(order_info['executedQty'])
-        executed_tlt_dollar = float(order_info['cummulativeQuoteQty'])
-        executed_price = executed_tlt_dollar/executed_quantity
-        
-        self._update_execution_logs(executed_time_str, 'SELL', 
-                                    symbol, executed_tlt_dollar, 
-                                    executed_price, executed_quantity)
-        
+        fill = self.record_fill('SELL', symbol, order_info)
         self._update_ideal_execution_logs(execution_time, 'SELL', 
                                     symbol, tlt_dollar, 
                                     price, quantity)
         
         logging.info(f'Sold {symbol}, {quantity} of them.')
-        return {'executed_time_str': executed_time_str,
-                'executed_quantity': executed_quantity,
-                'executed_tlt_dollar': executed_tlt_dollar,
-                'executed_price': executed_price}
+        return fill
         
     def sell_all(self, execution_time, symbol, tlt_dollar, price):  
+        if self.order_queue is not None:
+            self._update_ideal_execution_logs(execution_time, 'SELL', symbol, tlt_dollar, price, None)
+            self.order_queue.submit(self, 'SELL_ALL', symbol)
+            return
+
         balance_amt = float(self.bn_client.get_asset_balance(
                     asset=symbol.replace('USDT', ''))['free'])
         order_info = self.bn_client.order_market_sell(symbol=symbol, 
-                                                     quantity=round_step_size(balance_amt, self._get_tick_size(price)))
+                                                     quantity=self._round_qty(symbol, balance_amt))
         
         # log order
-        executed_time_str = datetime.fromtimestamp(order_info['transactTime'] / 1000).strftime('%Y-%m-%d %H:%M:%S')
-        executed_quantity = float(order_info['executedQty'])
-        executed_tlt_dollar = float(order_info['cummulativeQuoteQty'])
-        executed_price = executed_tlt_dollar/executed_quantity
-        
-        self._update_execution_logs(executed_time_str, 'SELL', 
-                                    symbol, executed_tlt_dollar, 
-                                    executed_price, executed_quantity)
-        
+        self.record_fill('SELL', symbol, order_info)
         self._update_ideal_execution_logs(execution_time, 'SELL', 
                                     symbol, tlt_dollar, 
                                     price, balance_amt)
         
         logging.info(f'Sold ALL {symbol}, {balance_amt} of them.')
     
-    def run_once(self): 
+    def run_once(self, indicators_ready=False): 
+        '''indicators_ready: indicator_candles_df already went through get_indicators, e.g. shared by a runner'''
+        started = self.profiler.start_run()
+        try:
+            with self.profiler.stage('run_once'):
+                return self._run_once(indicators_ready)
+        finally:
+            if started:
+                self.profiler.finish_run('run_once')
+
+    def _run_once(self, indicators_ready): 
         # check df frequencies
         trade_df_timestamp = self._check_candle_frequency(self.trade_candles_df)
         indi_df_timestamp = self._check_candle_frequency(self.indicator_candles_df)
         extra_indi_df_timestamp = self._check_candle_frequency(self.extra_indicator_candles_df) if self.extra_indicator_candles_df is not None else indi_df_timestamp
         
         # get indicators
-        self.indicator_candles_df = self.get_indicators(self.indicator_candles_df)
-        self.extra_indicator_candles_df = self.get_extra_indicators(self.extra_indicator_candles_df) if self.extra_indicator_candles_df is not None else None
+        if not indicators_ready:
+            self.indicator_candles_df = self.get_indicators(self.indicator_candles_df)
+            self.extra_indicator_candles_df = self.get_extra_indicators(self.extra_indicator_candles_df) if self.extra_indicator_candles_df is not None else None
         
         # transform based on timeframe of the dataframes
+        with self.profiler.stage('alignment'):
+            if self._align_production_frames(trade_df_timestamp, indi_df_timestamp, extra_indi_df_timestamp) == -1:
+                return -1
+ 
+        # the latest candle and the ones before it, the same window run_test hands the stepwise logic
+        candle_df_slices = self.trade_candles_df.iloc[-(CANDLE_SLICE_OFFSET + 1):]
+        symbol = candle_df_slices.iloc[-1]['symbol']
+        # opening 
+        with self.profiler.stage('open loop'):
+            self.stepwise_logic_open(candle_df_slices)
+        # closing
+        with self.profiler.stage('close loop'):
+            for order_index, open_order in self.open_orders_df.iterrows():
+                if open_order['status'] == 'OPEN' and open_order['symbol'] == symbol:
+                    self.stepwise_logic_close(candle_df_slices, order_index)     
+        logging.info(f'Finished runinng once for latest data!')
+
+    def indicator_warmup_rows(self):
+        '''indicator candles run_incremental keeps before the first new trade candle'''
+        windows = [value for name, value in vars(self).items() if '_window' in name and isinstance(value, int)]
+        return max([INCREMENTAL_MIN_WARMUP] + [INCREMENTAL_WARMUP_MULT * window for window in windows])
+
+    def indicator_tail(self, df, first_date):
+        '''the rows of an indicator frame run_incremental needs for trade candles from first_date on'''
+        if df is None:
+            return None
+        # the indicator candle first_date falls in, e.g. its day for daily indicators
+        first_row = int(pd.to_datetime(df['date']).searchsorted(first_date, side='right')) - 1
+        return df.iloc[max(0, first_row - self.indicator_warmup_rows()):].reset_index(drop=True)
+
+    def new_candles_start(self, last_date):
+        '''(row of the first trade candle after last_date, its date), None when there is none'''
+        dates = pd.to_datetime(self.trade_candles_df['date'])
+        # first tick of a strategy: only the latest candle, as run_once
+        first_row = len(dates) - 1 if last_date is None else int(dates.searchsorted(pd.Timestamp(last_date), side='right'))
+        if first_row >= len(dates):
+            return None
+        return first_row, dates.iloc[first_row]
+
+    def run_incremental(self, last_date=None, indicators_ready=False):
+        '''
+        Production mode that only processes the trade candles after last_date, the newest closed candle the
+        previous tick processed, so a tick costs the same however long the bot has run: the trade frame is cut to
+        the new candles and the indicator frames to indicator_tail before the merge. After a gap every missed candle is
+        stepped through oldest first, but only the newest can open a position; older ones only run the close
+        logic, so a stale signal is never traded. The newest candle is still forming and is re-run every tick,
+        so the date returned for the next last_date is the candle before it, the newest closed one (last_date
+        when that is not newer). indicators_ready: the indicator frames are already tails through get_indicators.
+        '''
+        started = self.profiler.start_run()
+        try:
+            with self.profiler.stage('run_once'):
+                return self._run_incremental(last_date, indicators_ready)
+        finally:
+            if started:
+                self.profiler.finish_run('run_incremental')
+
+    def _run_incremental(self, last_date, indicators_ready):
+        start = self.new_candles_start(last_date)
+        if start is None:
+            logging.info(f'{self.name}: no new candles since {last_date}')
+            return last_date
+        first_row, first_date = start
+        n_new = len(self.trade_candles_df) - first_row
+        self.trade_candles_df = self.trade_candles_df.iloc[max(0, first_row - CANDLE_SLICE_OFFSET):].reset_index(drop=True)
+        if not indicators_ready:
+            self.indicator_candles_df = self.indicator_tail(self.indicator_candles_df, first_date)
+            self.extra_indicator_candles_df = self.indicator_tail(self.extra_indicator_candles_df, first_date)
+
+        trade_df_timestamp = self._check_candle_frequency(self.trade_candles_df)
+        indi_df_timestamp = self._check_candle_frequency(self.indicator_candles_df)
+        extra_indi_df_timestamp = self._check_candle_frequency(self.extra_indicator_candles_df) if self.extra_indicator_candles_df is not None else indi_df_timestamp
+        if not indicators_ready:
+            self.indicator_candles_df = self.get_indicators(self.indicator_candles_df)
+            self.extra_indicator_candles_df = self.get_extra_indicators(self.extra_indicator_candles_df) if self.extra_indicator_candles_df is not None else None
+        with self.profiler.stage('alignment'):
+            if self._align_production_frames(trade_df_timestamp, indi_df_timestamp, extra_indi_df_timestamp) == -1:
+                return -1
+
+        last_row = len(self.trade_candles_df) - 1
+        for idx in range(last_row - n_new + 1, last_row + 1):
+            candle_df_slices = self.trade_candles_df.iloc[max(0, idx - CANDLE_SLICE_OFFSET):idx + 1]
+            symbol = candle_df_slices.iloc[-1]['symbol']
+            if idx == last_row:
+                with self.profiler.stage('open loop'):
+                    self.stepwise_logic_open(candle_df_slices)
+            with self.profiler.stage('close loop'):
+                # only this symbol's open orders, not every order the frame ever held
+                orders = self.open_orders_df
+                open_index = orders.index[(orders['status'] == 'OPEN') & (orders['symbol'] == symbol)] if not orders.empty else []
+                for order_index in open_index:
+                    if self.open_orders_df.at[order_index, 'status'] == 'OPEN':
+                        self.stepwise_logic_close(candle_df_slices, order_index)
+        if n_new > 1:
+            logging.info(f'{self.name}: caught up over {n_new} candles since {last_date}')
+        # the last row is the forming candle: it is run again every tick until a newer candle arrives,
+        # so only the candle before it is marked as processed
+        if last_row < 1:
+            return last_date
+        closed_date = self.trade_candles_df['date'].iloc[last_row - 1]
+        if last_date is not None and closed_date <= pd.Timestamp(last_date):
+            return last_date
+        return closed_date
+
+    def _align_production_frames(self, trade_df_timestamp, indi_df_timestamp, extra_indi_df_timestamp):
         if trade_df_timestamp == indi_df_timestamp == extra_indi_df_timestamp:
             self.trade_candles_df = pd.merge(self.trade_candles_df, self.indicator_candles_df, on='date', how='left', suffixes=('', '_indi'))
             if self.extra_indicator_candles_df is not None:
@@ -498,13 +795,4 @@ class BinanceProductionStrategy(Strategy):
         else:
             logging.warning("Indicator and extra indicator dataframes have different timeframes. Will not run production.")
             return -1
- 
-        candle_df_slice = self.trade_candles_df.iloc[-1]
-        # opening 
-        self.stepwise_logic_open(candle_df_slice)
-        # closing
-        for order_index, open_order in self.open_orders_df.iterrows():
-            if open_order['status'] == 'OPEN' and open_order['symbol'] == candle_df_slice['symbol']:
-                self.stepwise_logic_close(candle_df_slice, order_index)     
-        logging.info(f'Finished runinng once for latest data!')
  
\ No newline at end of file
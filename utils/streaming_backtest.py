@@ -0,0 +1,139 @@
+import os
+import logging
+import pandas as pd
+
+STREAM_CHUNK_ROWS = 50000
+# rows run_test keeps before the current candle (candle_df_slices)
+RUN_TEST_OFFSET = 4
+
+
+def iter_db_candles(conn, table_name, symbol, start_date, end_date, chunk_rows=STREAM_CHUNK_ROWS):
+    '''
+    Candles of one symbol in time ordered chunks of chunk_rows.
+    Pages on date (date > last date seen) so every chunk is an index range scan, not an ever growing OFFSET.
+    '''
+    last_date = None
+    while True:
+        after = f"date >= '{start_date}'" if last_date is None else f"date > '{last_date}'"
+        query = f"""
+        SELECT * FROM {table_name}
+        WHERE symbol = '{symbol}' AND {after} AND date <= '{end_date}'
+        ORDER BY date
+        LIMIT {chunk_rows}
+        """
+        chunk = pd.read_sql(query, conn)
+        if chunk.empty:
+            return
+        chunk['date'] = pd.to_datetime(chunk['date'])
+        yield chunk
+        if len(chunk) < chunk_rows:
+            return
+        last_date = chunk['date'].iloc[-1]
+
+
+def iter_csv_candles(file_path, start_date=None, end_date=None, chunk_rows=STREAM_CHUNK_ROWS):
+    '''time ordered candle chunks from a local csv store, e.g. a CandleCache file'''
+    for chunk in pd.read_csv(file_path, parse_dates=['date'], chunksize=chunk_rows):
+        if start_date is not None:
+            chunk = chunk[chunk['date'] >= pd.Timestamp(start_date)]
+        if end_date is not None:
+            chunk = chunk[chunk['date'] <= pd.Timestamp(end_date)]
+        if not chunk.empty:
+            yield chunk.reset_index(drop=True)
+
+
+def warmup_rows(strategy):
+    '''rows of history the longest rolling indicator of strategy needs before the first traded candle'''
+    windows = [value for name, value in vars(strategy).items()
+               if name.endswith('_window') and isinstance(value, int)]
+    return max(windows, default=0) + RUN_TEST_OFFSET + 1
+
+
+class StreamingBacktest:
+    '''
+    Runs a TestStrategy over candle chunks instead of one frame of the whole history.
+    Each chunk is traded with the last warmup rows of the previous chunk in front of it, so rolling indicators
+    and candle_df_slices see the same history as in a single run. Open orders carry over between chunks,
+    executions and closed orders are appended to csv after every chunk and dropped from memory.
+    indicator_candles_df: None computes indicators on the streamed candles, or a small coarser frame
+    (e.g. daily) that is joined to every chunk as in run_test.
+    ewm based indicators only see the warmup tail, so they differ slightly from a single run until
+    warmup is several spans long.
+    '''
+
+    def __init__(self, strategy, chunks, indicator_candles_df=None, warmup=None,
+                 executions_file=None, orders_file=None):
+        self.strategy = strategy
+        self.chunks = chunks
+        self.indicator_candles_df = indicator_candles_df
+        self.warmup = warmup_rows(strategy) if warmup is None else warmup
+        self.executions_file = executions_file
+        self.orders_file = orders_file
+        self.num_candles = 0
+        self.num_executions = 0
+        self.executions = []
+
+    def _append_csv(self, df, file_path):
+        df.to_csv(file_path, mode='a', header=not os.path.exists(file_path), index=False)
+
+    def _flush(self):
+        '''move this chunk's executions and closed orders out of the strategy'''
+        strategy = self.strategy
+        if not strategy.executions_df.empty:
+            self.num_executions += len(strategy.executions_df)
+            if self.executions_file:
+                self._append_csv(strategy.executions_df, self.executions_file)
+            else:
+                self.executions.append(strategy.executions_df)
+            strategy.executions_df = pd.DataFrame()
+
+        if not strategy.open_orders_df.empty:
+            is_open = strategy.open_orders_df['status'] == 'OPEN'
+            if self.orders_file and (~is_open).any():
+                self._append_csv(strategy.open_orders_df[~is_open], self.orders_file)
+            strategy.open_orders_df = strategy.open_orders_df[is_open].reset_index(drop=True)
+
+    def run(self):
+        for file_path in (self.executions_file, self.orders_file):
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+
+        profiler = self.strategy.profiler
+        started = profiler.start_run()
+        tail = None
+        chunks = iter(self.chunks)
+        while True:
+            with profiler.stage('data load'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            window = chunk if tail is None else pd.concat([tail, chunk], ignore_index=True)
+            first_row = 0 if tail is None else len(tail)
+            self.strategy.trade_candles_df = window.copy()
+            self.strategy.indicator_candles_df = (window.copy() if self.indicator_candles_df is None
+                                                  else self.indicator_candles_df.copy())
+            if self.strategy.run_test(first_row=first_row, close_at_end=False) == -1:
+                raise ValueError("run_test could not line up the streamed candles with the indicator candles")
+
+            tail = window.iloc[-self.warmup:].reset_index(drop=True)
+            self.num_candles += len(chunk)
+            self._flush()
+            logging.info(f"Streamed {self.num_candles} candles, {self.num_executions} executions so far")
+
+        if tail is not None:
+            self.strategy.close_all_trades()
+            self._flush()
+        summary = self.summary()
+        if started:
+            profiler.finish_run('streaming')
+        return summary
+
+    def get_executions(self):
+        if self.executions_file:
+            if not os.path.exists(self.executions_file):
+                return pd.DataFrame()
+            return pd.read_csv(self.executions_file, parse_dates=['execution_time'])
+        return pd.concat(self.executions, ignore_index=True) if self.executions else pd.DataFrame()
+
+    def summary(self):
+        return self.strategy.trading_summary(self.get_executions())
@@ -0,0 +1,214 @@
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+SYNTH_START = '2021-01-01'
+BARS_PER_YEAR_1D = 365  # crypto trades every day
+DB_COLUMNS = ['symbol', 'date', 'open', 'high', 'low', 'close', 'volume']
+CANDLE_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume']
+
+# rng streams, so a symbol's path only depends on (seed, stream, index) and not on how many others are generated
+MARKET_STREAM = 0
+REGIME_STREAM = 1
+SINGLE_STREAM = 2
+PAIR_STREAM = 3
+
+
+def bar_timedelta(interval):
+    '''binance interval string ('5m', '2h', '1d', ...) as a Timedelta'''
+    return pd.Timedelta(interval)
+
+
+def ar1(shocks, phi, start=0.0):
+    '''
+    s_t = phi * s_(t-1) + shocks_t down axis 0, phi per column.
+    Solved in blocks with cumsum instead of a python loop over bars; blocks are kept short enough
+    that phi**-k stays within ~1e6 so the rescaling does not lose precision.
+    '''
+    shocks = np.asarray(shocks, dtype=np.float64)
+    phi = np.broadcast_to(np.asarray(phi, dtype=np.float64), shocks.shape[1:])
+    min_phi = float(np.min(phi)) if phi.size else 0.5
+    block = 4096 if min_phi >= 1 else int(np.clip(6 * np.log(10) / -np.log(min_phi), 1, 4096))
+    out = np.empty_like(shocks)
+    prev = np.broadcast_to(np.asarray(start, dtype=np.float64), shocks.shape[1:])
+    for b0 in range(0, len(shocks), block):
+        e = shocks[b0:b0 + block]
+        powers = phi ** np.arange(1, len(e) + 1).reshape((-1,) + (1,) * (e.ndim - 1))
+        out[b0:b0 + len(e)] = powers * (prev + np.cumsum(e / powers, axis=0))
+        prev = out[b0 + len(e) - 1]
+    return out
+
+
+def regime_path(rng, n_bars, switch_prob, n_regimes):
+    '''markov regime per bar, each regime lasts a geometric number of bars with mean 1 / switch_prob'''
+    if n_regimes == 1 or switch_prob <= 0:
+        return np.zeros(n_bars, dtype=np.int64)
+    run_lengths = rng.geometric(switch_prob, size=int(n_bars * switch_prob * 2) + 16)
+    while run_lengths.sum() < n_bars:
+        run_lengths = np.concatenate([run_lengths, rng.geometric(switch_prob, size=len(run_lengths))])
+    # next regime is any other regime
+    steps = rng.integers(1, n_regimes, size=len(run_lengths))
+    regimes = np.cumsum(steps) % n_regimes
+    return np.repeat(regimes, run_lengths)[:n_bars]
+
+
+class SyntheticMarket:
+    '''
+    Seeded OHLCV generator for offline benchmarks and tests.
+    Single symbols are GBM with a shared market factor and optional poisson jumps (merton jump diffusion),
+    pairs are X from the same process and Y = ols_constant + ols_coeff * X + an OU spread with the given half life.
+    Volatility and drift follow a markov regime path shared by all symbols.
+    Everything is deterministic in seed, and each symbol only depends on its own index.
+    '''
+
+    def __init__(self, n_bars, interval='1h', start=SYNTH_START, seed=0,
+                 annual_vol=0.8, annual_drift=0.0, market_weight=0.6,
+                 jump_intensity=0.0, jump_mean=0.0, jump_std=0.05,
+                 regime_vol_mult=(1.0,), regime_drift=(0.0,), regime_switch_prob=0.0):
+        self.n_bars = int(n_bars)
+        self.interval = interval
+        self.start = pd.Timestamp(start)
+        self.seed = seed
+        self.bar_years = bar_timedelta(interval) / pd.Timedelta(days=BARS_PER_YEAR_1D)
+        self.bar_vol = annual_vol * np.sqrt(self.bar_years)
+        self.bar_drift = annual_drift * self.bar_years
+        self.market_weight = market_weight
+        self.jump_intensity = jump_intensity * self.bar_years  # jumps per year -> per bar
+        self.jump_mean = jump_mean
+        self.jump_std = jump_std
+
+        regimes = regime_path(self._rng(REGIME_STREAM), self.n_bars, regime_switch_prob, len(regime_vol_mult))
+        self.regimes = regimes
+        self.vol_mult = np.asarray(regime_vol_mult, dtype=np.float64)[regimes]
+        self.regime_drift = (np.asarray(regime_drift, dtype=np.float64) * self.bar_years)[regimes % len(regime_drift)]
+        self.market_shocks = self._rng(MARKET_STREAM).standard_normal(self.n_bars)
+
+    def _rng(self, stream, index=0):
+        return np.random.default_rng([self.seed, stream, index])
+
+    def dates(self):
+        return pd.date_range(self.start, periods=self.n_bars, freq=bar_timedelta(self.interval))
+
+    def _log_returns(self, rng):
+        idio = rng.standard_normal(self.n_bars)
+        shocks = np.sqrt(self.market_weight) * self.market_shocks + np.sqrt(1 - self.market_weight) * idio
+        bar_vol = self.bar_vol * self.vol_mult
+        returns = self.bar_drift + self.regime_drift - 0.5 * bar_vol ** 2 + bar_vol * shocks
+        if self.jump_intensity > 0:
+            num_jumps = rng.poisson(self.jump_intensity, self.n_bars)
+            has_jump = num_jumps > 0
+            returns[has_jump] += rng.normal(self.jump_mean * num_jumps[has_jump],
+                                            self.jump_std * np.sqrt(num_jumps[has_jump]))
+        return returns
+
+    def single_close(self, index):
+        '''close path of the index-th single symbol'''
+        rng = self._rng(SINGLE_STREAM, index)
+        start_price = np.exp(rng.uniform(np.log(0.01), np.log(50000)))
+        return start_price * np.exp(np.cumsum(self._log_returns(rng)))
+
+    def pair_close(self, index, half_life_bars=48, spread_vol=0.02):
+        '''
+        (y_close, x_close, ols_coeff, ols_constant) of the index-th cointegrated pair.
+        The spread is stationary with std spread_vol * mean Y price and decays to half in half_life_bars.
+        '''
+        rng = self._rng(PAIR_STREAM, index)
+        x_start = np.exp(rng.uniform(np.log(0.1), np.log(1000)))
+        x_close = x_start * np.exp(np.cumsum(self._log_returns(rng)))
+        y_level = np.exp(rng.uniform(np.log(0.1), np.log(1000)))
+        ols_coeff = 0.8 * y_level / x_start
+        ols_constant = 0.2 * y_level
+        phi = 0.5 ** (1 / half_life_bars)
+        shock_std = spread_vol * y_level * np.sqrt(1 - phi ** 2)
+        spread = ar1(rng.standard_normal(self.n_bars) * shock_std, phi)
+        y_close = np.maximum(ols_constant + ols_coeff * x_close + spread, 0.05 * ols_constant)
+        return y_close, x_close, ols_coeff, ols_constant
+
+    def candles(self, close, rng):
+        '''open/high/low/volume around a close path, open is the previous close as on binance'''
+        bar_vol = self.bar_vol * self.vol_mult
+        open_ = np.concatenate([[close[0]], close[:-1]])
+        wick_up = np.exp(np.abs(rng.standard_normal(len(close))) * 0.5 * bar_vol)
+        wick_down = np.exp(-np.abs(rng.standard_normal(len(close))) * 0.5 * bar_vol)
+        high = np.maximum(open_, close) * wick_up
+        low = np.minimum(open_, close) * wick_down
+        abs_return = np.abs(np.log(close / open_))
+        quote_volume = np.exp(rng.normal(np.log(1e6 * self.bar_years * BARS_PER_YEAR_1D), 0.5, len(close)))
+        volume = quote_volume * (1 + abs_return / bar_vol) / close
+        return pd.DataFrame({'date': self.dates(), 'open': open_, 'high': high, 'low': low,
+                             'close': close, 'volume': volume})
+
+    def iter_symbol_frames(self, n_singles, n_pairs=0, half_life_bars=48, spread_vol=0.02):
+        '''(symbol, candle df) one symbol at a time, so memory is one symbol's history not the whole panel'''
+        for i in range(n_singles):
+            yield f'SYN{i:04d}', self.candles(self.single_close(i), self._rng(SINGLE_STREAM, 10 ** 6 + i))
+        for i in range(n_pairs):
+            y_close, x_close, _, _ = self.pair_close(i, half_life_bars, spread_vol)
+            rng = self._rng(PAIR_STREAM, 10 ** 6 + i)
+            yield f'PAIRY{i:04d}', self.candles(y_close, rng)
+            yield f'PAIRX{i:04d}', self.candles(x_close, rng)
+
+    def pairs_df(self, n_pairs, half_life_bars=48, spread_vol=0.02):
+        '''true hedge ratios of the generated pairs, named like coin_signal'''
+        rows = []
+        for i in range(n_pairs):
+            _, _, ols_coeff, ols_constant = self.pair_close(i, half_life_bars, spread_vol)
+            rows.append({'symbol1': f'PAIRY{i:04d}', 'symbol2': f'PAIRX{i:04d}',
+                         'ols_coeff': ols_coeff, 'ols_constant': ols_constant, 'half_life_bars': half_life_bars})
+        return pd.DataFrame(rows)
+
+    def panel(self, n_singles, n_pairs=0, **pair_kwargs):
+        '''long df in the binance_coin_*_historical_price schema, for small panels'''
+        frames = []
+        for symbol, df in self.iter_symbol_frames(n_singles, n_pairs, **pair_kwargs):
+            df.insert(0, 'symbol', symbol)
+            frames.append(df)
+        return pd.concat(frames, ignore_index=True)[DB_COLUMNS]
+
+
+def write_db_csv(symbol_frames, file_path):
+    '''one csv in DB_COLUMNS order for COPY ... FROM STDIN WITH CSV HEADER, written a symbol at a time'''
+    num_rows = 0
+    with open(file_path, 'w') as file:
+        file.write(','.join(DB_COLUMNS) + '\n')
+        for symbol, df in symbol_frames:
+            df = df.assign(symbol=symbol, date=df['date'].dt.strftime('%Y-%m-%d %H:%M'))[DB_COLUMNS]
+            df.to_csv(file, header=False, index=False)
+            num_rows += len(df)
+    logging.info(f"Wrote {num_rows} synthetic candles to {file_path}")
+    return num_rows
+
+
+def copy_db_csv(conn, table_name, file_path):
+    '''bulk load a write_db_csv file into an existing binance_coin_*_historical_price style table'''
+    cursor = conn.cursor()
+    try:
+        with open(file_path, 'r') as file:
+            cursor.copy_expert(f"COPY {table_name} ({', '.join(DB_COLUMNS)}) FROM STDIN WITH CSV HEADER", file)
+        conn.commit()
+        logging.info(f"Copied {file_path} into {table_name}")
+    except Exception as e:
+        logging.error(f"Failed to copy {file_path} into {table_name}: {e}")
+        conn.rollback()
+    finally:
+        cursor.close()
+
+
+def write_kline_json(symbol_frames, folder):
+    '''raw binance kline json per symbol, the layout binance_OHLC_db_refresher.insert_data reads'''
+    os.makedirs(folder, exist_ok=True)
+    for symbol, df in symbol_frames:
+        open_ms = df['date'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+        klines = [[int(t), str(o), str(h), str(l), str(c), str(v)]
+                  for t, o, h, l, c, v in zip(open_ms, df['open'], df['high'], df['low'], df['close'], df['volume'])]
+        with open(os.path.join(folder, f'{symbol}.json'), 'w') as file:
+            json.dump(klines, file)
+
+
+def write_candle_cache(symbol_frames, folder, interval):
+    '''CandleCache files ({symbol}USDT_{interval}.csv), e.g. for market_data_daemon.py --replay'''
+    os.makedirs(folder, exist_ok=True)
+    for symbol, df in symbol_frames:
+        df[CANDLE_COLUMNS].to_csv(os.path.join(folder, f'{symbol}USDT_{interval}.csv'), index=False)
@@ -0,0 +1,249 @@
+import os
+import glob
+import json
+import fcntl
+import logging
+import threading
+import pandas as pd
+from utils.trading_utils import executed_order_row, LATEST_TRADES_COLUMNS
+from utils.metrics import NULL_METRICS
+
+WRITE_FLUSH_SECONDS = 2.0
+WRITE_BATCH_ROWS = 1000
+FILL = 'fill'
+DECISIONS = 'decisions'
+
+
+class TradeWriter:
+    '''
+    Write-behind persistence for the trading loop: fills go to latest_trades, strategy decisions to the strat csv.
+    record_* appends the entries to a local json-lines journal and fsyncs it before returning, so nothing is lost
+    when the process dies; a background thread then writes them in batches, multi-row inserts on one connection
+    and one csv append per file. The journal is emptied once everything in it is written, entries still in it
+    on the next start are written then.
+    A second process (e.g. an overlapping cron tick) gets a journal of its own, <name>.<pid>.jsonl, and
+    journals whose process is gone are taken over by the next writer that starts.
+    Fills are written exactly once, a repeated insert is dropped by ON CONFLICT. Decisions are at-least-once:
+    they are marked written (<journal>.decisions.done) right after their csv append, before the fills, and only
+    a crash between the append and that marker appends the same rows again on recovery.
+    '''
+
+    def __init__(self, connect, journal_file, flush_seconds=WRITE_FLUSH_SECONDS, batch_rows=WRITE_BATCH_ROWS,
+                 metrics=None):
+        self.connect = connect  # () -> db connection, called again after a failed flush
+        self.base_journal_file = journal_file
+        self.flush_seconds = flush_seconds
+        self.batch_rows = batch_rows
+        self.metrics = metrics or NULL_METRICS
+        self.conn = None
+        self.lock = threading.Lock()        # journal and pending
+        self.flush_lock = threading.Lock()  # one flush at a time
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.pending = []  # journal entries not written yet, in seq order
+        self.seq = 0
+
+        os.makedirs(os.path.dirname(journal_file) or '.', exist_ok=True)
+        self.journal = self._open_journal()
+        self._recover()
+        self.thread = threading.Thread(target=self._run, name='trade-writer', daemon=True)
+        self.thread.start()
+
+    def _lock(self, path):
+        '''the journal at path opened for append and locked, None if another process holds it'''
+        journal = open(path, 'a')
+        try:
+            fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            journal.close()
+            return None
+        return journal
+
+    def _open_journal(self):
+        journal = self._lock(self.base_journal_file)
+        if journal is None:
+            stem, ext = os.path.splitext(self.base_journal_file)
+            logging.warning(f"{self.base_journal_file} is in use by another process, journaling to a file of our own")
+            journal = self._lock(f'{stem}.{os.getpid()}{ext}')
+        self.journal_file = journal.name
+        self.done_file = self.journal_file + '.done'
+        return journal
+
+    @staticmethod
+    def _read_marker(path):
+        if not os.path.exists(path):
+            return 0
+        with open(path) as file:
+            return int(file.read().strip() or 0)
+
+    @staticmethod
+    def _write_marker(path, seq):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(str(seq))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _remove_markers(path):
+        for marker in (path + '.done', path + '.decisions.done'):
+            if os.path.exists(marker):
+                os.remove(marker)
+
+    def _read_journal(self, path):
+        '''(entries after the done marker, decisions already appended left out, highest seq) of one journal'''
+        done_seq = self._read_marker(path + '.done')
+        decisions_done_seq = self._read_marker(path + '.decisions.done')
+        entries, max_seq = [], done_seq
+        with open(path) as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn last line of a crash mid write, it was never acknowledged
+                    logging.warning(f"Skipping unreadable line in {path}")
+                    continue
+                max_seq = max(max_seq, entry['seq'])
+                if entry['seq'] > done_seq and not (entry['kind'] == DECISIONS and entry['seq'] <= decisions_done_seq):
+                    entries.append(entry)
+        return entries, max_seq
+
+    def _recover(self):
+        self.pending, self.seq = self._read_journal(self.journal_file)
+        # journals of processes that died before writing everything
+        stem, ext = os.path.splitext(self.base_journal_file)
+        for path in [self.base_journal_file] + sorted(glob.glob(f'{stem}.*{ext}')):
+            if path == self.journal_file or not os.path.exists(path):
+                continue
+            journal = self._lock(path)
+            if journal is None:
+                continue
+            entries, _ = self._read_journal(path)
+            for entry in entries:
+                entry.pop('seq')
+            if entries:
+                self._append(entries)
+            os.remove(path)
+            self._remove_markers(path)
+            journal.close()
+            logging.info(f"Took over {len(entries)} unwritten entries from {path}")
+        if self.pending:
+            logging.info(f"{len(self.pending)} unwritten entries in {self.journal_file}")
+            self.wakeup.set()
+
+    def _append(self, entries):
+        '''journal first (fsynced), then queue'''
+        with self.lock:
+            lines = []
+            for entry in entries:
+                self.seq += 1
+                entry['seq'] = self.seq
+                lines.append(json.dumps(entry, default=str))
+            self.journal.write('\n'.join(lines) + '\n')
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            self.pending.extend(entries)
+            if len(self.pending) >= self.batch_rows:
+                self.wakeup.set()
+
+    def record_fills(self, orders):
+        '''filled orders (binance order responses) for latest_trades'''
+        self._append([{'kind': FILL, 'row': executed_order_row(order)} for order in orders])
+
+    def record_decisions(self, df, file_path):
+        '''strategy decisions of one scan, appended to the csv at file_path'''
+        self._append([{'kind': DECISIONS, 'file': file_path, 'columns': list(df.columns),
+                       'rows': df.astype(str).values.tolist()}])
+
+    def _get_conn(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = self.connect()
+            if self.conn is None:
+                raise ConnectionError('no db connection for the trade writer')
+        return self.conn
+
+    def _insert_fills(self, rows):
+        conn = self._get_conn()
+        cursor = conn.cursor()
+        try:
+            placeholders = '(' + ', '.join(['%s'] * len(LATEST_TRADES_COLUMNS)) + ')'
+            for start in range(0, len(rows), self.batch_rows):
+                chunk = rows[start:start + self.batch_rows]
+                cursor.execute(
+                    f"INSERT INTO latest_trades ({', '.join(LATEST_TRADES_COLUMNS)}) "
+                    f"VALUES {', '.join([placeholders] * len(chunk))} "
+                    f"ON CONFLICT (date, symbol) DO NOTHING",
+                    [value for row in chunk for value in row])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            self.conn = None
+            raise
+        finally:
+            cursor.close()
+
+    def flush(self):
+        '''write everything queued so far; on failure it stays queued (and journaled) for the next flush'''
+        with self.flush_lock:
+            with self.lock:
+                batch = list(self.pending)
+            if not batch:
+                return 0
+            with self.metrics.stage('trade flush'):
+                # decisions first and marked at once, a csv append is not repeatable the way an insert is
+                decision_entries = [entry for entry in batch if entry['kind'] == DECISIONS]
+                decisions = {}
+                for entry in decision_entries:
+                    decisions.setdefault((entry['file'], tuple(entry['columns'])), []).extend(entry['rows'])
+                for (file_path, columns), rows in decisions.items():
+                    pd.DataFrame(rows, columns=list(columns)).to_csv(
+                        file_path, mode='a', header=not os.path.exists(file_path), index=False)
+                if decision_entries:
+                    self._write_marker(self.journal_file + '.decisions.done', decision_entries[-1]['seq'])
+
+                # ON CONFLICT makes a repeated insert after a crash harmless
+                fills = [tuple(entry['row']) for entry in batch if entry['kind'] == FILL]
+                try:
+                    if fills:
+                        self._insert_fills(fills)
+                except Exception:
+                    with self.lock:
+                        # the decisions are written, only the fills wait for the next flush
+                        self.pending[:len(batch)] = [entry for entry in batch if entry['kind'] != DECISIONS]
+                    raise
+
+            with self.lock:
+                del self.pending[:len(batch)]
+                self._write_marker(self.done_file, batch[-1]['seq'])
+                if not self.pending:
+                    # everything in the journal is written, start it over
+                    self.journal.truncate(0)
+                    os.fsync(self.journal.fileno())
+            logging.debug(f"Trade writer flushed {len(fills)} fills and {len(batch) - len(fills)} decision batches")
+            return len(batch)
+
+    def _run(self):
+        while not self.stopping:
+            self.wakeup.wait(self.flush_seconds)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.warning(f"Trade writer flush failed, retrying in {self.flush_seconds}s: {e}")
+
+    def close(self):
+        '''stop the background thread and write what is left'''
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join()
+        try:
+            self.flush()
+        except Exception as e:
+            logging.error(f"Trade writer could not flush {len(self.pending)} entries, kept in {self.journal_file}: {e}")
+        if self.journal_file != self.base_journal_file and not self.pending:
+            os.remove(self.journal_file)
+            self._remove_markers(self.journal_file)
+        self.journal.close()
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
@@ -1,25 +1,14 @@
+import os
 import pandas as pd 
 from datetime import datetime, timezone
 from binance.client import Client 
 from binance.enums import *
 import psycopg2
 from psycopg2 import OperationalError
+from utils.candle_cache import CandleCache
+from utils.exchange_filters import SymbolFilterCache
+from utils.bot_settings import *
     
-# pairs selection from sql criteria
-MIN_RECENT_COINT = 0.75
-MIN_R_SQUARED = 0.7
-MIN_POTENTIAL_WIN_PCT = 0.01
-
-# trade params
-TOTAL_USDT_PER_TRADE = 50
-BB_BAND_WINDOW = 20 
-BB_SIGNAL_STD_MULT = 1.8
-BB_STOPLOSS_STD_MULT = 3.5
-
-current_date = datetime.now().strftime("%Y-%m-%d")
-strat_csv_file = f'/home/ec2-user/binance_pair_trader/data/strat_df_{current_date}.csv'
-order_csv_file = '/home/ec2-user/binance_pair_trader/data/order_df.csv'
-
 def connect_to_db(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD):
     try:
         conn = psycopg2.connect(
@@ -56,15 +45,17 @@ def create_latest_trades_table(conn):
     finally:
         cursor.close()
 
-def send_executed_orders_to_sql(conn, order):
-      cursor = conn.cursor() 
+LATEST_TRADES_COLUMNS = ['date', 'symbol', 'action', 'dollar_amt', 'price', 'amt']
+
+def executed_order_row(order):
+      '''latest_trades row of one filled order, in LATEST_TRADES_COLUMNS order'''
       date = datetime.fromtimestamp(order['transactTime'] / 1000).strftime('%Y-%m-%d %H:%M:%S')
-      symbol = order['symbol']
-      action = order['side']
       amt = float(order['executedQty'])
       dollar_amt = float(order['cummulativeQuoteQty'])
-      price = dollar_amt/amt
-      
+      return (date, order['symbol'], order['side'], dollar_amt, dollar_amt/amt, amt)
+
+def send_executed_orders_to_sql(conn, order):
+      cursor = conn.cursor() 
       cursor.execute(
          """
          INSERT INTO latest_trades (date, symbol, action, dollar_amt, price, amt) 
@@ -72,7 +63,7 @@ def send_executed_orders_to_sql(conn, order):
          ON CONFLICT (date, symbol)
             DO NOTHING
          """,
-         (date, symbol, action, dollar_amt, price, amt)
+         executed_order_row(order)
       )
       conn.commit()
       print("Order details written to SQL table latest_trades.")
@@ -98,37 +89,16 @@ def candle_transformation(candle):
 
       return output_df
 
+candle_cache = CandleCache(candle_cache_folder, candle_transformation)
+
 def get_bn_data(client, symbol): 
-      minute_candles = client.get_historical_klines(symbol, Client.KLINE_INTERVAL_2HOUR, "720 day ago UTC")
-      minute_data = candle_transformation(minute_candles)
- 
-      daily_candle = client.get_historical_klines(symbol, Client.KLINE_INTERVAL_1DAY, "800 day ago UTC")
-      daily_data = candle_transformation(daily_candle)
+      # served from the local candle cache, only bars newer than the cached ones are downloaded
+      minute_data = candle_cache.get_candles(client, symbol, Client.KLINE_INTERVAL_2HOUR, MINUTE_LOOKBACK_DAYS)
+      daily_data = candle_cache.get_candles(client, symbol, Client.KLINE_INTERVAL_1DAY, DAILY_LOOKBACK_DAYS)
       return minute_data, daily_data
 
-def get_tick_size(curr_price_Y, curr_price_X):
-   if curr_price_Y < 5:
-      y_tick_size = 1
-   elif curr_price_Y >=5 and curr_price_Y < 100:
-      y_tick_size = 0.01
-   elif curr_price_Y >=100 and curr_price_Y < 2000:
-      y_tick_size = 0.001  
-   elif curr_price_Y >=1000 and curr_price_Y < 10000:
-      y_tick_size = 0.0001 
-   elif curr_price_Y >=10000:
-      y_tick_size = 0.00001 
-
-   if curr_price_X < 5:
-      x_tick_size = 1
-   elif curr_price_X >=5 and curr_price_X < 100:
-      x_tick_size = 0.01
-   elif curr_price_X >=100 and curr_price_X < 2000:
-      x_tick_size = 0.001  
-   elif curr_price_X >=1000 and curr_price_X < 10000:
-      x_tick_size = 0.0001 
-   elif curr_price_X >=10000:
-      x_tick_size = 0.00001 
-   return y_tick_size, x_tick_size
+# LOT_SIZE/PRICE_FILTER/NOTIONAL of every symbol, refreshed from exchangeInfo every few hours
+symbol_filters = SymbolFilterCache(exchange_info_file)
 
 def pairs_order_to_pd_df(pair_trade_status, latest_min, ols_coeff, ols_constant, long_order, short_order, short_loan, symbol_Y, symbol_X):
    